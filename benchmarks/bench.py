@@ -0,0 +1,380 @@
+"""Time Possum's hot paths against generated SAM projects and write the
+results as JSON, optionally comparing them with an earlier run.
+
+    $ python benchmarks/bench.py -o results.json
+    $ python benchmarks/bench.py --compare results.json
+
+Full ``possum package`` runs need ``moto`` for an in-process S3 stand-in,
+or ``--s3-endpoint-url`` pointing at a running one.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from possum import __version__  # noqa: E402
+from possum.config import logger  # noqa: E402
+from possum.installers import INSTALLERS, get_installer  # noqa: E402
+from possum.packages import (  # noqa: E402
+    collect_package_entries,
+    create_lambda_package
+)
+from possum.reqs import parse_requirements, write_requirements  # noqa: E402
+from possum.template import SAMTemplate  # noqa: E402
+from possum.utils.general import hash_directory  # noqa: E402
+from possum.utils.hashing import hash_tree  # noqa: E402
+
+from synthetic import (  # noqa: E402
+    generate_index,
+    generate_project,
+    StubInstaller
+)
+
+BENCHMARKS = list()
+
+
+def benchmark(name):
+    """Register a benchmark. Benchmarks take the ``Workspace`` and return a
+    callable to time (with an optional setup callable run before each
+    repetition).
+    """
+    def register(func):
+        BENCHMARKS.append((name, func))
+        return func
+    return register
+
+
+class Workspace:
+    """A generated project and dependency index shared by the benchmarks."""
+    def __init__(self, args):
+        self.args = args
+        self.root = tempfile.mkdtemp(prefix='possum-bench-')
+        self.index_dir = os.path.join(self.root, 'index')
+        self.project_dir = os.path.join(self.root, 'project')
+
+        self.index_names = generate_index(
+            self.index_dir, args.dependency_pool, args.dependency_files,
+            args.file_size, args.seed)
+        self.template_path = generate_project(
+            self.project_dir, self.index_names, args.functions, args.files,
+            args.file_size, args.dependencies, args.seed)
+
+        functions_dir = os.path.join(self.project_dir, 'functions')
+        self.function_dirs = [
+            os.path.join(functions_dir, i)
+            for i in sorted(os.listdir(functions_dir))
+        ]
+
+        StubInstaller.index_dir = self.index_dir
+        INSTALLERS[StubInstaller.name] = StubInstaller
+
+        # Dependencies installed once for the packaging benchmarks
+        installer = get_installer(StubInstaller.name)
+        self.dependency_dirs = list()
+        for function_dir in self.function_dirs:
+            target = os.path.join(
+                self.root, 'installed', os.path.basename(function_dir))
+            os.makedirs(target)
+            installer.install(function_dir, target)
+            self.dependency_dirs.append(target)
+
+    def scratch_dir(self, name):
+        path = os.path.join(self.root, 'scratch', name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        return path
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+@benchmark('hash_tree (cold)')
+def bench_hash_tree_cold(workspace):
+    def run():
+        for path in workspace.function_dirs:
+            hash_tree(path)
+    return run
+
+
+@benchmark('hash_tree (unchanged)')
+def bench_hash_tree_warm(workspace):
+    manifests = [hash_tree(i)[1] for i in workspace.function_dirs]
+
+    def run():
+        for path, manifest in zip(workspace.function_dirs, manifests):
+            hash_tree(path, manifest)
+    return run
+
+
+@benchmark('hash_directory (legacy)')
+def bench_hash_directory(workspace):
+    def run():
+        for path in workspace.function_dirs:
+            hash_directory(path)
+    return run
+
+
+@benchmark('create_lambda_package')
+def bench_create_lambda_package(workspace):
+    def run():
+        artifact_directory = workspace.scratch_dir('artifacts')
+        for source_dir, dependency_dir in zip(workspace.function_dirs,
+                                              workspace.dependency_dirs):
+            create_lambda_package(
+                collect_package_entries([source_dir, dependency_dir]),
+                artifact_directory
+            )
+    return run
+
+
+@benchmark('SAMTemplate')
+def bench_template(workspace):
+    def run():
+        for _ in range(10):
+            SAMTemplate(workspace.template_path)
+    return run
+
+
+@benchmark('write_requirements')
+def bench_write_requirements(workspace):
+    pipfile_packages = {
+        i: {'pip': f'{i}==1.0.0'} for i in workspace.index_names
+    }
+
+    def run():
+        dest = workspace.scratch_dir('requirements')
+        for path in workspace.function_dirs:
+            write_requirements(
+                pipfile_packages, parse_requirements(path) or dict(), dest)
+    return run
+
+
+def _run_possum(workspace, home_dir, *arguments):
+    from possum import cli
+
+    cli.WORKING_DIR = workspace.project_dir
+    cli.USER_DIR = home_dir
+    cli.configure_logger = lambda: None
+
+    argv, cwd = sys.argv, os.getcwd()
+    sys.argv = [
+        'possum', 'package', 'possum-bench/artifacts',
+        '-t', workspace.template_path,
+        '-o', os.path.join(workspace.root, 'deployment.yaml'),
+        '--installer', StubInstaller.name,
+        '-j', str(workspace.args.jobs)
+    ] + list(arguments)
+
+    if workspace.args.s3_endpoint_url:
+        sys.argv += ['--s3-endpoint-url', workspace.args.s3_endpoint_url]
+
+    # The Possum file is named after the working directory
+    os.chdir(workspace.project_dir)
+    try:
+        cli.main()
+    except SystemExit as error:
+        if error.code:
+            raise RuntimeError(f'possum package exited with {error.code}')
+    finally:
+        sys.argv = argv
+        os.chdir(cwd)
+
+
+def _package_benchmark(workspace, clear_cache, *arguments):
+    home_dir = os.path.join(workspace.root, 'home')
+
+    def setup():
+        if clear_cache:
+            shutil.rmtree(home_dir, ignore_errors=True)
+        os.makedirs(home_dir, exist_ok=True)
+
+    def run():
+        _run_possum(workspace, home_dir, *arguments)
+
+    # Populate the state and dependency cache for the warm benchmarks
+    setup()
+    run()
+    return run, setup
+
+
+@benchmark('possum package (cold)')
+def bench_package_cold(workspace):
+    return _package_benchmark(workspace, True, '--clean')
+
+
+@benchmark('possum package (cached dependencies)')
+def bench_package_cached(workspace):
+    return _package_benchmark(workspace, False, '--clean')
+
+
+@benchmark('possum package (no changes)')
+def bench_package_unchanged(workspace):
+    return _package_benchmark(workspace, False)
+
+
+def time_benchmark(workspace, func, repeat):
+    prepared = func(workspace)
+    run, setup = prepared if isinstance(prepared, tuple) else (prepared, None)
+
+    timings = list()
+    for _ in range(repeat):
+        if setup:
+            setup()
+
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'runs': repeat,
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.mean(timings)
+    }
+
+
+def s3_stand_in(args):
+    """Return a context manager providing S3 for the full package runs."""
+    if args.s3_endpoint_url:
+        import contextlib
+        return contextlib.ExitStack()
+
+    try:
+        from moto import mock_aws
+    except ImportError:
+        from moto import mock_s3 as mock_aws
+
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    return mock_aws()
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f_obj:
+        baseline = json.load(f_obj)['results']
+
+    regressions = list()
+    print(f"\n{'Benchmark':<40}  {'Baseline':>10}  {'Current':>10}  Change")
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        before = baseline[name]['median']
+        change = (result['median'] - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+
+        print(f"{name:<40}  {before:>9.3f}s  {result['median']:>9.3f}s  "
+              f"{change:+7.1%}{flag}")
+
+    return regressions
+
+
+def arguments():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--functions', type=int, default=10,
+                        help='Functions in the project (default: 10).')
+    parser.add_argument('--files', type=int, default=50,
+                        help='Modules in each function (default: 50).')
+    parser.add_argument('--file-size', type=int, default=4096,
+                        help='Approximate size of each module in bytes '
+                             '(default: 4096).')
+    parser.add_argument('--dependencies', type=int, default=3,
+                        help='Packages required by each function '
+                             '(default: 3).')
+    parser.add_argument('--dependency-pool', type=int, default=10,
+                        help='Packages to pick dependencies from; fewer '
+                             'packages means more sharing (default: 10).')
+    parser.add_argument('--dependency-files', type=int, default=100,
+                        help='Modules in each dependency (default: 100).')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Times to run each benchmark (default: 3).')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="Value of 'possum package -j' (default: 1).")
+    parser.add_argument('-k', '--only', action='append', metavar='text',
+                        help='Only run benchmarks whose name contains text.')
+    parser.add_argument('--s3-endpoint-url', metavar='url',
+                        help='Use a running S3 stand-in instead of moto. '
+                             "The 'possum-bench' bucket must exist.")
+    parser.add_argument('-o', '--output', metavar='filename',
+                        help='Write the results as JSON to a file.')
+    parser.add_argument('--compare', metavar='filename',
+                        help='Compare the results with an earlier JSON file.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Slowdown reported as a regression by --compare '
+                             '(default: 0.1 for 10%%).')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help="Show Possum's output.")
+    return parser.parse_args()
+
+
+def main():
+    args = arguments()
+
+    if args.verbose:
+        from possum.config import configure_logger
+        configure_logger()
+    else:
+        logger.setLevel(logging.ERROR)
+
+    benchmarks = [
+        (name, func) for name, func in BENCHMARKS
+        if not args.only or any(i in name for i in args.only)
+    ]
+
+    print('Generating project...')
+    workspace = Workspace(args)
+    results = dict()
+
+    try:
+        with s3_stand_in(args):
+            if not args.s3_endpoint_url:
+                import boto3
+                boto3.client('s3').create_bucket(Bucket='possum-bench')
+
+            for name, func in benchmarks:
+                result = time_benchmark(workspace, func, args.repeat)
+                results[name] = result
+                print(f"{name:<40}  {result['median']:>9.3f}s  "
+                      f"(min {result['min']:.3f}s)")
+    finally:
+        workspace.cleanup()
+
+    output = {
+        'meta': {
+            'possum': __version__,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': int(time.time()),
+            'parameters': {
+                k: v for k, v in vars(args).items()
+                if k not in ('output', 'compare', 'only', 'verbose')
+            }
+        },
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f_obj:
+            json.dump(output, f_obj, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
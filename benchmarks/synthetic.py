@@ -0,0 +1,180 @@
+"""Generate synthetic SAM projects for benchmarking Possum, along with a
+local index of fake dependency packages and an installer that installs from
+it without touching the network.
+"""
+import os
+import random
+import shutil
+import time
+
+from possum.installers import Installer
+
+# Generated files are dated in the past so they fall outside the racy
+# modification time window used by Possum's change detection.
+FILE_AGE = 3600
+
+TEMPLATE_HEADER = '''\
+AWSTemplateFormatVersion: '2010-09-09'
+Transform: AWS::Serverless-2016-10-31
+Globals:
+  Function:
+    Runtime: python3.11
+    Handler: app.handler
+Resources:
+'''
+
+FUNCTION_TEMPLATE = '''\
+  Function{index:04d}:
+    Type: AWS::Serverless::Function
+    Properties:
+      CodeUri: functions/function{index:04d}
+'''
+
+
+def _write_module(path, size, rng):
+    lines = ['"""A generated module."""\n']
+    written = len(lines[0])
+    count = 0
+    while written < size:
+        line = f'VALUE_{count} = {rng.getrandbits(64)!r}  # ' \
+               f'{rng.choice(("alpha", "beta", "gamma", "delta"))}\n'
+        lines.append(line)
+        written += len(line)
+        count += 1
+
+    with open(path, 'w') as f_obj:
+        f_obj.write(''.join(lines))
+
+
+def _write_tree(root, files, file_size, rng, package=None):
+    """Write ``files`` modules below ``root`` spread over nested
+    directories, as an importable package if ``package`` is given.
+    """
+    if package:
+        root = os.path.join(root, package)
+
+    for i in range(files):
+        sub_dir = os.path.join(
+            root, *[f'sub{i % 5}', f'sub{i % 7}'][:i % 3])
+        os.makedirs(sub_dir, exist_ok=True)
+
+        if package:
+            init_path = os.path.join(sub_dir, '__init__.py')
+            if not os.path.exists(init_path):
+                open(init_path, 'w').close()
+
+        _write_module(
+            os.path.join(sub_dir, f'module{i:04d}.py'), file_size, rng)
+
+
+def _age_tree(root):
+    timestamp = time.time() - FILE_AGE
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            os.utime(os.path.join(dir_path, name), (timestamp, timestamp))
+
+
+def generate_index(index_dir, packages, files, file_size, seed=0):
+    """Write fake installed packages, one directory per package, ready to be
+    copied into a function's dependencies.
+
+    :param str index_dir: The directory to write the packages to
+    :param int packages: The number of packages
+    :param int files: The number of modules in each package
+    :param int file_size: The approximate size of each module in bytes
+    :param int seed: The seed for the generated contents
+
+    :returns: The names of the packages
+    :rtype: list
+    """
+    rng = random.Random(seed)
+    names = [f'synthpkg{i:03d}' for i in range(packages)]
+
+    for name in names:
+        package_dir = os.path.join(index_dir, name)
+        _write_tree(package_dir, files, file_size, rng, package=name)
+
+        dist_info = os.path.join(package_dir, f'{name}-1.0.0.dist-info')
+        os.makedirs(dist_info)
+        for meta_file, content in (
+                ('METADATA', f'Name: {name}\nVersion: 1.0.0\n'),
+                ('RECORD', ''),
+                ('INSTALLER', 'stub\n')):
+            with open(os.path.join(dist_info, meta_file), 'w') as f_obj:
+                f_obj.write(content)
+
+    _age_tree(index_dir)
+    return names
+
+
+def generate_project(project_dir, index_names, functions, files, file_size,
+                     dependencies, seed=0):
+    """Write a SAM project of Python functions. Each function has a handler,
+    ``files`` further modules and a ``requirements.txt`` naming
+    ``dependencies`` packages picked from the index.
+
+    :param str project_dir: The directory to write the project to
+    :param list index_names: Package names from ``generate_index``
+    :param int functions: The number of functions
+    :param int files: The number of modules in each function
+    :param int file_size: The approximate size of each module in bytes
+    :param int dependencies: The number of packages each function requires
+    :param int seed: The seed for the generated contents
+
+    :returns: The path of the template
+    :rtype: str
+    """
+    rng = random.Random(seed)
+    template = [TEMPLATE_HEADER]
+
+    for index in range(functions):
+        function_dir = os.path.join(
+            project_dir, 'functions', f'function{index:04d}')
+        os.makedirs(function_dir)
+
+        with open(os.path.join(function_dir, 'app.py'), 'w') as f_obj:
+            f_obj.write('def handler(event, context):\n    return event\n')
+
+        _write_tree(function_dir, files, file_size, rng)
+
+        required = sorted(rng.sample(
+            index_names, min(dependencies, len(index_names))))
+        if required:
+            with open(os.path.join(function_dir, 'requirements.txt'),
+                      'w') as f_obj:
+                f_obj.write(''.join(f'{i}==1.0.0\n' for i in required))
+
+        template.append(FUNCTION_TEMPLATE.format(index=index))
+
+    template_path = os.path.join(project_dir, 'template.yaml')
+    with open(template_path, 'w') as f_obj:
+        f_obj.write(''.join(template))
+
+    _age_tree(project_dir)
+    return template_path
+
+
+class StubInstaller(Installer):
+    """Installs requirements by copying packages from a local index written
+    by ``generate_index``. Set ``index_dir`` before use.
+    """
+    name = 'stub'
+    index_dir = None
+
+    def install(self, project_dir, target_dir):
+        requirements_file = os.path.join(project_dir, 'requirements.txt')
+        if not os.path.isfile(requirements_file):
+            return
+
+        with open(requirements_file) as f_obj:
+            names = [
+                i.split('==')[0].strip() for i in f_obj if i.strip()
+            ]
+
+        for name in names:
+            package_dir = os.path.join(self.index_dir, name)
+            for entry in os.listdir(package_dir):
+                shutil.copytree(
+                    os.path.join(package_dir, entry),
+                    os.path.join(target_dir, entry)
+                )
@@ -0,0 +1,328 @@
+import concurrent.futures
+import os
+import shutil
+import signal
+import sys
+
+from possum.bytecode import (
+    compile_package_entries,
+    get_runtime_interpreter,
+    get_runtime_version,
+    FUNCTION_MOUNT_DIR,
+    LAYER_MOUNT_DIR,
+    MIN_RUNTIME_VERSION
+)
+from possum.config import logger, configure_logger
+from possum.installers import get_installer
+from possum.packages import (
+    ArtifactUploader,
+    collect_package_entries,
+    create_lambda_package,
+    stream_lambda_package
+)
+from possum.slim import slim_package_entries
+from possum.trace import tracer
+from possum.utils import (
+    DependencyCache,
+    get_requirements_files,
+    get_unpinned_reason
+)
+
+__all__ = [
+    'BuildJob',
+    'build_lambda_function',
+    'build_lambda_functions',
+    'start_build_workers'
+]
+
+# The directory of a layer that Lambda adds to the Python path
+LAYER_PACKAGE_DIR = 'python'
+
+
+class BuildJob:
+    """Everything needed to build a single Lambda function's artifact.
+
+    Build jobs are handed to worker processes, so every value must be
+    picklable and no job may depend on the state of the parent process (such
+    as the current working directory).
+
+    When ``upload_options`` (keyword arguments for an ``ArtifactUploader``)
+    are given the artifact is streamed straight to S3 instead of being
+    written to ``artifact_directory``. ``archive_options`` are passed on to
+    ``write_lambda_archive``, and ``slim_options`` to
+    ``slim_package_entries`` (slimming is skipped when they are ``None``).
+    With ``precompile`` the package's Python files are compiled to bytecode
+    for the function's runtime. With ``trace`` a worker process records the
+    build's phases and returns them to the parent. ``architecture`` is the
+    function's Lambda architecture ('x86_64' or 'arm64').
+
+    Without ``bundle_dependencies`` only the function's source is packaged
+    (its dependencies are provided by a layer). A ``layer`` job packages only
+    the dependencies of ``source_dir``, below the layer's ``python/``
+    directory.
+    """
+    def __init__(self, logical_id, source_dir, build_dir, artifact_directory,
+                 runtime=None, installer='pip', installer_options=None,
+                 dependency_cache_dir=None, upload_options=None,
+                 archive_options=None, slim_options=None, precompile=False,
+                 trace=False, architecture='x86_64', bundle_dependencies=True,
+                 layer=False):
+        self.logical_id = logical_id
+        self.source_dir = source_dir
+        self.build_dir = build_dir
+        self.artifact_directory = artifact_directory
+        self.runtime = runtime
+        self.architecture = architecture
+        self.installer = installer
+        self.installer_options = installer_options or dict()
+        self.dependency_cache_dir = dependency_cache_dir
+        self.upload_options = upload_options
+        self.archive_options = archive_options or dict()
+        self.slim_options = slim_options
+        self.precompile = precompile
+        self.trace = trace
+        self.bundle_dependencies = bundle_dependencies
+        self.layer = layer
+
+
+def install_dependencies(job):
+    """Install a function's external packages. When a dependency cache is
+    configured, a cached copy of an identical set of dependencies is used
+    instead of reinstalling them. Dependencies that are not pinned are always
+    installed, so new releases are picked up.
+
+    :param BuildJob job: The function being built
+
+    :returns: The directory containing the installed packages
+    :rtype: str
+    """
+    func = job.logical_id
+    installer = get_installer(job.installer, **job.installer_options)
+
+    cache = None
+    unpinned_reason = get_unpinned_reason(job.source_dir)
+    if job.dependency_cache_dir and unpinned_reason:
+        logger.info(f'{func}: Not caching dependencies: {unpinned_reason}')
+    elif job.dependency_cache_dir:
+        cache = DependencyCache(
+            job.dependency_cache_dir, job.runtime, installer.name,
+            job.architecture)
+        cache_key = cache.get_key(job.source_dir)
+
+        if cache.contains(cache_key):
+            logger.info(f'{func}: Using cached dependencies '
+                        f'({cache_key[:12]})...')
+            return cache.path(cache_key)
+
+    logger.info(f'{func}: Installing requirements with {installer.name}...')
+
+    if cache:
+        dependencies_dir = cache.staging_dir()
+    else:
+        dependencies_dir = os.path.join(job.build_dir, 'dependencies')
+        os.makedirs(dependencies_dir)
+        logger.info(f'{func}: Working dir: {job.build_dir}')
+
+    try:
+        with tracer.span('install', function=func,
+                         installer=installer.name):
+            installer.install(job.source_dir, dependencies_dir)
+    except Exception:
+        if cache:
+            shutil.rmtree(dependencies_dir, ignore_errors=True)
+        raise
+
+    if installer.fallbacks:
+        logger.warning(f"{func}: No compatible wheels for "
+                       f"{', '.join(installer.fallbacks)}; built in a "
+                       "container instead")
+
+    if cache:
+        cache.commit(cache_key, dependencies_dir)
+        return cache.path(cache_key)
+
+    return dependencies_dir
+
+
+def precompile_entries(job, entries):
+    """Add bytecode compiled for the function's runtime to its package
+    entries. Compilation is skipped, with a warning, if the runtime is too
+    old for reproducible bytecode or no matching interpreter is installed.
+
+    :param BuildJob job: The function being built
+    :param list entries: The function's package entries
+
+    :rtype: list
+    """
+    func = job.logical_id
+    version = get_runtime_version(job.runtime)
+
+    if not version or version < MIN_RUNTIME_VERSION:
+        logger.warning(f"{func}: Bytecode can't be precompiled for runtime "
+                       f"'{job.runtime}'")
+        return entries
+
+    python_path = get_runtime_interpreter(job.runtime)
+    if not python_path:
+        logger.warning(f"{func}: No '{job.runtime}' interpreter could be "
+                       "found to precompile bytecode with")
+        return entries
+
+    # Layer entries are moved under LAYER_PACKAGE_DIR after compiling
+    if job.layer:
+        mount_dir = f'{LAYER_MOUNT_DIR}{LAYER_PACKAGE_DIR}/'
+    else:
+        mount_dir = FUNCTION_MOUNT_DIR
+
+    logger.info(f'{func}: Compiling bytecode for {job.runtime}...')
+    with tracer.span('precompile', function=func) as span:
+        entries, compiled = compile_package_entries(
+            entries, os.path.join(job.build_dir, 'bytecode'), python_path,
+            mount_dir)
+        span['files'] = compiled
+
+    logger.info(f'{func}: Compiled {compiled} Python files')
+    return entries
+
+
+def build_lambda_function(job):
+    """Install a function's external packages and zip them together with the
+    function's source into the artifact directory (or straight into S3).
+
+    Nothing is copied: the archive is assembled from the source directory
+    and then the dependencies directory, reading every file from where it
+    already lives. Where both contain the same path the source wins. The
+    entries are then slimmed and optionally precompiled before they are
+    zipped.
+
+    :param BuildJob job: The function to build
+
+    :returns: The created artifact
+    :rtype: LambdaArtifact
+    """
+    func = job.logical_id
+    package_dirs = list() if job.layer else [job.source_dir]
+
+    with tracer.span('build', function=func):
+        if (job.layer or job.bundle_dependencies) and \
+                get_requirements_files(job.source_dir):
+            with tracer.span('dependencies', function=func):
+                package_dirs.append(install_dependencies(job))
+
+        with tracer.span('collect entries', function=func) as span:
+            entries = collect_package_entries(package_dirs)
+            span['files'] = len(entries)
+
+        if job.slim_options is not None:
+            with tracer.span('slim', function=func) as span:
+                entries, report = slim_package_entries(
+                    entries,
+                    job.source_dir,
+                    os.path.join(job.build_dir, 'stripped'),
+                    **job.slim_options
+                )
+                span['bytes'] = report.saved_bytes
+            logger.info(f'{func}: Slimmed Lambda package: {report}')
+
+        if job.precompile:
+            entries = precompile_entries(job, entries)
+
+        if job.layer:
+            entries = [
+                (f'{LAYER_PACKAGE_DIR}/{arcname}', file_path, file_stat)
+                for arcname, file_path, file_stat in entries
+            ]
+
+        if job.upload_options:
+            logger.info(f'{func}: Streaming Lambda package to S3...')
+            with ArtifactUploader(**job.upload_options) as uploader:
+                return stream_lambda_package(
+                    entries, uploader, **job.archive_options)
+
+        logger.info(f'{func}: Creating Lambda package...')
+        return create_lambda_package(
+            entries, job.artifact_directory, **job.archive_options)
+
+
+def _build_in_worker(job):
+    # Worker processes started with 'spawn' do not inherit the CLI's handler
+    if not logger.handlers:
+        configure_logger()
+
+    if job.trace:
+        tracer.enable()
+
+    return build_lambda_function(job), tracer.pop_events()
+
+
+def _build_failed(job, error):
+    logger.error(f'{job.logical_id}: Build failed! Encountered: '
+                 f'{type(error).__name__}: {error}')
+    sys.exit(1)
+
+
+def _build_in_pool(executor, jobs, artifacts):
+    futures = {executor.submit(_build_in_worker, job): job for job in jobs}
+
+    for future in concurrent.futures.as_completed(futures):
+        job = futures[future]
+        try:
+            artifacts[job.logical_id], events = future.result()
+            tracer.add_events(events)
+        except Exception as error:
+            for pending in futures:
+                pending.cancel()
+            _build_failed(job, error)
+
+
+def start_build_workers(max_workers):
+    """Start a pool of worker processes to be reused by several calls to
+    ``build_lambda_functions``. The workers ignore keyboard interrupts so
+    only the parent process handles them.
+
+    :param int max_workers: The number of worker processes
+
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers)
+        # Workers are started on demand; start all of them now
+        concurrent.futures.wait(
+            [executor.submit(os.getpid) for _ in range(max_workers)])
+    finally:
+        signal.signal(signal.SIGINT, handler)
+
+    return executor
+
+
+def build_lambda_functions(jobs, max_workers=1, executor=None):
+    """Build a list of Lambda functions, optionally in parallel worker
+    processes. Results are always returned in the same order as the jobs
+    regardless of the order the builds completed in.
+
+    :param list jobs: ``BuildJob`` objects to run
+    :param int max_workers: The number of functions to build at once
+    :param concurrent.futures.ProcessPoolExecutor executor: A running pool
+        of worker processes to build in instead of starting one (optional)
+
+    :returns: Tuples of each job and its ``LambdaArtifact``
+    :rtype: list
+    """
+    artifacts = dict()
+
+    if (max_workers <= 1 and not executor) or len(jobs) <= 1:
+        for job in jobs:
+            try:
+                artifacts[job.logical_id] = build_lambda_function(job)
+            except Exception as error:
+                _build_failed(job, error)
+
+    elif executor:
+        _build_in_pool(executor, jobs, artifacts)
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers) as executor:
+            _build_in_pool(executor, jobs, artifacts)
+
+    return [(job, artifacts[job.logical_id]) for job in jobs]
@@ -0,0 +1,140 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+
+from possum.exc import PossumException
+
+__all__ = [
+    'FUNCTION_MOUNT_DIR',
+    'LAYER_MOUNT_DIR',
+    'MIN_RUNTIME_VERSION',
+    'get_runtime_version',
+    'get_runtime_interpreter',
+    'compile_package_entries'
+]
+
+# Run by the target runtime's interpreter so the bytecode and the
+# '__pycache__' tag match the Lambda runtime rather than the interpreter
+# running Possum. Reads ``[arcname, path]`` pairs from stdin and prints the
+# ``[arcname, path]`` pairs of the compiled files. Tracebacks name each file
+# by its path under the directory the package is mounted at.
+COMPILE_SCRIPT = '''\
+import importlib.util, json, os, py_compile, sys
+
+work_dir, mount_dir = sys.argv[1:3]
+compiled = []
+
+for arcname, path in json.load(sys.stdin):
+    cache_name = importlib.util.cache_from_source(arcname)
+    cfile = os.path.join(work_dir, *cache_name.split('/'))
+    try:
+        py_compile.compile(
+            path,
+            cfile=cfile,
+            dfile=mount_dir + arcname,
+            doraise=True,
+            invalidation_mode=py_compile.PycInvalidationMode.UNCHECKED_HASH
+        )
+    except (py_compile.PyCompileError, SyntaxError, ValueError):
+        continue
+    compiled.append([cache_name, cfile])
+
+json.dump(compiled, sys.stdout)
+'''
+
+# Where Lambda mounts a function's package and its layers
+FUNCTION_MOUNT_DIR = '/var/task/'
+LAYER_MOUNT_DIR = '/opt/'
+
+# Unchecked hash-based .pyc files were added in Python 3.7
+MIN_RUNTIME_VERSION = (3, 7)
+
+
+def get_runtime_version(runtime):
+    """Return the Python version of a Lambda runtime such as 'python3.11'.
+
+    :param str runtime: The Lambda runtime
+
+    :returns: The major and minor version, or ``None``
+    :rtype: tuple
+    """
+    match = re.match(r'python(\d+)\.(\d+)$', runtime or '')
+    if not match:
+        return None
+
+    return int(match.group(1)), int(match.group(2))
+
+
+def get_runtime_interpreter(runtime):
+    """Find a Python interpreter matching a Lambda runtime. The interpreter
+    running Possum is used if it matches, otherwise a ``python3.X``
+    executable is looked up on the PATH.
+
+    :param str runtime: The Lambda runtime
+
+    :returns: The path to the interpreter, or ``None``
+    :rtype: str
+    """
+    version = get_runtime_version(runtime)
+    if not version:
+        return None
+
+    if sys.version_info[:2] == version:
+        return sys.executable
+
+    return shutil.which(f'python{version[0]}.{version[1]}')
+
+
+def compile_package_entries(entries, work_dir, python_path,
+                            mount_dir=FUNCTION_MOUNT_DIR):
+    """Compile the Python source files in a list of package entries to
+    bytecode and add the compiled files to the entries.
+
+    Files are compiled as unchecked hash-based ``.pyc`` files: they do not
+    record the source's modification time, so identical sources always
+    produce identical files and reproducible archives are unaffected.
+    Lambda never rewrites them as the package is read-only. Files that fail
+    to compile are left as source only.
+
+    :param list entries: Entries from ``collect_package_entries``
+    :param str work_dir: A directory to write the compiled files to
+    :param str python_path: An interpreter matching the target runtime
+    :param str mount_dir: The directory the entries are found under at
+        runtime, recorded as the source path of each compiled file
+
+    :returns: The updated entries and the number of files compiled
+    :rtype: tuple
+    """
+    sources = [
+        [arcname, file_path] for arcname, file_path, _ in entries
+        if arcname.endswith('.py')
+    ]
+    if not sources:
+        return entries, 0
+
+    os.makedirs(work_dir, exist_ok=True)
+
+    p = subprocess.run(
+        [python_path, '-c', COMPILE_SCRIPT, work_dir, mount_dir],
+        input=json.dumps(sources),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if p.returncode != 0:
+        raise PossumException(
+            f'Unable to compile bytecode with {python_path}: '
+            f'{p.stderr.strip()}')
+
+    compiled = json.loads(p.stdout)
+
+    package_entries = {i[0]: i for i in entries}
+    for arcname, file_path in compiled:
+        package_entries[arcname] = (arcname, file_path, os.stat(file_path))
+
+    return [package_entries[i] for i in sorted(package_entries)], \
+        len(compiled)
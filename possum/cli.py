@@ -1,32 +1,84 @@
 import argparse
 import io
+import json
 import os
 import shutil
 import sys
 import tempfile
 
-from ruamel.yaml import scanner, YAML
+from ruamel.yaml import YAML
 
 from possum import __version__
+from possum.build import (
+    BuildJob,
+    build_lambda_functions,
+    start_build_workers
+)
+from possum.bytecode import get_runtime_interpreter
 from possum.config import logger, configure_logger
-from possum.exc import PipenvPathNotFound
+from possum.exc import (
+    PipenvPathNotFound,
+    PossumException,
+    SAMTemplateError,
+    StateFileError
+)
+from possum.installers import (
+    DockerPipInstaller,
+    INSTALLERS,
+    PlatformPipInstaller
+)
+from possum.layers import (
+    attach_layer,
+    can_attach_layer,
+    find_shared_dependencies,
+    set_layer_resource
+)
 from possum.packages import (
-    move_installed_packages,
-    create_lambda_package,
-    get_existing_site_packages,
+    ArtifactUploader,
+    MB,
+    store_artifact,
     upload_packages
 )
+from possum.sizes import (
+    analyze_artifact,
+    check_size_budget,
+    format_size,
+    format_size_table,
+    parse_size,
+    LAMBDA_UNZIPPED_LIMIT
+)
+from possum.profiling import (
+    extract_package,
+    get_handler_module,
+    get_top_imports,
+    profile_handler_import,
+    profile_handler_import_in_docker
+)
 from possum.reqs import (
+    get_lockfile_requirements,
     get_pipfile_packages,
     parse_requirements,
     write_requirements
 )
-from possum.template import get_global, update_template_resource, SAMTemplate
+from possum.trace import tracer
+from possum.watch import get_watcher, match_functions, wait_for_changes
+from possum.wheelhouse import build_wheelhouse
+from possum.template import (
+    get_function_architecture,
+    get_function_runtime,
+    get_global,
+    get_possum_metadata,
+    update_template_resource,
+    SAMTemplate
+)
 from possum.utils import (
     build_docker_image,
+    BuildContainerPool,
     get_s3_bucket_and_dir,
+    get_possum_dir,
     run_in_docker,
     PipenvWrapper,
+    hash_tree,
     PossumFile,
 )
 
@@ -108,6 +160,194 @@ def arguments():
         action='store_true'
     )
 
+    main_legacy_parser.add_argument(
+        '--verify-hashes',
+        help='Read every file when checking for changes instead of only the '
+             'files whose size or modification time changed.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--change-detection',
+        help="How to find changed functions: 'content' hashes the files that "
+             "changed since the last run, 'git' uses the object IDs of files "
+             "that are unchanged in git and only hashes the rest (defaults to "
+             "'content').",
+        choices=['content', 'git'],
+        default='content'
+    )
+
+    main_legacy_parser.add_argument(
+        '-j', '--jobs',
+        help='The number of Lambda functions to build in parallel (defaults '
+             'to 1).',
+        default=1,
+        type=int,
+        metavar='N'
+    )
+
+    main_legacy_parser.add_argument(
+        '--installer',
+        help="The backend used to install each function's requirements "
+             "(defaults to 'pip').",
+        choices=sorted(set(INSTALLERS) - {DockerPipInstaller.name}),
+        default='pip'
+    )
+
+    main_legacy_parser.add_argument(
+        '--fallback-image',
+        help="With the 'pip-platform' installer, the Docker image to build "
+             "packages without a compatible wheel in (defaults to the SAM "
+             "build image for the function's runtime).",
+        metavar='image_name'
+    )
+
+    main_legacy_parser.add_argument(
+        '--no-fallback',
+        help="With the 'pip-platform' installer, fail instead of building "
+             "packages without a compatible wheel in Docker.",
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--wheelhouse',
+        help="Install requirements offline from a directory of wheels built "
+             "by 'possum wheelhouse' instead of the package index.",
+        metavar='dir'
+    )
+
+    main_legacy_parser.add_argument(
+        '--shared-layers',
+        help='Package each set of dependencies shared by several functions '
+             'once, as a Lambda layer attached to those functions.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--no-dependency-cache',
+        help='Install all dependencies instead of using the local dependency '
+             'cache.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--slim',
+        help="Remove files that are not needed at runtime, such as caches, "
+             "type stubs and the dependencies' tests, from each package.",
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--strip',
+        help='Strip debug symbols from shared objects in the dependencies.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--precompile',
+        help="Compile Python files to bytecode for each function's runtime "
+             "before packaging.",
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--compression-level',
+        help='The deflate compression level (0-9) for Lambda packages '
+             '(defaults to 6).',
+        default=6,
+        type=int,
+        choices=range(10),
+        metavar='N'
+    )
+
+    main_legacy_parser.add_argument(
+        '--max-package-size',
+        help="Fail if a Lambda package is larger than this size, such as "
+             "'50MB' (no limit by default).",
+        metavar='size'
+    )
+
+    main_legacy_parser.add_argument(
+        '--max-unzipped-size',
+        help="Fail if a Lambda package is larger than this size once "
+             "unzipped (defaults to Lambda's limit of '250MB').",
+        metavar='size'
+    )
+
+    main_legacy_parser.add_argument(
+        '--size-report',
+        help='Show a breakdown of the size of each Lambda package.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--size-report-json',
+        help='Write the size breakdown of each Lambda package as JSON to a '
+             'file.',
+        metavar='filename'
+    )
+
+    main_legacy_parser.add_argument(
+        '--stream-upload',
+        help='Stream Lambda packages to S3 while they are being created '
+             'instead of writing them to disk first.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--upload-jobs',
+        help='The number of artifacts to upload to S3 at once (defaults to '
+             '4).',
+        default=4,
+        type=int,
+        metavar='N'
+    )
+
+    main_legacy_parser.add_argument(
+        '--multipart-chunksize',
+        help='The size in MB of each part of a multipart upload (defaults to '
+             '8).',
+        default=8,
+        type=int,
+        metavar='MB'
+    )
+
+    main_legacy_parser.add_argument(
+        '--multipart-concurrency',
+        help='The number of parts of an artifact to upload at once (defaults '
+             'to 10).',
+        default=10,
+        type=int,
+        metavar='N'
+    )
+
+    main_legacy_parser.add_argument(
+        '--upload-retries',
+        help='The number of times to retry a failed upload (defaults to 3).',
+        default=3,
+        type=int,
+        metavar='N'
+    )
+
+    main_legacy_parser.add_argument(
+        '--force-upload',
+        help='Upload all artifacts even if they already exist in S3.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--s3-endpoint-url',
+        help='Optional S3 endpoint URL, such as a local S3 stand-in.',
+        metavar='url'
+    )
+
+    main_legacy_parser.add_argument(
+        '--trace',
+        help='Record how long each phase of the run takes, write it as a '
+             'Chrome trace file and show a summary.',
+        metavar='filename'
+    )
+
     main_legacy_parser.add_argument(
         '--docker',
         help='Build Lambda packages within a Docker container environment.',
@@ -121,6 +361,288 @@ def arguments():
         metavar='image_name'
     )
 
+    main_legacy_parser.add_argument(
+        '--docker-pool',
+        help='Run Possum on the host and install requirements with pip in a '
+             'pool of build containers from the Docker image, one for each '
+             'job (see -j).',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--docker-cache-dir',
+        help="A directory mounted as the container's pip and pipenv cache so "
+             "downloads and built wheels are reused between Docker builds "
+             "(defaults to '~/.possum/cache/docker').",
+        metavar='dir'
+    )
+
+    main_legacy_parser.add_argument(
+        '--no-docker-cache',
+        help='Do not mount a pip and pipenv cache into the container.',
+        action='store_true'
+    )
+
+    main_legacy_parser.add_argument(
+        '--docker-reuse-container',
+        help='Run in a named build container that is kept running between '
+             'invocations instead of creating a new container each time.',
+        action='store_true'
+    )
+
+    watch_parser = subparsers.add_parser(
+        'watch',
+        help="Watch the Lambda functions' source directories and rebuild "
+             "(and optionally upload) the functions that change."
+    )
+    watch_parser.set_defaults(func=watch)
+
+    watch_parser.add_argument(
+        '-t', '--template',
+        help='The filename of the SAM template.',
+        default='template.yaml',
+        metavar='template'
+    )
+
+    watch_parser.add_argument(
+        '-o', '--output-template',
+        help='Optional filename for the output template, rewritten after '
+             'every rebuild.',
+        metavar='output'
+    )
+
+    watch_parser.add_argument(
+        '-p', '--profile',
+        help='Optional profile name for AWS credentials.',
+        metavar='profile_name'
+    )
+
+    watch_parser.add_argument(
+        '--upload',
+        help='Upload rebuilt packages to this S3 bucket (and optional path) '
+             'instead of only writing them locally.',
+        metavar='s3_bucket'
+    )
+
+    watch_parser.add_argument(
+        '--artifact-dir',
+        help="The directory to write local packages to (defaults to "
+             "'.possum-watch').",
+        default='.possum-watch',
+        metavar='dir'
+    )
+
+    watch_parser.add_argument(
+        '-j', '--jobs',
+        help='The number of Lambda functions to build in parallel (defaults '
+             'to 1).',
+        default=1,
+        type=int,
+        metavar='N'
+    )
+
+    watch_parser.add_argument(
+        '--installer',
+        help="The backend used to install each function's requirements "
+             "(defaults to 'pip').",
+        default='pip',
+        choices=sorted(set(INSTALLERS) - {DockerPipInstaller.name})
+    )
+
+    watch_parser.add_argument(
+        '--wheelhouse',
+        help="Install requirements offline from a directory of wheels built "
+             "by 'possum wheelhouse' instead of the package index.",
+        metavar='dir'
+    )
+
+    watch_parser.add_argument(
+        '--no-dependency-cache',
+        help='Install all dependencies instead of using the local dependency '
+             'cache.',
+        action='store_true'
+    )
+
+    watch_parser.add_argument(
+        '--slim',
+        help="Remove files that are not needed at runtime, such as caches, "
+             "type stubs and the dependencies' tests, from each package.",
+        action='store_true'
+    )
+
+    watch_parser.add_argument(
+        '--strip',
+        help='Strip debug symbols from shared objects in the dependencies.',
+        action='store_true'
+    )
+
+    watch_parser.add_argument(
+        '--precompile',
+        help="Compile Python files to bytecode for each function's runtime "
+             "before packaging.",
+        action='store_true'
+    )
+
+    watch_parser.add_argument(
+        '--debounce',
+        help='Wait until no files have changed for this many seconds before '
+             'rebuilding (defaults to 0.5).',
+        default=0.5,
+        type=float,
+        metavar='seconds'
+    )
+
+    watch_parser.add_argument(
+        '--poll',
+        help='Poll the source directories for changes instead of using '
+             'inotify.',
+        action='store_true'
+    )
+
+    watch_parser.add_argument(
+        '--s3-endpoint-url',
+        help='Optional S3 endpoint URL, such as a local S3 stand-in.',
+        metavar='url'
+    )
+
+    profile_imports_parser = subparsers.add_parser(
+        'profile-imports',
+        help="Build each Lambda function and measure the time taken to "
+             "import its handler."
+    )
+    profile_imports_parser.set_defaults(func=profile_imports)
+
+    profile_imports_parser.add_argument(
+        '-t', '--template',
+        help='The filename of the SAM template.',
+        default='template.yaml',
+        metavar='template'
+    )
+
+    profile_imports_parser.add_argument(
+        '-f', '--function',
+        help='Only profile this function (may be repeated).',
+        action='append',
+        metavar='logical_id'
+    )
+
+    profile_imports_parser.add_argument(
+        '--top',
+        help='The number of modules to list for each function (defaults to '
+             '10).',
+        default=10,
+        type=int,
+        metavar='N'
+    )
+
+    profile_imports_parser.add_argument(
+        '--json',
+        help='Write the full results as JSON to a file.',
+        metavar='filename'
+    )
+
+    profile_imports_parser.add_argument(
+        '-j', '--jobs',
+        help='The number of Lambda functions to build in parallel (defaults '
+             'to 1).',
+        default=1,
+        type=int,
+        metavar='N'
+    )
+
+    profile_imports_parser.add_argument(
+        '--installer',
+        help="The backend used to install each function's requirements "
+             "(defaults to 'pip').",
+        default='pip',
+        choices=sorted(set(INSTALLERS) - {DockerPipInstaller.name})
+    )
+
+    profile_imports_parser.add_argument(
+        '--slim',
+        help="Remove files that are not needed at runtime, such as caches, "
+             "type stubs and the dependencies' tests, from each package "
+             "before profiling.",
+        action='store_true'
+    )
+
+    profile_imports_parser.add_argument(
+        '--strip',
+        help='Strip debug symbols from shared objects in the dependencies.',
+        action='store_true'
+    )
+
+    profile_imports_parser.add_argument(
+        '--precompile',
+        help="Compile Python files to bytecode for each function's runtime "
+             "before profiling.",
+        action='store_true'
+    )
+
+    profile_imports_parser.add_argument(
+        '--docker',
+        help='Import each handler within a Docker container.',
+        action='store_true'
+    )
+
+    profile_imports_parser.add_argument(
+        '--docker-image',
+        help="Specify a Docker image to use (defaults to 'possum:latest').",
+        default='possum:latest',
+        metavar='image_name'
+    )
+
+    wheelhouse_parser = subparsers.add_parser(
+        'wheelhouse',
+        help="Download or build a wheel for every package in the project's "
+             "Pipfile.lock for offline installs."
+    )
+    wheelhouse_parser.set_defaults(func=wheelhouse)
+
+    wheelhouse_parser.add_argument(
+        '-t', '--template',
+        help="The filename of the SAM template, used to find an interpreter "
+             "for the functions' runtime.",
+        default='template.yaml',
+        metavar='template'
+    )
+
+    wheelhouse_parser.add_argument(
+        '-w', '--wheel-dir',
+        help="The directory to write the wheels to (defaults to "
+             "'wheelhouse').",
+        default='wheelhouse',
+        metavar='dir'
+    )
+
+    wheelhouse_parser.add_argument(
+        '-j', '--jobs',
+        help='The number of pip processes to run in parallel (defaults to 1).',
+        default=1,
+        type=int,
+        metavar='N'
+    )
+
+    wheelhouse_parser.add_argument(
+        '--python',
+        help="The interpreter to run pip with (defaults to one matching the "
+             "template's global runtime).",
+        metavar='path'
+    )
+
+    wheelhouse_parser.add_argument(
+        '--docker',
+        help='Build the wheels within Docker containers.',
+        action='store_true'
+    )
+
+    wheelhouse_parser.add_argument(
+        '--docker-image',
+        help="Specify a Docker image to use (defaults to 'possum:latest').",
+        default='possum:latest',
+        metavar='image_name'
+    )
+
     sync_reqs_parser = subparsers.add_parser(
         'sync-requirements',
         help="Sync any 'requirements.txt' files for each Lambda function from "
@@ -191,15 +713,407 @@ def sync_requirements(args):
             logger.info(f"{k}: No requirements.txt file generated\n")
 
 
+def log_import_profile(result, count):
+    logger.info(f"{result['function']}: {result['module']} "
+                f"({result['runtime']})")
+    logger.info(f"  Import time: {result['import_time_us'] / 1000:.1f} ms "
+                f"(wall time {result['wall_time_us'] / 1000:.1f} ms)")
+    logger.info(f"  {'Cumulative':>12}  {'Self':>10}  Module")
+
+    for i in get_top_imports(result['imports'], count):
+        logger.info(f"  {i['cumulative_us'] / 1000:>9.1f} ms  "
+                    f"{i['self_us'] / 1000:>7.1f} ms  {i['module']}")
+
+    logger.info('')
+
+
+def profile_imports(args):
+    try:
+        template = SAMTemplate(args.template)
+    except SAMTemplateError as error:
+        logger.error(f'Failed to load template file! {error}')
+        sys.exit(1)
+
+    if args.jobs < 1:
+        logger.error('The number of jobs must be at least 1')
+        sys.exit(1)
+
+    functions = template.lambda_resources
+    if args.function:
+        unknown = sorted(set(args.function) - set(functions))
+        if unknown:
+            logger.error(f"Unknown Python functions: {', '.join(unknown)}")
+            sys.exit(1)
+
+        functions = {
+            k: v for k, v in functions.items() if k in args.function
+        }
+
+    build_directory = tempfile.mkdtemp(suffix='-profile', prefix='possum-')
+    artifact_directory = os.path.join(build_directory, 'artifacts')
+    os.mkdir(artifact_directory)
+
+    build_jobs = list()
+    for func, values in functions.items():
+        runtime = values['Properties'].get(
+            'Runtime', template.get_global('Function', 'Runtime'))
+        architecture = get_function_architecture(template.template, func)
+
+        build_jobs.append(
+            BuildJob(
+                func,
+                os.path.join(WORKING_DIR, values['Properties']['CodeUri']),
+                os.path.join(build_directory, func),
+                artifact_directory,
+                runtime=runtime,
+                installer=args.installer,
+                installer_options=get_installer_options(
+                    args, runtime, architecture),
+                dependency_cache_dir=os.path.join(
+                    get_possum_dir(USER_DIR), 'cache', 'dependencies'),
+                slim_options=get_slim_options(template.template, func, args),
+                precompile=args.precompile,
+                architecture=architecture
+            )
+        )
+
+    results = list()
+    failed = False
+
+    try:
+        for job, artifact in build_lambda_functions(build_jobs, args.jobs):
+            func = job.logical_id
+            handler = functions[func]['Properties'].get(
+                'Handler', template.get_global('Function', 'Handler'))
+
+            if not handler:
+                logger.warning(f"{func}: There was no 'Handler' found for "
+                               "the Lambda function and it is being skipped!")
+                continue
+
+            package_dir = os.path.join(job.build_dir, 'package')
+            extract_package(
+                os.path.join(artifact_directory, artifact.name), package_dir)
+
+            module = get_handler_module(handler)
+            logger.info(f'{func}: Importing {module}...')
+
+            try:
+                if args.docker:
+                    result = profile_handler_import_in_docker(
+                        package_dir, module, args.docker_image)
+                else:
+                    python_path = get_runtime_interpreter(job.runtime)
+                    if not python_path:
+                        logger.warning(
+                            f"{func}: No '{job.runtime}' interpreter could "
+                            f"be found, using {sys.executable}")
+                        python_path = sys.executable
+
+                    result = profile_handler_import(
+                        package_dir, module, python_path)
+            except PossumException as error:
+                logger.error(f'{func}: {error}')
+                failed = True
+                continue
+
+            result.update(function=func, handler=handler, runtime=job.runtime)
+            results.append(result)
+            log_import_profile(result, args.top)
+    finally:
+        shutil.rmtree(build_directory)
+
+    if args.json:
+        with open(os.path.join(WORKING_DIR, args.json), 'wt') as fobj:
+            json.dump(results, fobj, indent=2)
+
+    if failed:
+        sys.exit(1)
+
+
+def wheelhouse(args):
+    if args.jobs < 1:
+        logger.error('The number of jobs must be at least 1')
+        sys.exit(1)
+
+    lockfile = os.path.join(WORKING_DIR, 'Pipfile.lock')
+    if not os.path.isfile(lockfile):
+        logger.error("There is no 'Pipfile.lock' in the current directory")
+        sys.exit(1)
+
+    try:
+        # Wheels built from source distributions never match the lock's
+        # hashes, so they can't be checked when installing or reusing them
+        requirements = get_lockfile_requirements(lockfile, hashes=False)
+    except PossumException as error:
+        logger.error(error)
+        sys.exit(1)
+
+    for requirement in requirements:
+        if requirement.startswith('git+'):
+            logger.warning(f"'{requirement}' is installed from git and "
+                           "cannot be installed offline")
+
+    python_path = args.python
+    if not python_path and not args.docker:
+        runtime = None
+        try:
+            runtime = SAMTemplate(args.template).get_global(
+                'Function', 'Runtime')
+        except SAMTemplateError:
+            pass
+
+        python_path = get_runtime_interpreter(runtime)
+        if not python_path:
+            logger.warning(f"No interpreter found for the runtime "
+                           f"'{runtime}'; wheels are built for the "
+                           "interpreter running Possum")
+
+    wheel_dir = os.path.join(WORKING_DIR, args.wheel_dir)
+    package_count = len([i for i in requirements if not i.startswith('-')])
+    logger.info(f"Building wheels for {package_count} packages in "
+                f"'{args.wheel_dir}'...")
+
+    try:
+        wheels = build_wheelhouse(
+            requirements,
+            wheel_dir,
+            python_path=python_path,
+            max_workers=args.jobs,
+            docker_image=args.docker_image if args.docker else None
+        )
+    except PossumException as error:
+        logger.error(f'The wheelhouse could not be built! {error}')
+        sys.exit(1)
+
+    logger.info(f"The wheelhouse contains {len(wheels)} wheels. Install "
+                f"from it with 'possum package --wheelhouse "
+                f"{args.wheel_dir}'.")
+
+
 def docker_image(args):
     build_docker_image(args.pypi_version)
 
 
+def get_slim_options(template, func, args):
+    """Return the slimming options for a package. Files are only removed
+    with ``--slim``, using the built-in rules and the function's ``Include``
+    and ``Exclude`` patterns from its ``Metadata: Possum`` section, and
+    shared objects are only stripped with ``--strip``.
+
+    :param dict template: The loaded SAM template
+    :param str func: The logical ID of the function, or ``None`` for a layer
+    :param argparse.Namespace args: The parsed arguments
+
+    :returns: Options for ``slim_package_entries``, or ``None`` to skip
+        slimming
+    :rtype: dict
+    """
+    if not args.slim and not args.strip:
+        return None
+
+    slim_options = dict(default_rules=args.slim, strip_binaries=args.strip)
+    if not args.slim or not func:
+        return slim_options
+
+    metadata = get_possum_metadata(template, func)
+
+    for key in ('Exclude', 'Include'):
+        patterns = metadata.get(key) or list()
+        if isinstance(patterns, str):
+            patterns = [patterns]
+
+        if not all(isinstance(i, str) for i in patterns):
+            logger.error(f"{func}: 'Metadata: Possum: {key}' must be a list "
+                         "of glob patterns")
+            sys.exit(1)
+
+        # Plain lists so the options can be sent to build worker processes
+        slim_options[key.lower()] = [str(i) for i in patterns]
+
+    return slim_options
+
+
+def get_size_budget(template, func, args):
+    """Return a function's package size budget. Limits in the function's
+    ``Metadata: Possum: SizeBudget`` section override the command line.
+
+    :param dict template: The loaded SAM template
+    :param str func: The logical ID of the function
+    :param argparse.Namespace args: The parsed arguments
+
+    :returns: Keyword arguments for ``check_size_budget``
+    :rtype: dict
+    """
+    budget = get_possum_metadata(template, func).get('SizeBudget') or dict()
+
+    limits = {
+        'compressed': budget.get('Compressed', args.max_package_size),
+        'uncompressed': budget.get(
+            'Uncompressed', args.max_unzipped_size or LAMBDA_UNZIPPED_LIMIT)
+    }
+
+    try:
+        return {
+            k: parse_size(v) if v is not None else None
+            for k, v in limits.items()
+        }
+    except PossumException as error:
+        logger.error(f'{func}: {error}')
+        sys.exit(1)
+
+
+def log_size_report(func, report, history, full_report=False):
+    change = ''
+    if history:
+        difference = \
+            report['compressed_bytes'] - history[-1]['compressedBytes']
+        change = f' ({"+" if difference >= 0 else "-"}' \
+                 f'{format_size(abs(difference))} since last build)'
+
+    logger.info(f"{func}: Package size: "
+                f"{format_size(report['compressed_bytes'])} compressed, "
+                f"{format_size(report['uncompressed_bytes'])} uncompressed, "
+                f"{report['files']} files{change}")
+
+    if full_report:
+        for groups, label in ((report['packages'], 'Package'),
+                              (report['file_types'], 'File type')):
+            logger.info('')
+            for row in format_size_table(groups, label):
+                logger.info(f'  {row}')
+        logger.info('')
+
+
+def get_installer_options(args, runtime, architecture, find_links=None):
+    """Return the options for the installer selected on the command line.
+
+    :param args: The parsed command line arguments
+    :param str runtime: The function's Lambda runtime
+    :param str architecture: The function's Lambda architecture
+    :param str find_links: A wheelhouse directory to install from
+
+    :rtype: dict
+    """
+    options = dict()
+    if find_links:
+        options['find_links'] = find_links
+
+    if args.installer == PlatformPipInstaller.name:
+        fallback_image = None
+        if not getattr(args, 'no_fallback', False):
+            fallback_image = getattr(args, 'fallback_image', None) or \
+                f'public.ecr.aws/sam/build-{runtime}'
+
+        options.update(
+            runtime=runtime,
+            architecture=architecture,
+            fallback_image=fallback_image
+        )
+
+    return options
+
+
+def get_docker_cache_dir(args):
+    if args.no_docker_cache:
+        return None
+
+    return args.docker_cache_dir or os.path.join(
+        get_possum_dir(USER_DIR), 'cache', 'docker')
+
+
+def start_build_container_pool(build_jobs, args):
+    """Start a pool of build containers and send each job's requirements
+    installation to one of them.
+
+    :param list build_jobs: The ``BuildJob`` objects to run
+    :param args: The parsed command line arguments
+
+    :rtype: BuildContainerPool
+    """
+    cache_dir = get_docker_cache_dir(args)
+    mount_dirs = [WORKING_DIR, tempfile.gettempdir()]
+    for job in build_jobs:
+        if job.dependency_cache_dir:
+            mount_dirs.append(job.dependency_cache_dir)
+    if cache_dir:
+        mount_dirs.append(cache_dir)
+    if args.wheelhouse:
+        mount_dirs.append(os.path.join(WORKING_DIR, args.wheelhouse))
+
+    # Docker would create missing directories owned by root
+    for mount_dir in mount_dirs:
+        os.makedirs(mount_dir, exist_ok=True)
+
+    size = min(args.jobs, len(build_jobs))
+    logger.info(f"Starting {size} build container(s) from "
+                f"'{args.docker_image}'...\n")
+
+    pool = BuildContainerPool(
+        args.docker_image, size, mount_dirs,
+        reuse=args.docker_reuse_container)
+    try:
+        with tracer.span('start build containers', containers=size):
+            containers = pool.start()
+    except PossumException as error:
+        pool.close()
+        logger.error(error)
+        sys.exit(1)
+
+    # Files installed in the containers belong to the user running Possum
+    user = f'{os.getuid()}:{os.getgid()}' if hasattr(os, 'getuid') else None
+
+    for index, job in enumerate(build_jobs):
+        job.installer = DockerPipInstaller.name
+        job.installer_options.update(
+            container=containers[index % size],
+            user=user,
+            cache_dir=cache_dir
+        )
+
+    return pool
+
+
+def package_api_definitions(template_file, api_resources,
+                            artifact_directory):
+    """Copy the local swagger files of API resources into the artifact
+    directory and point the template at their future S3 URIs.
+
+    :param dict template_file: The loaded SAM template
+    :param dict api_resources: The API resources by logical ID
+    :param str artifact_directory: The directory of artifacts to upload
+    """
+    for logical_id, api_resource in api_resources.items():
+        swagger_src = os.path.join(
+            WORKING_DIR, api_resource['Properties']['DefinitionUri'])
+
+        swagger_dst = os.path.join(
+            artifact_directory,
+            f'.{logical_id}.swagger'
+        )
+
+        shutil.copyfile(swagger_src, swagger_dst)
+
+        update_template_resource(
+            template_file,
+            logical_id,
+            S3_BUCKET_NAME,
+            S3_ARTIFACT_DIR,
+            s3_object=store_artifact(swagger_dst, suffix='.swagger'),
+            resource_param='DefinitionUri'
+        )
+
+
 def main_legacy(args):
     try:
-        possum_file = PossumFile(USER_DIR)
-    except scanner.ScannerError:
-        logger.error(f"The Possum file could not be loaded!")
+        with tracer.span('load state'):
+            possum_file = PossumFile(USER_DIR)
+    except StateFileError as error:
+        logger.error(f"The Possum file could not be loaded! {error}")
+        sys.exit(1)
+
+    if args.docker and args.docker_pool:
+        logger.error("'--docker' and '--docker-pool' cannot be used together")
         sys.exit(1)
 
     if args.docker:
@@ -207,22 +1121,56 @@ def main_legacy(args):
             logger.error('A Docker image must be specified')
             sys.exit(1)
 
-        run_in_docker(USER_DIR, possum_file.path, args.docker_image)
-        sys.exit()
+        sys.exit(run_in_docker(
+            USER_DIR,
+            possum_file.path,
+            args.docker_image,
+            cache_dir=get_docker_cache_dir(args),
+            reuse_container=args.docker_reuse_container
+        ))
+
+    if args.docker_pool and args.installer != 'pip':
+        logger.error('Requirements are always installed with pip when using '
+                     'a Docker build pool')
+        sys.exit(1)
+
+    wheel_dir = None
+    if args.wheelhouse:
+        wheel_dir = os.path.join(WORKING_DIR, args.wheelhouse)
+        if not os.path.isdir(wheel_dir):
+            logger.error(f"The wheelhouse '{args.wheelhouse}' does not exist")
+            sys.exit(1)
+
+    if args.jobs < 1 or args.upload_jobs < 1:
+        logger.error('The number of jobs must be at least 1')
+        sys.exit(1)
 
-    try:
-        pipenvw = PipenvWrapper()
-    except PipenvPathNotFound:
-        logger.error("'pipenv' could not be found!")
+    if args.multipart_chunksize < 5:
+        logger.error('The multipart chunk size must be at least 5 MB')
         sys.exit(1)
 
+    for size in (args.max_package_size, args.max_unzipped_size):
+        try:
+            if size is not None:
+                parse_size(size)
+        except PossumException as error:
+            logger.error(error)
+            sys.exit(1)
+
+    if args.installer == 'pipenv':
+        try:
+            PipenvWrapper()
+        except PipenvPathNotFound:
+            logger.error("'pipenv' could not be found!")
+            sys.exit(1)
+
     global S3_BUCKET_NAME
     global S3_ARTIFACT_DIR
 
     S3_BUCKET_NAME, S3_ARTIFACT_DIR = get_s3_bucket_and_dir(args.s3_bucket)
 
     try:
-        with open(args.template) as fobj:
+        with tracer.span('load template'), open(args.template) as fobj:
             template_file = YAML().load(fobj)
     except Exception as error:
         logger.error('Failed to load template file! Encountered: '
@@ -281,33 +1229,120 @@ def main_legacy(args):
     build_artifact_directory = os.path.join(build_directory, 's3_artifacts')
     os.mkdir(build_artifact_directory)
 
-    for logical_id, api_resource in api_resources.items():
-        swagger_src = os.path.join(
-            WORKING_DIR, api_resource['Properties']['DefinitionUri'])
+    package_api_definitions(
+        template_file, api_resources, build_artifact_directory)
 
-        swagger_dst = os.path.join(
-            build_artifact_directory,
-            f'{logical_id}.swagger'
-        )
+    if args.no_dependency_cache:
+        dependency_cache_dir = None
+    else:
+        dependency_cache_dir = os.path.join(
+            get_possum_dir(USER_DIR), 'cache', 'dependencies')
+
+    upload_options = dict(
+        bucket_name=S3_BUCKET_NAME,
+        bucket_dir=S3_ARTIFACT_DIR,
+        profile_name=args.profile,
+        max_workers=args.upload_jobs,
+        multipart_chunksize=args.multipart_chunksize * MB,
+        max_concurrency=args.multipart_concurrency,
+        retries=args.upload_retries,
+        skip_existing=not args.force_upload,
+        endpoint_url=args.s3_endpoint_url
+    )
 
-        shutil.copyfile(swagger_src, swagger_dst)
+    build_jobs = list()
 
-        update_template_resource(
-            template_file,
-            logical_id,
-            S3_BUCKET_NAME,
-            S3_ARTIFACT_DIR,
-            s3_object=os.path.basename(swagger_dst),
-            resource_param='DefinitionUri'
+    # Functions sharing a dependency set get it from a layer built once
+    function_layers = dict()
+    layer_ids = dict()
+    layer_sizes = dict()
+
+    if args.shared_layers:
+        shared_dependencies = find_shared_dependencies(
+            [
+                (
+                    func,
+                    os.path.join(WORKING_DIR, values['Properties']['CodeUri']),
+                    get_function_runtime(template_file, func),
+                    get_function_architecture(template_file, func)
+                )
+                for func, values in lambda_functions.items()
+                if can_attach_layer(template_file, func)
+            ],
+            DockerPipInstaller.name if args.docker_pool else args.installer
         )
 
+        for layer_key, group in shared_dependencies.items():
+            layer_id = f'PossumLayer{layer_key[:12]}'
+            layer_ids[layer_key] = layer_id
+            for func in group['functions']:
+                function_layers[func] = layer_key
+
+            logger.info(f"{layer_id}: Dependencies shared by "
+                        f"{', '.join(group['functions'])}")
+
+            last_layer = possum_file.get_layer(layer_key)
+            if last_layer and not args.clean:
+                logger.info(f"{layer_id}: Using S3 artifact: "
+                            f"{last_layer['s3Uri']}\n")
+                set_layer_resource(
+                    template_file,
+                    layer_id,
+                    last_layer['s3Uri'],
+                    group['runtime'],
+                    group['architecture']
+                )
+                layer_sizes[layer_key] = last_layer['uncompressedBytes']
+                continue
+
+            build_jobs.append(
+                BuildJob(
+                    layer_id,
+                    os.path.join(
+                        WORKING_DIR,
+                        lambda_functions[group['functions'][0]]
+                        ['Properties']['CodeUri']),
+                    os.path.join(build_directory, layer_id),
+                    build_artifact_directory,
+                    runtime=group['runtime'],
+                    installer=args.installer,
+                    installer_options=get_installer_options(
+                        args, group['runtime'], group['architecture'],
+                        find_links=wheel_dir),
+                    dependency_cache_dir=dependency_cache_dir,
+                    upload_options=upload_options
+                    if args.stream_upload else None,
+                    archive_options=dict(
+                        compression_level=args.compression_level),
+                    slim_options=get_slim_options(
+                        template_file, None, args),
+                    precompile=args.precompile,
+                    trace=tracer.enabled,
+                    architecture=group['architecture'],
+                    layer=True
+                )
+            )
+
+        if shared_dependencies:
+            logger.info('')
+
     for func, values in lambda_functions.items():
         func_source_dir = os.path.join(
             WORKING_DIR, values['Properties']['CodeUri'])
+        layer_key = function_layers.get(func)
 
         func_build_dir = os.path.join(build_directory, func)
 
-        if possum_file.check_hash(func, func_source_dir) and not args.clean:
+        slim_options = get_slim_options(template_file, func, args)
+
+        with tracer.span('check changes', function=func):
+            unchanged = possum_file.check_hash(
+                func, func_source_dir, verify=args.verify_hashes,
+                use_git=args.change_detection == 'git')
+
+        # An artifact is only reused if it was built for the same layer
+        if unchanged and not args.clean and \
+                possum_file.get_function_layer(func) == layer_key:
             last_s3_uri = possum_file.get_last_s3_uri(func)
             if last_s3_uri:
                 logger.info(f'{func}: No changes detected')
@@ -321,52 +1356,124 @@ def main_legacy(args):
                 )
                 continue
 
-        shutil.copytree(func_source_dir, func_build_dir)
-        os.chdir(func_build_dir)
-        logger.info(f'{func}: Working dir: {func_build_dir}')
-
-        requirements_files = ('Pipfile', 'Pipfile.lock', 'requirements.txt')
-        if [i for i in os.listdir('.') if i in requirements_files]:
-            logger.info(f'{func}: Creating virtual environment...')
-            pipenvw.create_virtual_environment()
-
-            pipenvw.get_virtual_environment_path()
-
-            logger.info(f'{func}: Environment created at {pipenvw.venv_path}')
-
-            do_not_copy = get_existing_site_packages(pipenvw.venv_path)
-
-            logger.info(f'{func}: Installing requirements...')
-            pipenvw.install_packages()
-
-            logger.info(f'{func}: Copying installed packages...')
-            move_installed_packages(pipenvw.venv_path, do_not_copy)
+        runtime = get_function_runtime(template_file, func)
+        architecture = get_function_architecture(template_file, func)
+
+        build_jobs.append(
+            BuildJob(
+                func,
+                func_source_dir,
+                func_build_dir,
+                build_artifact_directory,
+                runtime=runtime,
+                installer=args.installer,
+                installer_options=get_installer_options(
+                    args, runtime, architecture, find_links=wheel_dir),
+                dependency_cache_dir=dependency_cache_dir,
+                upload_options=upload_options if args.stream_upload else None,
+                archive_options=dict(compression_level=args.compression_level),
+                slim_options=slim_options,
+                precompile=args.precompile,
+                trace=tracer.enabled,
+                architecture=architecture,
+                bundle_dependencies=layer_key is None
+            )
+        )
 
-            logger.info(f'{func}: Removing Lambda build environment...')
-            pipenvw.remove_virtualenv()
+    # Builds may finish in any order; the template and the Possum file are
+    # only updated afterwards and in template order.
+    size_reports = list()
+    budget_exceeded = False
 
-        logger.info(f'{func}: Creating Lambda package...')
+    pool = None
+    if args.docker_pool and build_jobs:
+        pool = start_build_container_pool(build_jobs, args)
 
-        artifact = create_lambda_package(
-            func_build_dir, build_artifact_directory)
+    try:
+        with tracer.span('build functions', functions=len(build_jobs)):
+            results = build_lambda_functions(build_jobs, args.jobs)
+    finally:
+        if pool:
+            pool.close()
+
+    # Layers are built first, so their sizes are known for their functions
+    layer_keys = {v: k for k, v in layer_ids.items()}
+
+    for job, artifact in results:
+        report = analyze_artifact(artifact)
+        history = possum_file.get_size_history(job.logical_id)
+        log_size_report(job.logical_id, report, history, args.size_report)
+
+        if job.layer:
+            budget = dict(uncompressed=LAMBDA_UNZIPPED_LIMIT)
+            budget_report = report
+        else:
+            # A function's layers count towards its unzipped size
+            budget = get_size_budget(template_file, job.logical_id, args)
+            budget_report = dict(report)
+            if job.logical_id in function_layers:
+                budget_report['uncompressed_bytes'] += \
+                    layer_sizes[function_layers[job.logical_id]]
+
+        for violation in check_size_budget(budget_report, **budget):
+            logger.error(f'{job.logical_id}: {violation}')
+            budget_exceeded = True
+
+        report.update(function=job.logical_id, history=history)
+        size_reports.append(report)
+        possum_file.add_size_record(job.logical_id, report)
+
+        if job.layer:
+            layer_key = layer_keys[job.logical_id]
+            layer_s3_uri = \
+                f's3://{S3_BUCKET_NAME}/{S3_ARTIFACT_DIR}/{artifact.name}'
+            set_layer_resource(
+                template_file,
+                job.logical_id,
+                layer_s3_uri,
+                job.runtime,
+                job.architecture
+            )
+            possum_file.set_layer(
+                layer_key, layer_s3_uri, report['uncompressed_bytes'])
+            layer_sizes[layer_key] = report['uncompressed_bytes']
+            continue
 
         update_template_resource(
             template_file,
-            func,
+            job.logical_id,
             S3_BUCKET_NAME,
             S3_ARTIFACT_DIR,
-            s3_object=artifact
+            s3_object=artifact.name
         )
         possum_file.set_s3_uri(
-            func, template_file['Resources'][func]['Properties']['CodeUri'])
-        logger.info('')
+            job.logical_id,
+            template_file['Resources'][job.logical_id]['Properties']['CodeUri']
+        )
+        possum_file.set_function_layer(
+            job.logical_id, function_layers.get(job.logical_id))
 
-    upload_packages(
-        build_artifact_directory,
-        S3_BUCKET_NAME,
-        S3_ARTIFACT_DIR,
-        args.profile
-    )
+    for func, layer_key in function_layers.items():
+        attach_layer(template_file, func, layer_ids[layer_key])
+
+    logger.info('')
+
+    if args.size_report_json:
+        with open(os.path.join(WORKING_DIR, args.size_report_json),
+                  'wt') as fobj:
+            json.dump(size_reports, fobj, indent=2)
+
+    if budget_exceeded:
+        logger.error('One or more Lambda packages exceeded their size budget!')
+        shutil.rmtree(build_directory)
+        sys.exit(1)
+
+    with tracer.span('upload packages'):
+        upload_packages(build_artifact_directory, **upload_options)
+
+    # Every artifact is stored in S3 now
+    with tracer.span('save state'):
+        possum_file.save()
 
     logger.info('\nRemoving build directory...')
     shutil.rmtree(build_directory)
@@ -385,7 +1492,284 @@ def main_legacy(args):
                   'wt') as fobj:
             fobj.write(deployment_template)
 
-    possum_file.save()
+
+def watch(args):
+    if args.jobs < 1:
+        logger.error('The number of jobs must be at least 1')
+        sys.exit(1)
+
+    if args.debounce < 0:
+        logger.error('The debounce delay cannot be negative')
+        sys.exit(1)
+
+    wheel_dir = None
+    if args.wheelhouse:
+        wheel_dir = os.path.join(WORKING_DIR, args.wheelhouse)
+        if not os.path.isdir(wheel_dir):
+            logger.error(f"The wheelhouse '{args.wheelhouse}' does not exist")
+            sys.exit(1)
+
+    if args.installer == 'pipenv':
+        try:
+            PipenvWrapper()
+        except PipenvPathNotFound:
+            logger.error("'pipenv' could not be found!")
+            sys.exit(1)
+
+    # The template is only parsed once; restart to pick up changes to it
+    try:
+        template = SAMTemplate(args.template)
+    except SAMTemplateError as error:
+        logger.error(f'Failed to load template file! {error}')
+        sys.exit(1)
+
+    template_file = template.template
+    functions = template.lambda_resources
+    if not functions:
+        logger.error('There are no Python functions in the template to watch')
+        sys.exit(1)
+
+    source_dirs = {
+        func: os.path.normpath(
+            os.path.join(WORKING_DIR, values['Properties']['CodeUri']))
+        for func, values in functions.items()
+    }
+
+    if args.output_template:
+        output_path = os.path.join(WORKING_DIR, args.output_template)
+        output_dir = os.path.dirname(output_path)
+    else:
+        output_path = None
+        output_dir = WORKING_DIR
+
+    if args.no_dependency_cache:
+        dependency_cache_dir = None
+    else:
+        dependency_cache_dir = os.path.join(
+            get_possum_dir(USER_DIR), 'cache', 'dependencies')
+
+    build_directory = tempfile.mkdtemp(suffix='-watch', prefix='possum-')
+
+    # Without uploads, packages are written locally and the source hashes
+    # only live in memory. With uploads, the Possum file is kept loaded and
+    # one S3 client is used for the whole session.
+    possum_file = None
+    uploader = None
+    artifact_directory = None
+
+    if args.upload:
+        global S3_BUCKET_NAME
+        global S3_ARTIFACT_DIR
+
+        S3_BUCKET_NAME, S3_ARTIFACT_DIR = get_s3_bucket_and_dir(args.upload)
+
+        try:
+            possum_file = PossumFile(USER_DIR)
+        except StateFileError as error:
+            logger.error(f"The Possum file could not be loaded! {error}")
+            sys.exit(1)
+
+        uploader = ArtifactUploader(
+            S3_BUCKET_NAME,
+            S3_ARTIFACT_DIR,
+            profile_name=args.profile,
+            endpoint_url=args.s3_endpoint_url
+        )
+
+        api_directory = os.path.join(build_directory, 'api')
+        os.mkdir(api_directory)
+        package_api_definitions(
+            template_file, template.api_resources, api_directory)
+        upload_packages(
+            api_directory, S3_BUCKET_NAME, S3_ARTIFACT_DIR, uploader=uploader)
+    else:
+        artifact_directory = os.path.join(WORKING_DIR, args.artifact_dir)
+        os.makedirs(artifact_directory, exist_ok=True)
+
+    hashes = dict()
+    manifests = dict()
+
+    def rebuild(changed_functions, iteration_dir):
+        build_jobs = list()
+        source_hashes = dict()
+
+        if artifact_directory:
+            job_artifact_directory = artifact_directory
+        else:
+            job_artifact_directory = os.path.join(iteration_dir, 'artifacts')
+            os.mkdir(job_artifact_directory)
+
+        for func in functions:
+            if func not in changed_functions:
+                continue
+
+            source_dir = source_dirs[func]
+
+            if possum_file:
+                unchanged = possum_file.check_hash(func, source_dir)
+                last_s3_uri = possum_file.get_last_s3_uri(func)
+
+                # An artifact built for a shared layer lacks the dependencies
+                if unchanged and last_s3_uri and \
+                        possum_file.get_function_layer(func) is None:
+                    logger.info(f'{func}: No changes detected')
+                    update_template_resource(
+                        template_file,
+                        func,
+                        S3_BUCKET_NAME,
+                        S3_ARTIFACT_DIR,
+                        s3_uri=last_s3_uri
+                    )
+                    continue
+            else:
+                source_hash, manifests[func] = hash_tree(
+                    source_dir, manifests.get(func))
+                if hashes.get(func) == source_hash:
+                    logger.info(f'{func}: No changes detected')
+                    continue
+                source_hashes[func] = source_hash
+
+            runtime = get_function_runtime(template_file, func)
+            architecture = get_function_architecture(template_file, func)
+
+            slim_options = get_slim_options(template_file, func, args)
+
+            build_jobs.append(
+                BuildJob(
+                    func,
+                    source_dir,
+                    os.path.join(iteration_dir, func),
+                    job_artifact_directory,
+                    runtime=runtime,
+                    installer=args.installer,
+                    installer_options=get_installer_options(
+                        args, runtime, architecture, find_links=wheel_dir),
+                    dependency_cache_dir=dependency_cache_dir,
+                    slim_options=slim_options,
+                    precompile=args.precompile,
+                    architecture=architecture
+                )
+            )
+
+        if not build_jobs:
+            return
+
+        results = build_lambda_functions(build_jobs, args.jobs, executor)
+
+        for job, artifact in results:
+            report = analyze_artifact(artifact)
+            if possum_file:
+                history = possum_file.get_size_history(job.logical_id)
+                possum_file.add_size_record(job.logical_id, report)
+            else:
+                history = list()
+            log_size_report(job.logical_id, report, history)
+
+        if uploader:
+            upload_packages(
+                job_artifact_directory,
+                S3_BUCKET_NAME,
+                S3_ARTIFACT_DIR,
+                uploader=uploader
+            )
+
+        for job, artifact in results:
+            func = job.logical_id
+
+            if possum_file:
+                update_template_resource(
+                    template_file,
+                    func,
+                    S3_BUCKET_NAME,
+                    S3_ARTIFACT_DIR,
+                    s3_object=artifact.name
+                )
+                possum_file.set_s3_uri(
+                    func,
+                    template_file['Resources'][func]['Properties']['CodeUri']
+                )
+                possum_file.set_function_layer(func, None)
+            else:
+                # Each function's local package keeps the same name
+                package_path = os.path.join(artifact_directory, f'{func}.zip')
+                os.replace(
+                    os.path.join(artifact_directory, artifact.name),
+                    package_path
+                )
+                template_file['Resources'][func]['Properties']['CodeUri'] = \
+                    os.path.relpath(package_path, output_dir)
+                hashes[func] = source_hashes[func]
+
+        if possum_file:
+            possum_file.save()
+
+        logger.info(
+            f"Rebuilt {', '.join(job.logical_id for job, _ in results)}")
+
+    # Build workers are started once and kept for the whole session
+    executor = start_build_workers(args.jobs) if args.jobs > 1 else None
+
+    watcher = get_watcher(source_dirs.values(), poll=args.poll)
+    changed_functions = set(functions)
+
+    try:
+        while True:
+            iteration_dir = tempfile.mkdtemp(dir=build_directory)
+            try:
+                rebuild(changed_functions, iteration_dir)
+            except SystemExit:
+                logger.error('The rebuild failed!')
+            except Exception as error:
+                logger.error('The rebuild failed! Encountered: '
+                             f'{type(error).__name__}: {error}')
+            else:
+                if output_path:
+                    stream = io.StringIO()
+                    YAML().dump(template_file, stream)
+                    with open(output_path, 'wt') as fobj:
+                        fobj.write(stream.getvalue())
+            finally:
+                shutil.rmtree(iteration_dir, ignore_errors=True)
+
+            logger.info('\nWatching for changes (press Ctrl+C to stop)...')
+
+            changed_functions = set()
+            while not changed_functions:
+                changed_paths = wait_for_changes(watcher, args.debounce)
+                # Local packages may be written inside a source directory
+                if artifact_directory:
+                    changed_paths = {
+                        i for i in changed_paths
+                        if not i.startswith(
+                            os.path.join(artifact_directory, ''))
+                    }
+                changed_functions = match_functions(
+                    changed_paths, source_dirs)
+
+            logger.info('\nChanges detected in '
+                        f"{', '.join(sorted(changed_functions))}")
+    except KeyboardInterrupt:
+        logger.info('\nStopping...')
+    finally:
+        watcher.close()
+        if executor:
+            executor.shutdown()
+        if uploader:
+            uploader.close()
+        shutil.rmtree(build_directory, ignore_errors=True)
+
+
+def write_trace(filename):
+    logger.info(f"\nWriting trace to '{filename}'...")
+    tracer.write_chrome_trace(os.path.join(WORKING_DIR, filename))
+
+    logger.info(f"\n{'Total (s)':>10}  {'Max (s)':>8}  {'Calls':>5}  "
+                f"{'MB':>8}  Phase")
+    for phase in tracer.summary():
+        size = f"{phase['bytes'] / MB:.1f}" if phase['bytes'] else ''
+        logger.info(f"{phase['total_us'] / 10 ** 6:>10.2f}  "
+                    f"{phase['max_us'] / 10 ** 6:>8.2f}  "
+                    f"{phase['calls']:>5}  {size:>8}  {phase['name']}")
 
 
 def main():
@@ -393,6 +1777,14 @@ def main():
 
     args = arguments()
     if hasattr(args, 'func'):
-        args.func(args)
+        if getattr(args, 'trace', None):
+            tracer.enable()
+
+        try:
+            with tracer.span('possum'):
+                args.func(args)
+        finally:
+            if tracer.enabled:
+                write_trace(args.trace)
 
     sys.exit(0)
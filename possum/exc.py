@@ -8,3 +8,15 @@ class PipenvPathNotFound(PossumException):
 
 class SAMTemplateError(PossumException):
     """There was an error reading the template file"""
+
+
+class InstallerError(PossumException):
+    """The external packages for a function could not be installed"""
+
+
+class StateFileError(PossumException):
+    """Possum's state file could not be read or written"""
+
+
+class WheelhouseError(PossumException):
+    """The wheelhouse could not be built"""
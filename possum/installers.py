@@ -0,0 +1,482 @@
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from possum.bytecode import get_runtime_version
+from possum.exc import InstallerError
+from possum.packages import (
+    get_existing_site_packages,
+    get_site_packages_path,
+    move_installed_packages
+)
+from possum.reqs import get_lockfile_requirements, get_pipfile_requirements
+from possum.trace import tracer
+from possum.utils import (
+    exec_in_container,
+    get_requirements_files,
+    PipenvWrapper,
+    run_container
+)
+
+__all__ = [
+    'Installer',
+    'PipInstaller',
+    'PipenvInstaller',
+    'PlatformPipInstaller',
+    'DockerPipInstaller',
+    'INSTALLERS',
+    'get_installer',
+    'get_lambda_platforms'
+]
+
+# The machine names in wheel platform tags for each Lambda architecture
+LAMBDA_MACHINES = {
+    'x86_64': 'x86_64',
+    'arm64': 'aarch64'
+}
+
+DOCKER_PLATFORMS = {
+    'x86_64': 'linux/amd64',
+    'arm64': 'linux/arm64'
+}
+
+# The glibc minor versions of the Lambda Python runtimes: Amazon Linux 2 up
+# to python3.11 and Amazon Linux 2023 from python3.12
+LAMBDA_GLIBC = (26, 34)
+
+MISSING_DISTRIBUTION = re.compile(
+    r'No matching distribution found for (.+)$', re.MULTILINE)
+
+
+class Installer:
+    """Base class for installer backends. An installer takes a directory
+    containing a function's requirements files and installs the external
+    packages directly into a target directory. Installers must not modify
+    the project directory, which is the function's source directory.
+
+    ``fallbacks`` lists the requirements the last install could only satisfy
+    by falling back to a slower method, for the build to report.
+    """
+    name = None
+    fallbacks = ()
+
+    def install(self, project_dir, target_dir):
+        """Install the requirements found in ``project_dir`` into
+        ``target_dir``.
+
+        :param str project_dir: The directory containing the requirements
+            files
+        :param str target_dir: The directory to install the packages into
+        """
+        raise NotImplementedError
+
+
+class PipInstaller(Installer):
+    """Installs requirements with a single ``pip install --target`` call. No
+    virtual environment is created.
+
+    A ``Pipfile.lock`` is preferred over ``requirements.txt``, which is
+    preferred over a ``Pipfile``. The lock's sources are passed on to pip and
+    its hashes are checked, except when installing from a wheelhouse, whose
+    wheels may have been built locally.
+
+    :param str python_path: The interpreter to run pip with (defaults to the
+        interpreter running Possum)
+    :param str find_links: A wheelhouse directory to install from instead of
+        the package index
+    """
+    name = 'pip'
+
+    def __init__(self, python_path=None, find_links=None):
+        self.python_path = python_path or sys.executable
+        self.find_links = find_links
+
+    def get_requirements(self, project_dir):
+        """Return pip requirement lines for a function, or the ``-r`` option
+        for its requirements file.
+
+        :param str project_dir: The directory containing the requirements
+            files
+
+        :rtype: list
+
+        :raises PossumException: If the requirements can't be installed
+            with pip
+        """
+        lockfile = os.path.join(project_dir, 'Pipfile.lock')
+        requirements_file = os.path.join(project_dir, 'requirements.txt')
+        pipfile = os.path.join(project_dir, 'Pipfile')
+
+        if os.path.isfile(lockfile):
+            online = not self.find_links
+            return get_lockfile_requirements(
+                lockfile, hashes=online, index=online)
+        elif os.path.isfile(requirements_file):
+            return ['-r', requirements_file]
+        elif os.path.isfile(pipfile):
+            return get_pipfile_requirements(pipfile)
+        else:
+            return list()
+
+    def pip_command(self, target_dir):
+        command = [
+            self.python_path, '-m', 'pip', 'install',
+            '--target', target_dir,
+            '--disable-pip-version-check',
+            '--no-input',
+            '--no-compile',
+            '--quiet'
+        ]
+
+        if self.find_links:
+            command += ['--no-index', '--find-links', self.find_links]
+
+        return command
+
+    def install(self, project_dir, target_dir):
+        requirements = self.get_requirements(project_dir)
+        if not requirements:
+            return
+
+        requirements_file = None
+        if requirements[0] != '-r':
+            # Write specifiers to a file so long lock files do not exceed the
+            # command line length limit.
+            with tempfile.NamedTemporaryFile(
+                    'w', prefix='possum-', suffix='.txt',
+                    delete=False) as f_obj:
+                f_obj.write('\n'.join(requirements) + '\n')
+
+            requirements_file = f_obj.name
+            requirements = ['-r', requirements_file]
+
+        try:
+            returncode, stdout, stderr = self.run_command(
+                self.pip_command(target_dir) + requirements, project_dir)
+        finally:
+            if requirements_file:
+                os.remove(requirements_file)
+
+        if returncode != 0:
+            raise InstallerError(stderr.strip() or stdout.strip())
+
+    def run_command(self, command, cwd):
+        """Run the pip command.
+
+        :returns: The exit code and the stdout and stderr of the command
+        :rtype: tuple
+        """
+        p = subprocess.run(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            cwd=cwd,
+            universal_newlines=True
+        )
+        return p.returncode, p.stdout, p.stderr
+
+
+class DockerPipInstaller(PipInstaller):
+    """Installs requirements with pip inside a running build container from a
+    ``BuildContainerPool``, so packages with C extensions are built against
+    the container's Lambda-like environment while Possum runs on the host.
+
+    The function's directory, the target directory and the temporary
+    directory must be mounted at the same paths in the container.
+
+    :param str container: The ID of the container
+    :param str python_path: The interpreter in the container
+    :param str user: The user (or ``uid:gid``) to install as, so installed
+        files are owned by the user running Possum
+    :param str cache_dir: A mounted directory for pip's cache
+    :param str find_links: A mounted wheelhouse directory to install from
+    """
+    name = 'docker-pip'
+
+    def __init__(self, container, python_path='python', user=None,
+                 cache_dir=None, find_links=None):
+        super().__init__(python_path, find_links)
+        self.container = container
+        self.user = user
+        self.cache_dir = cache_dir
+
+    def run_command(self, command, cwd):
+        # A user without an entry in the image's passwd has no usable home
+        environment = {'HOME': tempfile.gettempdir()}
+        if self.cache_dir:
+            environment['PIP_CACHE_DIR'] = os.path.join(self.cache_dir, 'pip')
+
+        return exec_in_container(
+            self.container,
+            command,
+            workdir=cwd,
+            user=self.user,
+            environment=environment
+        )
+
+
+def get_lambda_platforms(runtime, architecture='x86_64'):
+    """Return the wheel platform tags a Lambda runtime can run, most specific
+    first.
+
+    :param str runtime: The Lambda runtime, such as 'python3.11'
+    :param str architecture: The Lambda architecture, 'x86_64' or 'arm64'
+
+    :rtype: list
+    """
+    version = get_runtime_version(runtime)
+    if not version:
+        raise InstallerError(f"'{runtime}' is not a Python runtime")
+
+    try:
+        machine = LAMBDA_MACHINES[architecture]
+    except KeyError:
+        raise InstallerError(f"Unknown architecture '{architecture}'")
+
+    glibc = LAMBDA_GLIBC[1] if version >= (3, 12) else LAMBDA_GLIBC[0]
+
+    platforms = [
+        f'manylinux_2_{i}_{machine}' for i in range(glibc, 16, -1)
+    ]
+    platforms.append(f'manylinux2014_{machine}')
+    if machine == 'x86_64':
+        platforms += ['manylinux2010_x86_64', 'manylinux1_x86_64']
+
+    # Wheels built in the fallback container are tagged for plain Linux
+    platforms.append(f'linux_{machine}')
+    return platforms
+
+
+def _requirement_key(line):
+    """Return a requirement line without its markers and options, as pip
+    names it in error messages.
+    """
+    return line.split(' --hash=')[0].split(';')[0].strip()
+
+
+def _sha256_file(path):
+    file_hash = hashlib.sha256()
+    with open(path, 'rb') as f_obj:
+        for chunk in iter(lambda: f_obj.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+
+    return file_hash.hexdigest()
+
+
+class PlatformPipInstaller(PipInstaller):
+    """Installs binary wheels built for the function's Lambda runtime and
+    architecture with ``pip install --platform``, whatever platform Possum
+    runs on.
+
+    Distributions without a compatible wheel are built as wheels in a
+    container from ``fallback_image`` and the install is retried with them;
+    their requirements are listed in ``fallbacks``. Without a fallback image
+    the install fails instead. When the lock's hashes are checked, the wheel
+    is built from the hash-checked distribution and its own hash is allowed
+    for the retry.
+
+    :param str runtime: The Lambda runtime, such as 'python3.11'
+    :param str architecture: The Lambda architecture, 'x86_64' or 'arm64'
+    :param str fallback_image: The Docker image to build wheels in
+    :param str python_path: The interpreter to run pip with
+    :param str find_links: A wheelhouse directory to install from instead of
+        the package index
+    """
+    name = 'pip-platform'
+
+    def __init__(self, runtime, architecture='x86_64', fallback_image=None,
+                 python_path=None, find_links=None):
+        super().__init__(python_path, find_links)
+        self.runtime = runtime
+        self.architecture = architecture
+        self.fallback_image = fallback_image
+        self.platforms = get_lambda_platforms(runtime, architecture)
+        self.fallbacks = list()
+        self._fallback_dir = None
+        self._fallback_hashes = dict()
+
+    def pip_command(self, target_dir):
+        major, minor = get_runtime_version(self.runtime)
+        command = super().pip_command(target_dir) + [
+            '--implementation', 'cp',
+            '--python-version', f'{major}.{minor}',
+            '--abi', f'cp{major}{minor}',
+            '--only-binary', ':all:'
+        ]
+
+        for platform in self.platforms:
+            command += ['--platform', platform]
+
+        if self._fallback_dir:
+            command += ['--find-links', self._fallback_dir]
+
+        return command
+
+    def get_requirements(self, project_dir):
+        requirements = super().get_requirements(project_dir)
+        if not self._fallback_hashes:
+            return requirements
+
+        lines = list()
+        for line in requirements:
+            wheel_hashes = self._fallback_hashes.get(_requirement_key(line))
+            if wheel_hashes and ' --hash=' in line:
+                line = ' '.join(
+                    [line] + [f'--hash=sha256:{i}' for i in wheel_hashes])
+            lines.append(line)
+
+        return lines
+
+    def build_wheel(self, requirement, wheel_dir, project_dir):
+        """Build a wheel for a single requirement in a container from the
+        fallback image. The requirement's line and the index options from
+        the function's requirements are used, so the distribution is
+        hash-checked if the line has hashes.
+
+        :param str requirement: The pip requirement specifier
+        :param str wheel_dir: The directory to write the wheel to
+        :param str project_dir: The directory containing the requirements
+            files
+
+        :returns: The SHA256 digests of the wheels that were built
+        :rtype: list
+        """
+        requirements = super().get_requirements(project_dir)
+        lines = [i for i in requirements if i.startswith('--')]
+        lines.append(next(
+            (i for i in requirements if _requirement_key(i) == requirement),
+            requirement
+        ))
+        existing = set(os.listdir(wheel_dir))
+
+        requirements_file = os.path.join(wheel_dir, 'requirements.txt')
+        with open(requirements_file, 'w') as f_obj:
+            f_obj.write('\n'.join(lines) + '\n')
+
+        try:
+            returncode, stdout, stderr = run_container(
+                self.fallback_image,
+                [
+                    'python', '-m', 'pip', 'wheel',
+                    '--no-deps',
+                    '--disable-pip-version-check',
+                    '--no-input',
+                    '--quiet',
+                    '--wheel-dir', wheel_dir,
+                    '-r', requirements_file
+                ],
+                pull=True,
+                platform=DOCKER_PLATFORMS[self.architecture],
+                volumes={wheel_dir: {'bind': wheel_dir, 'mode': 'rw'}},
+                environment={'HOME': '/tmp'},
+                user=f'{os.getuid()}:{os.getgid()}'
+                if hasattr(os, 'getuid') else ''
+            )
+        finally:
+            os.remove(requirements_file)
+
+        if returncode != 0:
+            raise InstallerError(
+                f"'{requirement}' could not be built in "
+                f"'{self.fallback_image}': "
+                f"{stderr.strip() or stdout.strip()}")
+
+        return [
+            _sha256_file(os.path.join(wheel_dir, i))
+            for i in sorted(set(os.listdir(wheel_dir)) - existing)
+            if i.endswith('.whl')
+        ]
+
+    def install(self, project_dir, target_dir):
+        self.fallbacks = list()
+        self._fallback_hashes = dict()
+        try:
+            while True:
+                try:
+                    super().install(project_dir, target_dir)
+                    return
+                except InstallerError as error:
+                    match = MISSING_DISTRIBUTION.search(str(error))
+                    if not match or not self.fallback_image:
+                        raise
+
+                    requirement = match.group(1).strip()
+                    if requirement in self.fallbacks:
+                        raise
+
+                # pip installs nothing into the target when it fails
+                self.fallbacks.append(requirement)
+                if not self._fallback_dir:
+                    self._fallback_dir = tempfile.mkdtemp(
+                        prefix='possum-fallback-')
+
+                with tracer.span('fallback build', requirement=requirement):
+                    self._fallback_hashes[requirement] = self.build_wheel(
+                        requirement, self._fallback_dir, project_dir)
+        finally:
+            if self._fallback_dir:
+                shutil.rmtree(self._fallback_dir, ignore_errors=True)
+                self._fallback_dir = None
+
+
+class PipenvInstaller(Installer):
+    """Installs requirements by creating a pipenv virtual environment,
+    installing into it, and moving the newly installed packages out of its
+    'site-packages' directory.
+
+    pipenv writes to the project it is run against, so the requirements
+    files are copied to a scratch directory first.
+
+    :param str find_links: A wheelhouse directory to install from instead of
+        the package index
+    """
+    name = 'pipenv'
+
+    def __init__(self, find_links=None):
+        self.find_links = find_links
+
+    def install(self, project_dir, target_dir):
+        scratch_dir = tempfile.mkdtemp(prefix='possum-pipenv-')
+        for name in get_requirements_files(project_dir):
+            shutil.copy2(os.path.join(project_dir, name), scratch_dir)
+
+        pipenvw = PipenvWrapper(scratch_dir, self.find_links)
+        pipenvw.create_virtual_environment()
+
+        try:
+            site_packages_path = get_site_packages_path(pipenvw.venv_path)
+            do_not_copy = get_existing_site_packages(pipenvw.venv_path)
+
+            pipenvw.install_packages()
+            move_installed_packages(site_packages_path, do_not_copy, target_dir)
+        finally:
+            pipenvw.remove_virtualenv()
+            shutil.rmtree(scratch_dir, ignore_errors=True)
+
+
+INSTALLERS = {
+    PipInstaller.name: PipInstaller,
+    PlatformPipInstaller.name: PlatformPipInstaller,
+    PipenvInstaller.name: PipenvInstaller,
+    DockerPipInstaller.name: DockerPipInstaller
+}
+
+
+def get_installer(name, **options):
+    """Return an instance of a registered installer backend.
+
+    :param str name: The name of the installer
+    :param options: Keyword arguments for the installer
+
+    :rtype: Installer
+    """
+    try:
+        installer_class = INSTALLERS[name]
+    except KeyError:
+        raise InstallerError(f"Unknown installer '{name}'")
+
+    return installer_class(**options)
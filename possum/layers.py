@@ -0,0 +1,120 @@
+import hashlib
+import os
+
+from possum.utils import get_requirements_files, hash_local_requirements
+
+__all__ = [
+    'MAX_FUNCTION_LAYERS',
+    'attach_layer',
+    'can_attach_layer',
+    'find_shared_dependencies',
+    'get_layer_key',
+    'set_layer_resource'
+]
+
+# Lambda functions can use at most five layers
+MAX_FUNCTION_LAYERS = 5
+
+
+def get_layer_key(source_dir, runtime, architecture, installer):
+    """Return a key identifying the dependency set of a function. Functions
+    with the same key install exactly the same packages. The key covers the
+    contents of local packages in a Pipfile.lock, so a layer including them
+    is rebuilt when they change.
+
+    :param str source_dir: The function's source directory
+    :param str runtime: The function's Lambda runtime
+    :param str architecture: The function's Lambda architecture
+    :param str installer: The name of the installer backend
+
+    :returns: The key, or ``None`` if the function has no requirements
+    :rtype: str
+    """
+    names = get_requirements_files(source_dir)
+    if not names:
+        return None
+
+    key_hash = hashlib.sha256()
+    for value in (runtime or '', architecture or '', installer or ''):
+        key_hash.update(value.encode() + b'\0')
+
+    for name in names:
+        key_hash.update(name.encode() + b'\0')
+        with open(os.path.join(source_dir, name), 'rb') as f_obj:
+            key_hash.update(f_obj.read())
+
+    key_hash.update(hash_local_requirements(source_dir).encode())
+    return key_hash.hexdigest()
+
+
+def find_shared_dependencies(functions, installer):
+    """Group functions that install an identical dependency set. Only sets
+    shared by two or more functions are returned.
+
+    :param list functions: Tuples of each function's logical ID, source
+        directory, runtime and architecture
+    :param str installer: The name of the installer backend
+
+    :returns: Each shared set's key mapped to the runtime, architecture and
+        logical IDs (in the given order) of the functions that share it
+    :rtype: dict
+    """
+    groups = dict()
+
+    for func, source_dir, runtime, architecture in functions:
+        key = get_layer_key(source_dir, runtime, architecture, installer)
+        if not key:
+            continue
+
+        group = groups.setdefault(key, {
+            'runtime': runtime,
+            'architecture': architecture,
+            'functions': list()
+        })
+        group['functions'].append(func)
+
+    return {k: v for k, v in groups.items() if len(v['functions']) > 1}
+
+
+def can_attach_layer(template, func):
+    """Return whether a function has room for another layer.
+
+    :param dict template: The loaded SAM template
+    :param str func: The logical ID of the function
+
+    :rtype: bool
+    """
+    properties = template['Resources'][func]['Properties']
+    return len(properties.get('Layers') or list()) < MAX_FUNCTION_LAYERS
+
+
+def set_layer_resource(template, layer_id, s3_uri, runtime, architecture):
+    """Add (or replace) a layer resource in the template.
+
+    :param dict template: The loaded SAM template
+    :param str layer_id: The logical ID of the layer
+    :param str s3_uri: The S3 URI of the layer's artifact
+    :param str runtime: The Lambda runtime the layer is built for
+    :param str architecture: The Lambda architecture the layer is built for
+    """
+    template['Resources'][layer_id] = {
+        'Type': 'AWS::Serverless::LayerVersion',
+        'Properties': {
+            'ContentUri': s3_uri,
+            'CompatibleRuntimes': [runtime],
+            'CompatibleArchitectures': [architecture]
+        }
+    }
+
+
+def attach_layer(template, func, layer_id):
+    """Add a layer to a function in the template.
+
+    :param dict template: The loaded SAM template
+    :param str func: The logical ID of the function
+    :param str layer_id: The logical ID of the layer
+    """
+    properties = template['Resources'][func]['Properties']
+    properties['Layers'] = list(properties.get('Layers') or list()) + [
+        {'Ref': layer_id}
+    ]
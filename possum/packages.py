@@ -1,81 +1,649 @@
-import distutils.sysconfig as sysconfig
+import concurrent.futures
+import glob
+import hashlib
+import io
 import os
 import shutil
+import stat
 import sys
+import threading
+import time
 import uuid
-import zipfile
 
 import boto3
 from boto3.exceptions import S3UploadFailedError
-from botocore.exceptions import ClientError, NoCredentialsError
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError, NoCredentialsError
+from s3transfer.manager import TransferManager
 
 from possum.config import logger
+from possum.exc import PossumException
+from possum.trace import tracer
+from possum.utils.general import hash_file
+from possum.utils.hashing import walk_files
+from possum.utils.zip_ import ArchiveEntry, write_archive
 
 
 __all__ = [
+    'get_site_packages_path',
     'get_existing_site_packages',
     'move_installed_packages',
+    'store_artifact',
+    'collect_package_entries',
+    'write_lambda_archive',
+    'LambdaArtifact',
     'create_lambda_package',
+    'stream_lambda_package',
+    'HashingWriter',
+    'S3MultipartWriter',
+    'ArtifactUploader',
     'upload_packages'
 ]
 
+MB = 1024 * 1024
+
+# The earliest timestamp a zip archive can store
+ZIP_EPOCH = 315532800
+
+
+def get_site_packages_path(venv_path):
+    """Return the 'site-packages' directory of a virtual environment. The
+    environment's Python version is not assumed to match the one running
+    Possum.
+
+    :param str venv_path: The root of the virtual environment
+
+    :rtype: str
+    """
+    matches = glob.glob(
+        os.path.join(venv_path, 'lib', 'python*', 'site-packages'))
+    return matches[0] if matches else os.path.join(
+        venv_path, 'lib', 'python3', 'site-packages')
+
 
 def get_existing_site_packages(venv_path):
-    path = os.path.join(
-        venv_path,
-        'lib',
-        'python' + sysconfig.get_python_version(),
-        'site-packages'
-    )
-    return os.listdir(path)
-
-
-# def move_installed_packages(venv_path, exclusions):
-def move_installed_packages(site_packages_path, exclusions):
-    # path = os.path.join(venv_path, 'lib/python3.6/site-packages')
+    return os.listdir(get_site_packages_path(venv_path))
+
+
+def move_installed_packages(site_packages_path, exclusions, dest_dir):
     packages = [i for i in os.listdir(site_packages_path) if i not in exclusions]
     for package in packages:
         shutil.move(
             os.path.join(site_packages_path, package),
-            os.path.join(os.getcwd(), package)
+            os.path.join(dest_dir, package)
         )
 
 
-def create_lambda_package(build_dir, artifact_directory):
-    archive_name = uuid.uuid4().hex
-    path_len = len(build_dir)
+def store_artifact(path, suffix=''):
+    """Rename a finished artifact to the digest of its contents so identical
+    artifacts always map to the same S3 key.
+
+    :param str path: The path to the finished artifact
+    :param str suffix: Optional suffix to append to the digest
+
+    :returns: The new name of the artifact
+    :rtype: str
+    """
+    artifact_name = hash_file(path) + suffix
+    os.replace(path, os.path.join(os.path.dirname(path), artifact_name))
+    return artifact_name
+
+
+def get_archive_date_time():
+    """Return the fixed timestamp written to every entry of a reproducible
+    archive. ``SOURCE_DATE_EPOCH`` is honoured if set, otherwise the earliest
+    timestamp a zip file can store is used.
+
+    :rtype: tuple
+    """
+    try:
+        timestamp = int(os.environ['SOURCE_DATE_EPOCH'])
+    except (KeyError, ValueError):
+        timestamp = ZIP_EPOCH
+
+    return time.gmtime(max(timestamp, ZIP_EPOCH))[:6]
+
+
+class HashingWriter(io.RawIOBase):
+    """A write-only, unseekable stream that hashes everything written to it
+    and passes it on to ``fileobj`` if one is given.
+
+    Archives are always written through this stream so the artifact digest
+    is known as soon as the archive is complete, wherever it was written to.
+
+    :param fileobj: Optional writable object to pass the data on to
+    """
+    def __init__(self, fileobj=None):
+        super().__init__()
+        self.fileobj = fileobj
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.hash.update(b)
+        self.size += len(b)
+        if self.fileobj:
+            self.fileobj.write(b)
+        return len(b)
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """A write-only stream that uploads its data to S3 as a multipart upload
+    while it is being written.
+
+    Data is buffered until a full part is available. At most
+    ``max_concurrency`` parts are uploaded at a time and writes block while
+    that many are in flight, so memory use is bounded to roughly
+    ``part_size * (max_concurrency + 1)``. Objects smaller than one part are
+    sent with a single ``PutObject`` request.
+
+    :param s3_client: A boto3 S3 client
+    :param str bucket_name: The S3 bucket to upload to
+    :param str key: The key of the object to create
+    :param int part_size: The size in bytes of each part
+    :param int max_concurrency: The number of parts to upload at once
+    """
+    def __init__(self, s3_client, bucket_name, key, part_size=8 * MB,
+                 max_concurrency=10):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.part_size = part_size
+
+        self.upload_id = None
+        self._buffer = bytearray()
+        self._part_number = 0
+        self._futures = list()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_concurrency)
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buffer.extend(b)
+        while len(self._buffer) >= self.part_size:
+            self._submit_part(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(b)
+
+    def _submit_part(self, data):
+        if not self.upload_id:
+            self.upload_id = self.s3_client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key)['UploadId']
 
-    with zipfile.ZipFile(os.path.join(artifact_directory, archive_name),
-                         'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for root, dirs, files in os.walk(build_dir):
-            base_dir = root[path_len:]
-            for file in files:
-                zip_file.write(
-                    os.path.join(root, file),
-                    os.path.join(base_dir, file)
+        # Failed parts are raised now instead of after the whole archive
+        for future in self._futures:
+            if future.done() and future.exception():
+                raise future.exception()
+
+        self._slots.acquire()
+        self._part_number += 1
+        self._futures.append(
+            self._executor.submit(self._upload_part, self._part_number, data))
+
+    def _upload_part(self, part_number, data):
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=data
+            )
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    def complete(self):
+        """Upload any remaining data and complete the upload. If the upload
+        can't be completed it is aborted, so no parts are left in the
+        bucket.
+        """
+        try:
+            if not self.upload_id:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=self.key,
+                    Body=bytes(self._buffer)
                 )
+                return
+
+            if self._buffer or not self._futures:
+                self._submit_part(bytes(self._buffer))
+            self._buffer = bytearray()
+
+            parts = [i.result() for i in self._futures]
+            self.s3_client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self):
+        """Cancel the upload and discard any parts already sent."""
+        self._executor.shutdown(wait=True)
+        if not self.upload_id:
+            return
+
+        try:
+            self.s3_client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+        except (ClientError, BotoCoreError) as err:
+            logger.warning(f'The incomplete upload of {self.key} could not '
+                           f'be aborted: {err}')
+
+
+def collect_package_entries(package_dirs):
+    """Overlay the files of one or more directories into a single list of
+    archive entries. Directories are applied in order and the first
+    directory to provide a path wins, so no files need to be copied into a
+    combined build directory.
+
+    :param package_dirs: A directory, or a list of directories, to overlay
+
+    :returns: Sorted tuples of the archive name, the path of the file to
+        read and its ``os.stat_result``
+    :rtype: list
+    """
+    if isinstance(package_dirs, str):
+        package_dirs = [package_dirs]
+
+    entries = dict()
+    for package_dir in package_dirs:
+        for arcname, file_path, file_stat in walk_files(package_dir):
+            entries.setdefault(arcname, (arcname, file_path, file_stat))
+
+    return [entries[i] for i in sorted(entries)]
+
+
+def write_lambda_archive(entries, fileobj, reproducible=True,
+                         compression_level=6, compression_jobs=None):
+    """Zip a list of entries into a writable stream.
+
+    In reproducible mode entries are written with a fixed timestamp and
+    normalized permissions (``0644``, or ``0755`` for executables), so
+    identical inputs produce byte-identical archives.
+
+    Files are deflated in parallel threads and already compressed content
+    (by extension, or judged by compressing a sample) is stored as-is.
+
+    :param list entries: Entries from ``collect_package_entries``
+    :param fileobj: The writable stream to write the archive to
+    :param bool reproducible: Write a reproducible archive
+    :param int compression_level: The deflate compression level (0-9)
+    :param int compression_jobs: The number of compression threads
+
+    :returns: Tuples of the archive name, uncompressed size and compressed
+        size of each file
+    :rtype: list
+    """
+    date_time = get_archive_date_time()
+
+    def archive_entries():
+        for arcname, file_path, file_stat in entries:
+            if reproducible:
+                mode = 0o755 if file_stat.st_mode & 0o111 else 0o644
+                entry_date_time = date_time
+            else:
+                mode = stat.S_IMODE(file_stat.st_mode)
+                entry_date_time = time.localtime(
+                    max(file_stat.st_mtime, ZIP_EPOCH))[:6]
+
+            yield ArchiveEntry(
+                arcname, file_path, file_stat.st_size, entry_date_time, mode)
+
+    return write_archive(
+        archive_entries(), fileobj, compression_level, compression_jobs)
+
+
+class LambdaArtifact:
+    """A Lambda package that has been created.
+
+    :param str name: The name of the artifact (the digest of the archive)
+    :param int size: The size of the archive in bytes
+    :param list file_sizes: Tuples of the archive name, uncompressed size and
+        compressed size of each file in the archive
+    """
+    def __init__(self, name, size, file_sizes):
+        self.name = name
+        self.size = size
+        self.file_sizes = file_sizes
+
 
-    return archive_name
+def create_lambda_package(entries, artifact_directory, **archive_options):
+    """Zip a list of package entries into a Lambda artifact named after the
+    digest of the archive.
 
+    :param list entries: Entries from ``collect_package_entries``
+    :param str artifact_directory: The directory to write the artifact to
+    :param archive_options: Options for ``write_lambda_archive``
 
-def upload_packages(package_directory, bucket_name,
-                    bucket_dir, profile_name=None):
-    session = boto3.Session(profile_name=profile_name)
-    s3_client = session.resource('s3')
+    :rtype: LambdaArtifact
+    """
+    # The archive is written under a temporary name and renamed once its
+    # content digest is known.
+    archive_path = os.path.join(artifact_directory, f'.{uuid.uuid4().hex}')
 
-    os.chdir(package_directory)
-    logger.info(f'Uploading all Lambda packages to: {bucket_dir}')
+    with tracer.span('zip', files=len(entries)) as span, \
+            open(archive_path, 'wb') as f_obj:
+        writer = HashingWriter(f_obj)
+        file_sizes = write_lambda_archive(entries, writer, **archive_options)
+        span['bytes'] = writer.size
 
-    for artifact in os.listdir('.'):
-        logger.info(f'Uploading package: {artifact}')
+    artifact_name = writer.hexdigest()
+    os.replace(archive_path, os.path.join(artifact_directory, artifact_name))
+    return LambdaArtifact(artifact_name, writer.size, file_sizes)
+
+
+def stream_lambda_package(entries, uploader, **archive_options):
+    """Zip a list of package entries straight into S3 without writing the
+    archive to disk.
+
+    The archive is compressed once, into a multipart upload under a
+    temporary key, and hashed as it is written. The finished object is then
+    copied within the bucket to the key named after its digest, unless that
+    artifact is already stored, and the temporary object is deleted.
+
+    :param list entries: Entries from ``collect_package_entries``
+    :param ArtifactUploader uploader: The uploader for the run
+    :param archive_options: Options for ``write_lambda_archive``
+
+    :rtype: LambdaArtifact
+    """
+    with tracer.span('zip (upload)', files=len(entries)) as span:
+        s3_writer = uploader.multipart_writer(f'.{uuid.uuid4().hex}')
+        try:
+            writer = HashingWriter(s3_writer)
+            file_sizes = write_lambda_archive(
+                entries, writer, **archive_options)
+        except BaseException:
+            s3_writer.abort()
+            raise
+
+        s3_writer.complete()
+        span['bytes'] = writer.size
+
+    artifact = LambdaArtifact(writer.hexdigest(), writer.size, file_sizes)
+    if not uploader.move_to_artifact(s3_writer.key, artifact.name):
+        logger.info(f'Package already in S3, skipping: {artifact.name}')
+
+    return artifact
+
+
+class ArtifactUploader:
+    """Uploads Lambda artifacts to S3. A single client and transfer manager
+    are shared by every upload in the run.
+
+    Large artifacts are sent as multipart uploads of ``multipart_chunksize``
+    bytes with up to ``max_concurrency`` parts in flight at a time, while up
+    to ``max_workers`` artifacts are uploaded at once. A failed upload is
+    retried ``retries`` times with an exponential backoff.
+
+    :param str bucket_name: The S3 bucket to upload to
+    :param str bucket_dir: The path within the bucket to upload to
+    :param str profile_name: Optional profile name for AWS credentials
+    :param int max_workers: The number of artifacts to upload at once
+    :param int multipart_chunksize: The size in bytes of each multipart part
+    :param int max_concurrency: The number of parts to upload at once
+    :param int retries: The number of times to retry a failed upload
+    :param float backoff: The delay in seconds before the first retry
+    :param bool skip_existing: Do not upload artifacts already in the bucket
+    :param str endpoint_url: Optional S3 endpoint (e.g. a local stand-in)
+    :param s3_client: Optional pre-configured boto3 S3 client to use
+    """
+    def __init__(self, bucket_name, bucket_dir, profile_name=None,
+                 max_workers=4, multipart_chunksize=8 * MB, max_concurrency=10,
+                 retries=3, backoff=1.0, skip_existing=True, endpoint_url=None,
+                 s3_client=None):
+        self.bucket_name = bucket_name
+        self.bucket_dir = bucket_dir
+        self.max_workers = max(1, max_workers)
+        self.multipart_chunksize = multipart_chunksize
+        self.max_concurrency = max_concurrency
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.skip_existing = skip_existing
+
+        if not s3_client:
+            session = boto3.Session(profile_name=profile_name)
+            s3_client = session.client(
+                's3',
+                endpoint_url=endpoint_url,
+                config=Config(
+                    max_pool_connections=self.max_workers * max_concurrency)
+            )
+
+        self.s3_client = s3_client
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_chunksize,
+            multipart_chunksize=multipart_chunksize,
+            max_concurrency=max_concurrency,
+            use_threads=True
+        )
+        self._transfer_manager = None
+        self._existing_keys = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def transfer_manager(self):
+        if not self._transfer_manager:
+            self._transfer_manager = TransferManager(
+                self.s3_client, self.transfer_config)
+        return self._transfer_manager
+
+    def close(self):
+        if self._transfer_manager:
+            self._transfer_manager.shutdown()
+            self._transfer_manager = None
+
+    def get_key(self, artifact):
+        return f'{self.bucket_dir}/{artifact}'
+
+    def list_existing_keys(self):
+        """Return the keys already stored under the bucket path using a
+        single batched listing. ``None`` is returned if the bucket cannot be
+        listed with the current credentials.
+
+        :rtype: set
+        """
+        if self._existing_keys is None:
+            keys = set()
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            try:
+                for page in paginator.paginate(
+                        Bucket=self.bucket_name, Prefix=f'{self.bucket_dir}/'):
+                    keys.update(i['Key'] for i in page.get('Contents', []))
+            except ClientError:
+                # Fall back to checking each artifact individually
+                keys = False
+
+            self._existing_keys = keys
+
+        if self._existing_keys is False:
+            return None
+        return self._existing_keys
+
+    def artifact_exists(self, artifact):
+        """Check whether an artifact is already stored under the bucket path.
+        The listing from ``list_existing_keys`` is used if it was made,
+        otherwise only the artifact's own key is checked.
+
+        :param str artifact: The name of the artifact
+
+        :rtype: bool
+        """
+        key = self.get_key(artifact)
+
+        if isinstance(self._existing_keys, set):
+            return key in self._existing_keys
+
+        try:
+            self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as err:
+            if err.response['Error']['Code'] in \
+                    ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+        return True
+
+    def record_upload(self, key):
+        """Note that a key now exists so later checks in this run skip it."""
+        if isinstance(self._existing_keys, set):
+            self._existing_keys.add(key)
+
+    def move_to_artifact(self, key, artifact):
+        """Copy an object within the bucket to an artifact's key and delete
+        the original. The copy is skipped if the artifact is already stored
+        (and ``skip_existing`` is set).
+
+        :param str key: The key of the object to move
+        :param str artifact: The name of the artifact
+
+        :returns: Whether the object was copied
+        :rtype: bool
+        """
+        artifact_key = self.get_key(artifact)
         try:
-            s3_client.Bucket(bucket_name).upload_file(
-                artifact, os.path.join(bucket_dir, artifact))
-        except NoCredentialsError:
-            logger.error('Unable to upload packages to the S3 bucket. Boto3 '
-                         'was unable to locate credentials!')
-            sys.exit(1)
-        except (S3UploadFailedError, ClientError)as err:
-            logger.error('Failed to upload the package to the S3 bucket! '
-                         f'Encountered:\n{err}')
-            sys.exit(1)
+            if self.skip_existing and self.artifact_exists(artifact):
+                return False
+
+            with tracer.span('copy', artifact=artifact):
+                self.s3_client.copy_object(
+                    Bucket=self.bucket_name,
+                    Key=artifact_key,
+                    CopySource={'Bucket': self.bucket_name, 'Key': key}
+                )
+            self.record_upload(artifact_key)
+            return True
+        finally:
+            try:
+                self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+            except (ClientError, BotoCoreError) as err:
+                logger.warning(f'The temporary object {key} could not be '
+                               f'deleted: {err}')
+
+    def multipart_writer(self, artifact):
+        """Return a stream that uploads an artifact as it is written.
+
+        :param str artifact: The name of the artifact
+
+        :rtype: S3MultipartWriter
+        """
+        return S3MultipartWriter(
+            self.s3_client,
+            self.bucket_name,
+            self.get_key(artifact),
+            self.multipart_chunksize,
+            self.max_concurrency
+        )
+
+    def upload_file(self, path, artifact=None):
+        """Upload a single file, retrying on failure.
+
+        :param str path: The path to the file to upload
+        :param str artifact: The object name (defaults to the file name)
+
+        :returns: The S3 key of the uploaded artifact
+        :rtype: str
+        """
+        key = self.get_key(artifact or os.path.basename(path))
+
+        attempt = 0
+        while True:
+            try:
+                with tracer.span('upload', artifact=os.path.basename(key),
+                                 bytes=os.path.getsize(path),
+                                 attempt=attempt + 1):
+                    self.transfer_manager.upload(
+                        path, self.bucket_name, key).result()
+                self.record_upload(key)
+                return key
+            except NoCredentialsError:
+                raise
+            except (S3UploadFailedError, ClientError, BotoCoreError):
+                if attempt >= self.retries:
+                    raise
+
+                delay = self.backoff * (2 ** attempt)
+                attempt += 1
+                logger.warning(f'Upload of {key} failed, retrying in '
+                               f'{delay:g}s ({attempt}/{self.retries})...')
+                time.sleep(delay)
+
+    def upload_directory(self, package_directory):
+        """Upload every file in a directory concurrently.
+
+        :param str package_directory: The directory containing the artifacts
+
+        :returns: The S3 keys of the uploaded artifacts
+        :rtype: list
+        """
+        artifacts = sorted(os.listdir(package_directory))
+        logger.info(f'Uploading all Lambda packages to: {self.bucket_dir}')
+
+        def upload(artifact):
+            if self.skip_existing and self.artifact_exists(artifact):
+                logger.info(f'Package already in S3, skipping: {artifact}')
+                return self.get_key(artifact)
+
+            logger.info(f'Uploading package: {artifact}')
+            return self.upload_file(
+                os.path.join(package_directory, artifact), artifact)
+
+        if self.skip_existing:
+            with tracer.span('list existing artifacts'):
+                self.list_existing_keys()
+
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            return list(pool.map(upload, artifacts))
+
+
+def upload_packages(package_directory, bucket_name, bucket_dir,
+                    profile_name=None, uploader=None, **uploader_options):
+    """Upload all artifacts in a directory to S3.
+
+    :param str package_directory: The directory containing the artifacts
+    :param str bucket_name: The S3 bucket to upload to
+    :param str bucket_dir: The path within the bucket to upload to
+    :param str profile_name: Optional profile name for AWS credentials
+    :param ArtifactUploader uploader: An uploader to reuse instead of
+        creating one (optional)
+    :param uploader_options: Additional ``ArtifactUploader`` options
+    """
+    try:
+        if uploader:
+            uploader.upload_directory(package_directory)
+            return
+
+        with ArtifactUploader(bucket_name, bucket_dir, profile_name,
+                              **uploader_options) as uploader:
+            uploader.upload_directory(package_directory)
+    except NoCredentialsError:
+        logger.error('Unable to upload packages to the S3 bucket. Boto3 '
+                     'was unable to locate credentials!')
+        sys.exit(1)
+    except (S3UploadFailedError, ClientError, BotoCoreError) as err:
+        logger.error('Failed to upload the package to the S3 bucket! '
+                     f'Encountered:\n{err}')
+        sys.exit(1)
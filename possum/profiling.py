@@ -0,0 +1,171 @@
+import os
+import re
+import subprocess
+import zipfile
+
+from possum.exc import PossumException
+from possum.utils import run_container
+
+__all__ = [
+    'get_handler_module',
+    'parse_import_times',
+    'get_top_imports',
+    'extract_package',
+    'profile_handler_import',
+    'profile_handler_import_in_docker'
+]
+
+# Written to stderr just before the handler is imported so the modules
+# imported while the interpreter starts up can be told apart.
+IMPORT_MARKER = 'possum: importing handler'
+
+# Imports the handler module and prints the wall time it took in seconds.
+# Arguments: the package directory and the module name.
+IMPORT_SCRIPT = f'''\
+import sys, time
+sys.path.insert(0, sys.argv[1])
+sys.stderr.write('{IMPORT_MARKER}\\n')
+sys.stderr.flush()
+start = time.perf_counter()
+__import__(sys.argv[2])
+print(time.perf_counter() - start)
+'''
+
+IMPORT_TIME_PATTERN = re.compile(
+    r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)\s*$')
+
+
+def get_handler_module(handler):
+    """Return the module Lambda imports for a handler such as
+    'pkg/app.handler'.
+
+    :param str handler: The function's ``Handler`` property
+
+    :rtype: str
+    """
+    return handler.rsplit('.', 1)[0].replace('/', '.')
+
+
+def parse_import_times(output):
+    """Parse the ``-X importtime`` output of a handler import. Only modules
+    imported after the handler import started are returned.
+
+    :param str output: The interpreter's stderr
+
+    :returns: Dictionaries of the module name, nesting depth and the self
+        and cumulative import times in microseconds, in the order they
+        finished importing
+    :rtype: list
+    """
+    lines = output.splitlines()
+    if IMPORT_MARKER in lines:
+        lines = lines[lines.index(IMPORT_MARKER) + 1:]
+
+    imports = list()
+    for line in lines:
+        match = IMPORT_TIME_PATTERN.match(line)
+        if not match:
+            continue
+
+        imports.append({
+            'module': match.group(4),
+            'depth': (len(match.group(3)) - 1) // 2,
+            'self_us': int(match.group(1)),
+            'cumulative_us': int(match.group(2))
+        })
+
+    return imports
+
+
+def get_top_imports(imports, count=10):
+    """Return the modules with the highest cumulative import times.
+
+    :param list imports: Imports from ``parse_import_times``
+    :param int count: The number of modules to return
+
+    :rtype: list
+    """
+    return sorted(
+        imports, key=lambda i: i['cumulative_us'], reverse=True)[:count]
+
+
+def extract_package(artifact_path, package_dir):
+    """Extract a Lambda package the way Lambda does, keeping each file's
+    permissions.
+
+    :param str artifact_path: The path to the Lambda package
+    :param str package_dir: The directory to extract to
+    """
+    with zipfile.ZipFile(artifact_path) as zip_file:
+        for info in zip_file.infolist():
+            path = zip_file.extract(info, package_dir)
+            mode = info.external_attr >> 16 & 0o777
+            if mode:
+                os.chmod(path, mode)
+
+
+def _import_result(module, returncode, stdout, stderr):
+    if returncode != 0:
+        raise PossumException(
+            f"Importing '{module}' failed: "
+            f'{stderr.strip().splitlines()[-1] if stderr.strip() else ""}')
+
+    imports = parse_import_times(stderr)
+    return {
+        'module': module,
+        'wall_time_us': int(float(stdout.strip().splitlines()[-1]) * 10 ** 6),
+        'import_time_us': sum(
+            i['cumulative_us'] for i in imports if i['depth'] == 0),
+        'imports': imports
+    }
+
+
+def _import_command(python_path, package_dir, module):
+    # -I ignores the environment and user site-packages; -B stops Python
+    # writing bytecode, which the read-only Lambda package can't hold
+    return [
+        python_path, '-I', '-B', '-X', 'importtime',
+        '-c', IMPORT_SCRIPT, package_dir, module
+    ]
+
+
+def profile_handler_import(package_dir, module, python_path):
+    """Import a handler module from an extracted package in a fresh
+    interpreter with import time tracing.
+
+    :param str package_dir: The extracted Lambda package
+    :param str module: The handler module to import
+    :param str python_path: The interpreter to run
+
+    :returns: The module name, the wall time and total import time of the
+        import in microseconds, and every module that was imported
+    :rtype: dict
+    """
+    p = subprocess.run(
+        _import_command(python_path, package_dir, module),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        cwd=package_dir,
+        universal_newlines=True
+    )
+    return _import_result(module, p.returncode, p.stdout, p.stderr)
+
+
+def profile_handler_import_in_docker(package_dir, module, image_name):
+    """Import a handler module as ``profile_handler_import`` does, but in a
+    container of a Docker image with the package mounted read-only at
+    '/var/task' as it is in Lambda.
+
+    :param str package_dir: The extracted Lambda package
+    :param str module: The handler module to import
+    :param str image_name: The Docker image to run
+
+    :rtype: dict
+    """
+    returncode, stdout, stderr = run_container(
+        image_name,
+        _import_command('python', '/var/task', module),
+        volumes={package_dir: {'bind': '/var/task', 'mode': 'ro'}},
+        working_dir='/var/task'
+    )
+    return _import_result(module, returncode, stdout, stderr)
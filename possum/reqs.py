@@ -1,11 +1,20 @@
 import json
 import os
 import re
+from urllib.parse import urlsplit
 
 import toml
 
+from possum.config import logger
+from possum.exc import PossumException
+
 CWD = os.getcwd()
 
+DEFAULT_INDEX_URLS = (
+    'https://pypi.org/simple',
+    'https://pypi.python.org/simple'
+)
+
 dunder_regex = re.compile(r'^__\w+__\s*=.*$')
 import_regex = re.compile(r'^(?:import|from)\s(.+?)(?:\..*$|$|\s.+$)')
 
@@ -33,6 +42,160 @@ def get_pipfile_packages():
     return values
 
 
+def _requirement_line(name, values, project_dir):
+    """Convert a single Pipfile or Pipfile.lock entry into a pip requirement
+    specifier. Local ``path`` and ``file`` entries are resolved against the
+    project directory and always installed as regular packages: an editable
+    install only points at the build host's copy, which Lambda can't import.
+    """
+    if isinstance(values, str):
+        return name if values == '*' else f'{name}{values}'
+
+    if values.get('git'):
+        ref = f"@{values['ref']}" if values.get('ref') else ''
+        return f"git+{values['git']}{ref}#egg={name}"
+
+    for vcs in ('hg', 'svn', 'bzr'):
+        if values.get(vcs):
+            raise PossumException(
+                f"'{name}' is installed from {vcs}, which can't be installed "
+                "with pip: use '--installer pipenv'")
+
+    extras = values.get('extras')
+    extras = f"[{','.join(extras)}]" if extras else ''
+
+    location = values.get('path') or values.get('file')
+    if location:
+        if '://' not in location:
+            location = os.path.normpath(os.path.join(project_dir, location))
+        line = location + extras
+    else:
+        version = values.get('version', '*')
+        line = f'{name}{extras}' if version == '*' else \
+            f'{name}{extras}{version}'
+
+    if values.get('markers'):
+        line += f"; {values['markers']}"
+
+    return line
+
+
+def _index_options(sources):
+    """Convert Pipfile sources into pip options for a requirements file. No
+    options are returned for PyPI alone so pip's own configuration (such as
+    a mirror) still applies.
+    """
+    if not sources or len(sources) == 1 and \
+            sources[0].get('url', '').rstrip('/') in DEFAULT_INDEX_URLS:
+        return list()
+
+    options = list()
+    for index, source in enumerate(sources):
+        option = '--index-url' if index == 0 else '--extra-index-url'
+        options.append(f"{option} {source['url']}")
+        if not source.get('verify_ssl', True):
+            options.append(f"--trusted-host {urlsplit(source['url']).netloc}")
+
+    return options
+
+
+def _check_indexes(packages, sources, hashed):
+    """Raise an exception for packages that name an index other than the
+    first source. pip searches every index for every package, so another
+    index could provide a package of the same name unless the hashes are
+    checked.
+    """
+    if hashed or len(sources) < 2:
+        return
+
+    default_index = sources[0].get('name')
+    for name, values in sorted(packages.items()):
+        index = values.get('index') if isinstance(values, dict) else None
+        if index and index != default_index:
+            raise PossumException(
+                f"'{name}' is installed from the '{index}' index, which pip "
+                "can only do safely when the hashes in a Pipfile.lock are "
+                "checked: use '--installer pipenv'")
+
+
+def get_lockfile_requirements(lockfile_path, hashes=True, index=True):
+    """Return pip requirement lines for every package in the 'default'
+    section of a Pipfile.lock, preceded by options for the lock's sources.
+
+    With ``hashes`` every line lists the lock's hashes so pip runs in
+    hash-checking mode. pip can only check hashes if every package has them,
+    so none are listed (with a warning) if any package, such as a local path
+    or a git checkout, has none.
+
+    :param str lockfile_path: The path to the Pipfile.lock
+    :param bool hashes: List the hashes of each package
+    :param bool index: Include options for the sources (leave this off when
+        installing without an index)
+
+    :rtype: list
+
+    :raises PossumException: If a package can't be installed with pip
+    """
+    with open(lockfile_path, 'r') as f:
+        pipfile_lock = json.load(f)
+
+    project_dir = os.path.dirname(os.path.abspath(lockfile_path))
+    packages = pipfile_lock.get('default', {})
+
+    lines = [
+        _requirement_line(k, v, project_dir)
+        for k, v in sorted(packages.items())
+    ]
+
+    hashed = False
+    if hashes and packages:
+        unhashed = [
+            k for k, v in sorted(packages.items())
+            if not isinstance(v, dict) or not v.get('hashes')
+        ]
+        if unhashed:
+            logger.warning(
+                f"Hashes in '{lockfile_path}' can't be checked as these "
+                f"packages have none: {', '.join(unhashed)}")
+        else:
+            lines = [
+                ' '.join([line] + [f'--hash={i}' for i in v['hashes']])
+                for line, (k, v) in zip(lines, sorted(packages.items()))
+            ]
+            hashed = True
+
+    if not index:
+        return lines
+
+    sources = pipfile_lock.get('_meta', {}).get('sources', [])
+    _check_indexes(packages, sources, hashed)
+    return _index_options(sources) + lines
+
+
+def get_pipfile_requirements(pipfile_path):
+    """Return pip requirement lines for the 'packages' section of a Pipfile,
+    preceded by options for its sources. These are not pinned unless the
+    Pipfile pins them.
+
+    :param str pipfile_path: The path to the Pipfile
+
+    :rtype: list
+
+    :raises PossumException: If a package can't be installed with pip
+    """
+    pipfile = toml.load(pipfile_path)
+
+    project_dir = os.path.dirname(os.path.abspath(pipfile_path))
+    packages = pipfile.get('packages', {})
+    sources = pipfile.get('source', [])
+
+    _check_indexes(packages, sources, False)
+    return _index_options(sources) + [
+        _requirement_line(k, v, project_dir)
+        for k, v in sorted(packages.items())
+    ]
+
+
 def parse_requirements(lambda_path):
     requirements_filepath = os.path.join(lambda_path, 'requirements.txt')
 
@@ -0,0 +1,160 @@
+import os
+import re
+
+from possum.exc import PossumException
+from possum.packages import MB
+
+__all__ = [
+    'LAMBDA_UNZIPPED_LIMIT',
+    'parse_size',
+    'format_size',
+    'get_file_type',
+    'analyze_artifact',
+    'check_size_budget',
+    'format_size_table'
+]
+
+# The largest a function's deployment package may be once unzipped
+LAMBDA_UNZIPPED_LIMIT = 250 * MB
+
+SIZE_UNITS = {
+    '': 1,
+    'B': 1,
+    'KB': 1024,
+    'MB': MB,
+    'GB': 1024 * MB
+}
+
+SIZE_PATTERN = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMG]?B)?\s*$', re.I)
+
+
+def parse_size(value):
+    """Parse a size such as ``1048576``, ``'512 KB'`` or ``'20 MB'``.
+
+    :param value: The size as a number of bytes or a string with a unit
+
+    :returns: The size in bytes
+    :rtype: int
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+
+    match = SIZE_PATTERN.match(str(value))
+    if not match:
+        raise PossumException(f"Invalid size '{value}'")
+
+    unit = (match.group(2) or '').upper()
+    return int(float(match.group(1)) * SIZE_UNITS[unit])
+
+
+def format_size(size):
+    if abs(size) >= MB:
+        return f'{size / MB:.1f} MB'
+
+    return f'{size / 1024:.1f} KB'
+
+
+def get_file_type(arcname):
+    """Return the extension a file is grouped under in a size breakdown.
+    Versioned shared objects ('libfoo.so.1') are grouped with '.so'.
+
+    :param str arcname: The path of the file within the package
+
+    :rtype: str
+    """
+    name = arcname.rsplit('/', 1)[-1]
+    if re.search(r'\.so(\.\d+)*$', name):
+        return '.so'
+
+    return os.path.splitext(name)[1].lower() or '(none)'
+
+
+def _summarize(groups):
+    return [
+        {
+            'name': name,
+            'files': files,
+            'compressed_bytes': compressed,
+            'uncompressed_bytes': uncompressed
+        }
+        for name, (files, uncompressed, compressed) in sorted(
+            groups.items(), key=lambda i: (-i[1][1], i[0]))
+    ]
+
+
+def analyze_artifact(artifact):
+    """Break the size of a Lambda package down by top-level package (the
+    first component of each path) and by file type.
+
+    Compressed sizes of groups count file data only; the archive's total
+    compressed size also includes the zip headers.
+
+    :param LambdaArtifact artifact: The artifact to analyze
+
+    :rtype: dict
+    """
+    packages = dict()
+    file_types = dict()
+
+    for arcname, file_size, compress_size in artifact.file_sizes:
+        for groups, key in ((packages, arcname.split('/')[0]),
+                            (file_types, get_file_type(arcname))):
+            totals = groups.setdefault(key, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += file_size
+            totals[2] += compress_size
+
+    return {
+        'artifact': artifact.name,
+        'files': len(artifact.file_sizes),
+        'compressed_bytes': artifact.size,
+        'uncompressed_bytes': sum(i[1] for i in artifact.file_sizes),
+        'packages': _summarize(packages),
+        'file_types': _summarize(file_types)
+    }
+
+
+def check_size_budget(report, compressed=None, uncompressed=None):
+    """Check a size report against a budget.
+
+    :param dict report: A report from ``analyze_artifact``
+    :param int compressed: The maximum size of the archive in bytes
+    :param int uncompressed: The maximum unzipped size in bytes
+
+    :returns: A message for each limit that was exceeded
+    :rtype: list
+    """
+    violations = list()
+
+    for label, limit in (('compressed', compressed),
+                         ('uncompressed', uncompressed)):
+        size = report[f'{label}_bytes']
+        if limit is not None and size > limit:
+            violations.append(
+                f'The {label} package size of {format_size(size)} exceeds '
+                f'the budget of {format_size(limit)}')
+
+    return violations
+
+
+def format_size_table(groups, label, count=10):
+    """Format the largest groups of a size breakdown as table rows.
+
+    :param list groups: ``packages`` or ``file_types`` from a report
+    :param str label: The heading of the name column
+    :param int count: The number of rows to include
+
+    :rtype: list
+    """
+    rows = [f"{'Compressed':>12}  {'Uncompressed':>12}  {'Files':>6}  {label}"]
+
+    for group in groups[:count]:
+        rows.append(
+            f"{format_size(group['compressed_bytes']):>12}  "
+            f"{format_size(group['uncompressed_bytes']):>12}  "
+            f"{group['files']:>6}  {group['name']}")
+
+    if len(groups) > count:
+        rows.append(f'{"":>36}  ({len(groups) - count} more)')
+
+    return rows
@@ -0,0 +1,187 @@
+import fnmatch
+import os
+import shutil
+import subprocess
+
+from possum.config import logger
+from possum.packages import MB
+
+__all__ = [
+    'DEFAULT_EXCLUDES',
+    'DEPENDENCY_EXCLUDES',
+    'SlimReport',
+    'match_path',
+    'strip_binary',
+    'slim_package_entries'
+]
+
+# Patterns ending with a '/' only match directories. Patterns without a '/'
+# are matched against every component of a path; other patterns are matched
+# against the full path and each of its parent directories.
+
+# Removed from every package
+DEFAULT_EXCLUDES = (
+    '__pycache__/',
+    '.DS_Store'
+)
+
+# Removed from installed dependencies only
+DEPENDENCY_EXCLUDES = (
+    '*.dist-info/RECORD',
+    '*.dist-info/INSTALLER',
+    '*.pyi',
+    'tests/'
+)
+
+SHARED_OBJECT_PATTERNS = ('*.so', '*.so.*')
+
+
+class SlimReport:
+    """The files removed from, and the binaries stripped in, a package."""
+    def __init__(self):
+        self.removed_files = 0
+        self.removed_bytes = 0
+        self.stripped_files = 0
+        self.stripped_bytes = 0
+
+    @property
+    def saved_bytes(self):
+        return self.removed_bytes + self.stripped_bytes
+
+    def __str__(self):
+        return f'removed {self.removed_files} files ' \
+               f'({self.removed_bytes / MB:.1f} MB), stripped ' \
+               f'{self.stripped_files} binaries ' \
+               f'({self.stripped_bytes / MB:.1f} MB); ' \
+               f'{self.saved_bytes / MB:.1f} MB saved'
+
+
+def match_path(arcname, pattern):
+    """Check an archive path against a slimming pattern.
+
+    :param str arcname: The path of a file within the package
+    :param str pattern: The glob pattern
+
+    :rtype: bool
+    """
+    *dirs, name = arcname.split('/')
+
+    if pattern.endswith('/'):
+        pattern = pattern.rstrip('/')
+        if '/' not in pattern:
+            return any(fnmatch.fnmatchcase(i, pattern) for i in dirs)
+
+        return any(
+            fnmatch.fnmatchcase('/'.join(dirs[:i]), pattern)
+            for i in range(1, len(dirs) + 1)
+        )
+
+    if '/' not in pattern:
+        return any(fnmatch.fnmatchcase(i, pattern) for i in dirs + [name])
+
+    parts = arcname.split('/')
+    return any(
+        fnmatch.fnmatchcase('/'.join(parts[:i]), pattern)
+        for i in range(1, len(parts) + 1)
+    )
+
+
+def _matches_any(arcname, patterns):
+    return any(match_path(arcname, i) for i in patterns)
+
+
+def strip_binary(path, dest_path):
+    """Write a copy of a shared object without its debug and unneeded
+    symbols. The original file is never modified as it may be shared with
+    other builds through the dependency cache.
+
+    :param str path: The shared object to strip
+    :param str dest_path: The path to write the stripped copy to
+
+    :returns: ``True`` if a smaller copy was written
+    :rtype: bool
+    """
+    with open(path, 'rb') as f_obj:
+        if f_obj.read(4) != b'\x7fELF':
+            return False
+
+    os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+    shutil.copy2(path, dest_path)
+
+    p = subprocess.run(
+        ['strip', '--strip-unneeded', dest_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+
+    if p.returncode != 0 or \
+            os.path.getsize(dest_path) >= os.path.getsize(path):
+        os.remove(dest_path)
+        return False
+
+    return True
+
+
+def slim_package_entries(entries, source_dir, work_dir, exclude=None,
+                         include=None, default_rules=True,
+                         strip_binaries=True):
+    """Remove files that are not needed at runtime from a list of package
+    entries and replace shared objects from the dependencies with stripped
+    copies.
+
+    The built-in rules remove ``DEFAULT_EXCLUDES`` from every file and
+    ``DEPENDENCY_EXCLUDES`` from files that are not in the function's source
+    directory. ``include`` patterns keep files that any rule (including
+    ``exclude``) would otherwise remove.
+
+    :param list entries: Entries from ``collect_package_entries``
+    :param str source_dir: The function's source directory
+    :param str work_dir: A directory to write stripped binaries to
+    :param list exclude: Additional patterns to remove
+    :param list include: Patterns to always keep
+    :param bool default_rules: Apply the built-in rules
+    :param bool strip_binaries: Strip shared objects in the dependencies
+
+    :returns: The remaining entries and a ``SlimReport``
+    :rtype: tuple
+    """
+    exclude = list(exclude or list())
+    include = list(include or list())
+    source_prefix = os.path.join(source_dir, '')
+
+    if strip_binaries and not shutil.which('strip'):
+        logger.warning("'strip' could not be found! Shared objects will not "
+                       "be stripped.")
+        strip_binaries = False
+
+    report = SlimReport()
+    slimmed = list()
+
+    for arcname, file_path, file_stat in entries:
+        from_source = file_path.startswith(source_prefix)
+
+        patterns = list(exclude)
+        if default_rules:
+            patterns.extend(DEFAULT_EXCLUDES)
+            if not from_source:
+                patterns.extend(DEPENDENCY_EXCLUDES)
+
+        if _matches_any(arcname, patterns) and \
+                not _matches_any(arcname, include):
+            report.removed_files += 1
+            report.removed_bytes += file_stat.st_size
+            continue
+
+        if strip_binaries and not from_source and \
+                _matches_any(arcname, SHARED_OBJECT_PATTERNS):
+            stripped_path = os.path.join(work_dir, *arcname.split('/'))
+            if strip_binary(file_path, stripped_path):
+                stripped_stat = os.stat(stripped_path)
+                report.stripped_files += 1
+                report.stripped_bytes += \
+                    file_stat.st_size - stripped_stat.st_size
+                file_path, file_stat = stripped_path, stripped_stat
+
+        slimmed.append((arcname, file_path, file_stat))
+
+    return slimmed, report
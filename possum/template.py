@@ -17,6 +17,47 @@ def get_global(template, resource_type, key):
     return resource.get(key)
 
 
+def get_possum_metadata(template, resource):
+    """Return the ``Metadata: Possum`` section of a template resource.
+
+    :param dict template: The loaded SAM template
+    :param str resource: The logical ID of the resource
+
+    :rtype: dict
+    """
+    metadata = template['Resources'][resource].get('Metadata') or dict()
+    return metadata.get('Possum') or dict()
+
+
+def get_function_runtime(template, resource):
+    """Return the runtime of a function, from the function or the template's
+    Globals.
+
+    :param dict template: The loaded SAM template
+    :param str resource: The logical ID of the function
+
+    :rtype: str
+    """
+    return template['Resources'][resource]['Properties'].get(
+        'Runtime', get_global(template, 'Function', 'Runtime'))
+
+
+def get_function_architecture(template, resource):
+    """Return the architecture of a function, 'x86_64' unless the function or
+    the template's Globals set ``Architectures``.
+
+    :param dict template: The loaded SAM template
+    :param str resource: The logical ID of the function
+
+    :rtype: str
+    """
+    architectures = \
+        template['Resources'][resource]['Properties'].get('Architectures') or \
+        get_global(template, 'Function', 'Architectures')
+
+    return architectures[0] if architectures else 'x86_64'
+
+
 def update_template_resource(template, resource, bucket_name, bucket_dir,
                              resource_param='CodeUri',
                              s3_object=None, s3_uri=None):
@@ -0,0 +1,149 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+__all__ = [
+    'Tracer',
+    'tracer'
+]
+
+
+class Tracer:
+    """Records how long each phase of a run takes as Chrome trace events
+    (viewable in chrome://tracing or Perfetto).
+
+    Recording is off until ``enable()`` is called; until then ``span()``
+    does nothing but run its block. Worker processes record their own events
+    and hand them back with ``pop_events()`` for the parent to
+    ``add_events()``.
+    """
+    def __init__(self):
+        self._events = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._events is not None
+
+    def enable(self):
+        """Start recording, discarding any events already recorded (such as
+        those inherited by a forked worker process).
+        """
+        self._events = list()
+
+    @contextlib.contextmanager
+    def span(self, name, category='possum', **args):
+        """Record the time taken to run a block.
+
+        :param str name: The name of the phase
+        :param str category: The category of the phase
+        :param args: Details to attach, such as ``function`` or ``bytes``
+
+        :returns: The ``args`` dictionary, which may be updated within the
+            block (for instance with the number of bytes written)
+        """
+        if self._events is None:
+            yield args
+            return
+
+        timestamp = time.time()
+        start = time.perf_counter()
+        try:
+            yield args
+        finally:
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int(timestamp * 10 ** 6),
+                'dur': int((time.perf_counter() - start) * 10 ** 6),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args
+            }
+            with self._lock:
+                if self._events is not None:
+                    self._events.append(event)
+
+    def pop_events(self):
+        """Return the recorded events and clear them.
+
+        :rtype: list
+        """
+        with self._lock:
+            events = self._events or list()
+            if self._events is not None:
+                self._events = list()
+
+        return events
+
+    def add_events(self, events):
+        """Add events recorded by another process.
+
+        :param list events: Events from ``pop_events``
+        """
+        with self._lock:
+            if self._events is not None:
+                self._events.extend(events)
+
+    def write_chrome_trace(self, path):
+        """Write the recorded events as a Chrome trace event file.
+
+        :param str path: The file to write
+        """
+        with self._lock:
+            events = list(self._events or list())
+
+        main_pid = os.getpid()
+        metadata = [
+            {
+                'name': 'process_name',
+                'ph': 'M',
+                'pid': pid,
+                'args': {
+                    'name': 'possum' if pid == main_pid else
+                    f'possum worker {pid}'
+                }
+            }
+            for pid in sorted(set(i['pid'] for i in events))
+        ]
+
+        with open(path, 'wt') as f_obj:
+            json.dump(
+                {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'},
+                f_obj
+            )
+
+    def summary(self):
+        """Total the recorded events by name. Times include nested phases.
+
+        :returns: Dictionaries of the name, number of calls, total and
+            longest duration in microseconds, and total bytes of each phase,
+            longest total first
+        :rtype: list
+        """
+        phases = dict()
+
+        with self._lock:
+            events = list(self._events or list())
+
+        for event in events:
+            phase = phases.setdefault(event['name'], {
+                'name': event['name'],
+                'calls': 0,
+                'total_us': 0,
+                'max_us': 0,
+                'bytes': 0
+            })
+            phase['calls'] += 1
+            phase['total_us'] += event['dur']
+            phase['max_us'] = max(phase['max_us'], event['dur'])
+            phase['bytes'] += event['args'].get('bytes', 0)
+
+        return sorted(
+            phases.values(), key=lambda i: (-i['total_us'], i['name']))
+
+
+tracer = Tracer()
@@ -1,4 +1,17 @@
-from possum.utils.docker_ import build_docker_image, run_in_docker
-from possum.utils.general import get_s3_bucket_and_dir
+from possum.utils.cache import (
+    DependencyCache,
+    get_requirements_files,
+    get_unpinned_reason,
+    hash_local_requirements
+)
+from possum.utils.docker_ import (
+    build_docker_image,
+    BuildContainerPool,
+    exec_in_container,
+    run_container,
+    run_in_docker
+)
+from possum.utils.general import get_s3_bucket_and_dir, hash_file
+from possum.utils.hashing import hash_tree
 from possum.utils.pipenv_ import PipenvWrapper
-from possum.utils.repo import PossumFile
+from possum.utils.repo import get_possum_dir, PossumFile
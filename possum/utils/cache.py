@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import sys
+import uuid
+
+from possum.utils.hashing import digest_file, hash_tree
+
+REQUIREMENTS_FILES = ('Pipfile', 'Pipfile.lock', 'requirements.txt')
+
+# A requirement pinned to exactly one version, e.g. 'requests[socks]==2.31.0'
+PINNED_REQUIREMENT = re.compile(
+    r'^[A-Za-z0-9][A-Za-z0-9._-]*(\[[^\]]*\])?\s*===?\s*[^\s,;*]+\s*(;.*)?$')
+
+# A URL requirement carrying the digest of what it points to
+HASHED_URL = re.compile(r'://\S+#(sha256|sha384|sha512)=[0-9a-fA-F]+')
+
+# Options that do not change which versions are installed
+INDEX_OPTIONS = (
+    '-i', '--index-url', '--extra-index-url', '-f', '--find-links',
+    '--trusted-host', '--no-index', '--prefer-binary', '--only-binary',
+    '--no-binary'
+)
+
+
+def get_requirements_files(project_dir):
+    """Return the names of the requirements files present in a directory.
+
+    :param str project_dir: The directory to check
+
+    :rtype: list
+    """
+    return [
+        i for i in REQUIREMENTS_FILES
+        if os.path.isfile(os.path.join(project_dir, i))
+    ]
+
+
+def _requirement_lines(path):
+    with open(path, 'r') as f_obj:
+        content = f_obj.read().replace('\\\n', ' ')
+
+    for line in content.splitlines():
+        line = re.sub(r'(^|\s)#.*$', '', line).strip()
+        if line:
+            yield line
+
+
+def get_unpinned_reason(project_dir):
+    """Return why the dependencies installed for a directory are not fully
+    determined by its requirements files. Only pinned dependency sets can be
+    cached; anything else may resolve to newer releases on a later run.
+
+    A ``Pipfile.lock`` is pinned, as is a ``requirements.txt`` in which every
+    requirement is pinned with ``==`` or is a URL carrying a hash.
+
+    :param str project_dir: The directory containing the requirements files
+
+    :returns: The reason, or ``None`` if the dependencies are pinned
+    :rtype: str
+    """
+    if os.path.isfile(os.path.join(project_dir, 'Pipfile.lock')):
+        return None
+
+    requirements_file = os.path.join(project_dir, 'requirements.txt')
+    if not os.path.isfile(requirements_file):
+        if os.path.isfile(os.path.join(project_dir, 'Pipfile')):
+            return 'the Pipfile has no Pipfile.lock'
+        return None
+
+    for line in _requirement_lines(requirements_file):
+        if line.startswith('-'):
+            if line.split('=')[0].split()[0] in INDEX_OPTIONS:
+                continue
+            return f"'{line}' in requirements.txt cannot be pinned"
+
+        if ('://' in line and '--hash=' in line) or HASHED_URL.search(line):
+            continue
+
+        requirement = re.sub(r'\s--hash[=\s]\S+', '', line).strip()
+        if not PINNED_REQUIREMENT.match(requirement):
+            return f"'{requirement}' in requirements.txt is not pinned " \
+                   "with '=='"
+
+    return None
+
+
+def get_local_requirements(project_dir):
+    """Return the local ``path`` and ``file`` entries of a directory's
+    Pipfile.lock. Their contents are not pinned by the lock, so anything
+    keyed by the requirements files must also cover these.
+
+    :param str project_dir: The directory containing the requirements files
+
+    :returns: The sorted absolute paths
+    :rtype: list
+    """
+    lockfile = os.path.join(project_dir, 'Pipfile.lock')
+    if not os.path.isfile(lockfile):
+        return list()
+
+    with open(lockfile, 'r') as f_obj:
+        packages = json.load(f_obj).get('default', {})
+
+    paths = set()
+    for values in packages.values():
+        if not isinstance(values, dict):
+            continue
+        location = values.get('path') or values.get('file')
+        if location and '://' not in location:
+            paths.add(os.path.normpath(os.path.join(
+                os.path.abspath(project_dir), location)))
+
+    return sorted(paths)
+
+
+def hash_local_requirements(project_dir):
+    """Return a digest of the contents of the local packages installed from
+    a directory's Pipfile.lock (see ``get_local_requirements``).
+
+    :param str project_dir: The directory containing the requirements files
+
+    :returns: The digest, or an empty string if there are none
+    :rtype: str
+    """
+    paths = get_local_requirements(project_dir)
+    if not paths:
+        return ''
+
+    local_hash = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            digest = hash_tree(path)[0]
+        elif os.path.isfile(path):
+            digest = digest_file(path)
+        else:
+            digest = 'missing'
+        local_hash.update(digest.encode() + b'\0')
+
+    return local_hash.hexdigest()
+
+
+class DependencyCache:
+    """A local cache of installed dependency trees shared by all functions
+    and all runs.
+
+    Each entry is keyed by a hash of a function's requirements files, the
+    function's runtime and architecture, the installer backend, and the
+    Python version and platform performing the install, and the contents of
+    any local packages in a Pipfile.lock. Functions pinning an identical set
+    of dependencies will share a single entry. Dependencies
+    that are not pinned (see ``get_unpinned_reason``) must not be cached.
+
+    :param str cache_dir: The directory to store cached dependencies in
+    :param str runtime: The Lambda runtime of the function being built
+    :param str installer: The name of the installer backend
+    :param str architecture: The Lambda architecture of the function
+    """
+    def __init__(self, cache_dir, runtime=None, installer=None,
+                 architecture=None):
+        self.cache_dir = cache_dir
+        self.runtime = runtime or ''
+        self.installer = installer or ''
+        self.architecture = architecture or ''
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def environment_id():
+        libc = '-'.join(platform.libc_ver()).strip('-')
+        return f'{sys.implementation.name}{sys.version_info[0]}.' \
+               f'{sys.version_info[1]}-{sys.platform}-' \
+               f'{platform.machine()}-{libc}'
+
+    def get_key(self, project_dir):
+        """Return the cache key for the requirements files in a directory.
+
+        :param str project_dir: The directory containing the requirements
+            files
+
+        :rtype: str
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(self.runtime.encode())
+        key_hash.update(self.installer.encode())
+        key_hash.update(self.architecture.encode())
+        key_hash.update(self.environment_id().encode())
+
+        for name in get_requirements_files(project_dir):
+            key_hash.update(name.encode())
+            with open(os.path.join(project_dir, name), 'rb') as f_obj:
+                key_hash.update(f_obj.read())
+
+        key_hash.update(hash_local_requirements(project_dir).encode())
+        return key_hash.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def contains(self, key):
+        return os.path.isdir(self.path(key))
+
+    def staging_dir(self):
+        """Create and return an empty directory to install dependencies into
+        before they are committed to the cache.
+
+        :rtype: str
+        """
+        path = os.path.join(self.cache_dir, f'.staging-{uuid.uuid4().hex}')
+        os.mkdir(path)
+        return path
+
+    def commit(self, key, staging_dir):
+        """Move a populated staging directory into the cache. If another
+        build committed the same key first its entry is kept.
+
+        :param str key: The cache key
+        :param str staging_dir: The populated staging directory
+        """
+        try:
+            os.rename(staging_dir, self.path(key))
+        except OSError:
+            if not self.contains(key):
+                raise
+            shutil.rmtree(staging_dir, ignore_errors=True)
@@ -1,20 +1,23 @@
+import hashlib
 import io
+import json
 import os
 import sys
 import textwrap
-import time
+from concurrent.futures import ThreadPoolExecutor
 
 import docker
-from docker.errors import APIError, BuildError, ImageNotFound
+from docker.errors import APIError, BuildError, ImageNotFound, NotFound
 
 from possum.config import logger
+from possum.exc import PossumException
 
 
 def dockerfile(version):
     return io.BytesIO(
         textwrap.dedent(
             f'''\
-            FROM lambci/lambda:build-python3.6
+            FROM lambci/lambda:build-python3.7
             
             RUN /var/lang/bin/pip install -U pip && \\
                 /var/lang/bin/pip install pipenv
@@ -60,21 +63,237 @@ def build_docker_image(version):
                 f"  Tags: {', '.join(image[0].tags)}")
 
 
-def run_in_docker(user_dir, possum_path, image_name):
-    command = sys.argv
+def run_container(image_name, command, pull=False, **options):
+    """Run a command in a new container and wait for it to exit. The
+    container is removed afterwards.
 
-    command[0] = 'possum'
-    command.pop(command.index('--docker'))
+    :param str image_name: The Docker image to run
+    :param list command: The command to run
+    :param bool pull: Pull the image if it is not available locally
+    :param options: Additional options for creating the container
+
+    :returns: The exit code and the stdout and stderr of the command
+    :rtype: tuple
+    """
+    client = docker.from_env()
 
     try:
-        command.pop(command.index('--docker-image') + 1)
-        command.pop(command.index('--docker-image'))
-    except ValueError:
-        pass
+        if pull:
+            try:
+                client.images.get(image_name)
+            except ImageNotFound:
+                logger.info(f"Pulling the Docker image '{image_name}'...")
+                client.images.pull(
+                    image_name, platform=options.get('platform'))
+
+        container = client.containers.create(
+            image=image_name, command=command, detach=True, **options)
+    except NotFound:
+        raise PossumException(
+            f"The Docker image '{image_name}' could not be found")
+
+    try:
+        container.start()
+        returncode = container.wait()['StatusCode']
+        stdout = container.logs(stdout=True, stderr=False).decode()
+        stderr = container.logs(stdout=False, stderr=True).decode()
+    finally:
+        container.remove(force=True)
+
+    return returncode, stdout, stderr
+
+
+# Arguments of the outer invocation that are not passed on to the container,
+# with the number of values each takes
+DOCKER_ARGUMENTS = {
+    '--docker': 0,
+    '--docker-image': 1,
+    '--docker-cache-dir': 1,
+    '--no-docker-cache': 0,
+    '--docker-reuse-container': 0
+}
+
+# Where pip and pipenv keep their download and wheel caches in the container
+CONTAINER_CACHE_DIR = '/root/.cache'
+
+
+def _container_command(argv):
+    command = ['possum']
+    arguments = iter(argv[1:])
+    for argument in arguments:
+        name = argument.split('=', 1)[0]
+        if name not in DOCKER_ARGUMENTS:
+            command.append(argument)
+        elif '=' not in argument:
+            for _ in range(DOCKER_ARGUMENTS[name]):
+                next(arguments, None)
+
+    return command
+
+
+def get_build_container_name(image_name, volumes):
+    """Return the name of the reusable build container for an image and a
+    set of mounts. Containers cannot be remounted, so each project directory
+    gets its own container.
+
+    :param str image_name: The Docker image
+    :param dict volumes: The volumes mounted into the container
 
-    # docker_directory = tempfile.mkdtemp(
-    #     suffix='-docker', prefix='possum-', dir='/tmp')
-    # logger.info(f'Working Docker directory: {docker_directory}')
+    :rtype: str
+    """
+    key = json.dumps([image_name, sorted(volumes)]).encode()
+    return f'possum-build-{hashlib.sha1(key).hexdigest()[:12]}'
+
+
+def _get_build_container(client, image_name, volumes, name=None):
+    """Return a running build container that is kept between invocations,
+    creating it (or replacing it if its image was rebuilt) as needed.
+    """
+    name = name or get_build_container_name(image_name, volumes)
+
+    try:
+        image = client.images.get(image_name)
+    except ImageNotFound:
+        logger.error(f"The Docker image '{image_name}' could not be found")
+        sys.exit(1)
+
+    try:
+        container = client.containers.get(name)
+    except NotFound:
+        container = None
+
+    if container and container.image.id != image.id:
+        logger.info(f"Replacing build container '{name}' for the updated "
+                    "image...")
+        container.remove(force=True)
+        container = None
+
+    if not container:
+        logger.info(f"Creating build container '{name}'...")
+        container = client.containers.create(
+            image=image.id,
+            command=['tail', '-f', '/dev/null'],
+            name=name,
+            labels={'possum.build-container': image_name},
+            volumes=volumes,
+            detach=True
+        )
+
+    if container.status != 'running':
+        container.start()
+
+    return container
+
+
+def exec_in_container(container_id, command, workdir=None, user=None,
+                      environment=None):
+    """Run a command in a running container and wait for it to exit.
+
+    :param str container_id: The ID or name of the container
+    :param list command: The command to run
+    :param str workdir: The working directory of the command
+    :param str user: The user (or ``uid:gid``) to run the command as
+    :param dict environment: Environment variables for the command
+
+    :returns: The exit code and the stdout and stderr of the command
+    :rtype: tuple
+    """
+    client = docker.from_env()
+    exec_id = client.api.exec_create(
+        container_id, command, workdir=workdir, user=user or '',
+        environment=environment)['Id']
+
+    stdout, stderr = client.api.exec_start(exec_id, demux=True)
+    returncode = client.api.exec_inspect(exec_id)['ExitCode']
+    return returncode, (stdout or b'').decode(), (stderr or b'').decode()
+
+
+class BuildContainerPool:
+    """A pool of running build containers that function builds are sent to
+    with ``exec_in_container`` while Possum itself runs on the host.
+
+    Each directory in ``mount_dirs`` is mounted at the same path in every
+    container so host paths can be used in commands unchanged. Containers
+    are removed by ``close()`` unless ``reuse`` is set, in which case they
+    are named and left running for the next invocation.
+
+    :param str image_name: The Docker image to run
+    :param int size: The number of containers
+    :param list mount_dirs: Host directories to mount into the containers
+    :param bool reuse: Keep the containers between invocations
+    """
+    def __init__(self, image_name, size, mount_dirs, reuse=False):
+        self.image_name = image_name
+        self.size = size
+        self.reuse = reuse
+        self.volumes = {
+            i: {'bind': i, 'mode': 'rw'} for i in sorted(set(mount_dirs))
+        }
+        self.containers = list()
+        self._client = docker.from_env()
+
+    def _start_container(self, index):
+        if self.reuse:
+            name = get_build_container_name(self.image_name, self.volumes)
+            return _get_build_container(
+                self._client, self.image_name, self.volumes,
+                name=f'{name}-{index}')
+
+        container = self._client.containers.create(
+            image=self.image_name,
+            command=['tail', '-f', '/dev/null'],
+            labels={'possum.build-container': self.image_name},
+            volumes=self.volumes,
+            detach=True
+        )
+        container.start()
+        return container
+
+    def start(self):
+        """Start the containers (or find the running ones when reusing
+        them).
+
+        :returns: The IDs of the containers
+        :rtype: list
+        """
+        try:
+            self._client.images.get(self.image_name)
+        except ImageNotFound:
+            raise PossumException(
+                f"The Docker image '{self.image_name}' could not be found")
+
+        with ThreadPoolExecutor(self.size) as executor:
+            for container in executor.map(
+                    self._start_container, range(self.size)):
+                self.containers.append(container)
+
+        return [i.id for i in self.containers]
+
+    def close(self):
+        """Remove the containers unless they are being reused."""
+        if not self.reuse:
+            for container in self.containers:
+                container.remove(force=True)
+
+        self.containers = list()
+
+
+def run_in_docker(user_dir, possum_path, image_name, cache_dir=None,
+                  reuse_container=False):
+    """Run the current Possum command within a Docker container.
+
+    :param str user_dir: The user's home directory
+    :param str possum_path: The path of the Possum state file
+    :param str image_name: The Docker image to run
+    :param str cache_dir: A host directory mounted as the container's pip and
+        pipenv cache so downloads and built wheels are kept between runs
+    :param bool reuse_container: Run the command in a named container that
+        is kept running between invocations instead of in a new container
+
+    :returns: The exit code of the command
+    :rtype: int
+    """
+    command = _container_command(sys.argv)
 
     client = docker.from_env()
 
@@ -90,6 +309,45 @@ def run_in_docker(user_dir, possum_path, image_name):
         ]
     }
 
+    volumes = {
+        os.path.join(user_dir, '.aws'): {
+            'bind': '/root/.aws',
+            'mode': 'ro'
+        },
+        os.path.dirname(possum_path): {
+            'bind': '/root/.possum',
+            'mode': 'rw'
+        },
+        os.getcwd(): {
+            'bind': '/var/task',
+            'mode': 'rw'
+        }
+    }
+
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        volumes[cache_dir] = {
+            'bind': CONTAINER_CACHE_DIR,
+            'mode': 'rw'
+        }
+
+    if reuse_container:
+        try:
+            container = _get_build_container(client, image_name, volumes)
+        except APIError as err:
+            logger.error(
+                f'Unable to start the build container: {err.explanation}')
+            sys.exit(1)
+
+        logger.info(f"Running in build container '{container.name}'...")
+        exec_id = client.api.exec_create(
+            container.id, command, environment=container_env,
+            workdir='/var/task')['Id']
+
+        for event in client.api.exec_start(exec_id, stream=True):
+            logger.info(event.decode().strip())
+        return client.api.exec_inspect(exec_id)['ExitCode']
+
     logger.info('Running Docker container...')
 
     try:
@@ -97,20 +355,7 @@ def run_in_docker(user_dir, possum_path, image_name):
             image=image_name,
             command=command,
             environment=container_env,
-            volumes={
-                os.path.join(user_dir, '.aws'): {
-                    'bind': '/root/.aws',
-                    'mode': 'ro'
-                },
-                os.path.dirname(possum_path): {
-                    'bind': '/root/.possum',
-                    'mode': 'rw'
-                },
-                os.getcwd(): {
-                    'bind': '/var/task',
-                    'mode': 'rw'
-                }
-            },
+            volumes=volumes,
             detach=True
         )
     except ImageNotFound:
@@ -125,6 +370,7 @@ def run_in_docker(user_dir, possum_path, image_name):
 
     for event in container.logs(stream=True):
         logger.info(event.decode().strip())
-        time.sleep(.01)
 
+    returncode = container.wait()['StatusCode']
     container.remove()
+    return returncode
@@ -24,8 +24,29 @@ def get_s3_bucket_and_dir(bucket_arg):
     return bucket, dir_
 
 
+def hash_file(path):
+    """Hashes the contents of a single file and returns the hex value.
+
+    :param path: The path to the file
+
+    :return: SHA256 hash
+    :rtype: str
+    """
+    file_hash = hashlib.sha256()
+
+    with open(path, 'rb') as f_obj:
+        while True:
+            buf = f_obj.read(1024 * 1024)
+            if not buf:
+                break
+            file_hash.update(buf)
+
+    return file_hash.hexdigest()
+
+
 def hash_directory(path):
     """Recursively hashes the contents of a directory and returns the hex value.
+    Only used to check hashes recorded by earlier versions of Possum.
 
     :param path: The path to the directory
 
@@ -0,0 +1,148 @@
+import os
+import subprocess
+
+from possum.utils.hashing import hash_files, merkle_root, walk_files
+
+# Index entries for symlinks and submodules do not describe file contents
+GIT_FILE_MODES = ('100644', '100755')
+
+
+class GitRepository:
+    """Reads the object IDs of tracked files from a git repository's index,
+    and which files in the working tree differ from it, so unchanged tracked
+    files never have to be read.
+
+    The index and status are read once, for the whole repository, on first
+    use.
+
+    :param str root: The top level directory of the working tree
+    """
+    def __init__(self, root):
+        self.root = root
+        self._objects = None
+        self._dirty_paths = None
+        self._dirty_dirs = None
+
+    @classmethod
+    def find(cls, path):
+        """Return the repository containing a directory.
+
+        :param str path: The directory
+
+        :returns: The repository, or ``None`` if the directory is not in a
+            git working tree or git is not installed
+        :rtype: GitRepository
+        """
+        try:
+            p = subprocess.run(
+                ['git', '-C', path, 'rev-parse', '--show-toplevel'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                universal_newlines=True
+            )
+        except OSError:
+            return None
+
+        if p.returncode != 0:
+            return None
+
+        return cls(os.path.realpath(p.stdout.strip()))
+
+    def _git(self, *args):
+        return subprocess.run(
+            ['git', '-C', self.root] + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=True
+        ).stdout
+
+    def _load(self):
+        self._objects = dict()
+        for record in self._git('ls-files', '--stage', '-z').split(b'\0'):
+            if not record:
+                continue
+
+            info, path = record.split(b'\t', 1)
+            mode, object_id, stage = info.decode().split()
+            if mode in GIT_FILE_MODES and stage == '0':
+                self._objects[os.fsdecode(path)] = object_id
+
+        # Modified, deleted, untracked and ignored paths; ignored or
+        # untracked directories are listed once with a trailing slash
+        self._dirty_paths = set()
+        dirty_dirs = list()
+
+        records = iter(self._git(
+            'status', '--porcelain', '-z', '--untracked-files=all',
+            '--ignored=matching', '--no-renames').split(b'\0'))
+        for record in records:
+            if not record:
+                continue
+
+            path = os.fsdecode(record[3:])
+            if path.endswith('/'):
+                dirty_dirs.append(path)
+            else:
+                self._dirty_paths.add(path)
+
+        self._dirty_dirs = tuple(dirty_dirs)
+
+    def clean_objects(self, path):
+        """Return the object IDs of the tracked files below a directory whose
+        working tree contents match the index.
+
+        :param str path: A directory within the working tree
+
+        :returns: Object IDs by path relative to ``path``
+        :rtype: dict
+        """
+        if self._objects is None:
+            self._load()
+
+        prefix = os.path.relpath(os.path.realpath(path), self.root)
+        prefix = '' if prefix == '.' else prefix.replace(os.sep, '/') + '/'
+
+        return {
+            repo_path[len(prefix):]: object_id
+            for repo_path, object_id in self._objects.items()
+            if repo_path.startswith(prefix) and
+            repo_path not in self._dirty_paths and
+            not repo_path.startswith(self._dirty_dirs)
+        }
+
+
+def hash_git_tree(repository, path, manifest=None, verify=False,
+                  max_workers=None):
+    """Hash a directory within a git working tree. Tracked files that match
+    the index are represented by their git object IDs; only modified,
+    untracked and ignored files are digested (see ``hash_files``), so an
+    unchanged checkout is hashed from metadata alone.
+
+    :param GitRepository repository: The repository containing ``path``
+    :param str path: The path to the directory
+    :param dict manifest: The manifest returned by a previous call (optional)
+    :param bool verify: Ignore the manifest and read every file that is not
+        clean in git
+    :param int max_workers: The number of threads reading files
+
+    :returns: The root hash and the new manifest, which only covers the
+        files that were digested
+    :rtype: tuple
+    """
+    objects = repository.clean_objects(path)
+
+    files = dict()
+    other_files = list()
+
+    for rel_path, file_path, file_stat in walk_files(path):
+        if rel_path in objects:
+            files[rel_path] = (
+                bool(file_stat.st_mode & 0o111), objects[rel_path])
+        else:
+            other_files.append((rel_path, file_path, file_stat))
+
+    new_manifest = hash_files(other_files, manifest, verify, max_workers)
+    for rel_path, file_info in new_manifest['files'].items():
+        files[rel_path] = (file_info[3], file_info[4])
+
+    return merkle_root(files), new_manifest
@@ -0,0 +1,177 @@
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import time
+
+HASH_PREFIX = 'blake2b:'
+DIGEST_SIZE = 32
+
+# Files larger than this are memory mapped instead of being read in one call
+MMAP_THRESHOLD = 4 * 1024 * 1024
+
+# Files modified this close to the time a manifest was recorded may change
+# again without their size or modification time changing.
+RACY_MTIME_WINDOW_NS = 2 * 10 ** 9
+
+
+def digest_file(path):
+    """Return the BLAKE2b digest of a file's contents.
+
+    :param str path: The path to the file
+
+    :rtype: str
+    """
+    file_hash = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    with open(path, 'rb') as f_obj:
+        size = os.fstat(f_obj.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f_obj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                file_hash.update(data)
+        elif size:
+            file_hash.update(f_obj.read())
+
+    return file_hash.hexdigest()
+
+
+def walk_files(path, rel_dir='', _parents=None):
+    """Yield every regular file below a directory in a stable, sorted order.
+    Symlinked directories are followed, except for a link back to one of its
+    own parent directories, which would otherwise never end.
+
+    :param str path: The directory to walk
+    :param str rel_dir: Prefix for the yielded relative paths
+
+    :returns: Tuples of the relative path (using forward slashes), the full
+        path and the ``os.stat_result`` of each file
+    """
+    parents = (_parents or frozenset()) | {os.path.realpath(path)}
+
+    with os.scandir(path) as it:
+        entries = sorted(it, key=lambda e: e.name)
+
+    for entry in entries:
+        if entry.is_dir():
+            if entry.is_symlink() and \
+                    os.path.realpath(entry.path) in parents:
+                continue
+            yield from walk_files(
+                entry.path, f'{rel_dir}{entry.name}/', parents)
+        elif entry.is_file():
+            yield f'{rel_dir}{entry.name}', entry.path, entry.stat()
+
+
+def _node_digest(tree):
+    node_hash = hashlib.blake2b(digest_size=DIGEST_SIZE)
+
+    for name in sorted(tree):
+        child = tree[name]
+        if isinstance(child, dict):
+            node_hash.update(b'd' + name.encode() + b'\0')
+            node_hash.update(_node_digest(child))
+        else:
+            executable, digest = child
+            node_hash.update((b'x' if executable else b'f') +
+                             name.encode() + b'\0')
+            node_hash.update(bytes.fromhex(digest))
+
+    return node_hash.digest()
+
+
+def merkle_root(files):
+    """Combine per-file digests into a Merkle-style root digest. Each
+    directory node covers the names, types and exec bits of its children, so
+    renames, moves and mode changes all change the root.
+
+    :param dict files: Tuples of ``(executable, digest)`` by relative path
+
+    :rtype: str
+    """
+    tree = dict()
+    for rel_path, value in files.items():
+        node = tree
+        *dirs, name = rel_path.split('/')
+        for dir_name in dirs:
+            node = node.setdefault(dir_name, dict())
+        node[name] = value
+
+    return HASH_PREFIX + _node_digest(tree).hex()
+
+
+def hash_files(files, manifest=None, verify=False, max_workers=None):
+    """Digest a set of files, reusing the digests recorded in ``manifest``
+    for files whose size, modification time and inode are unchanged. Files
+    are read in parallel threads.
+
+    The manifest records ``[size, mtime_ns, inode, executable, digest]`` for
+    each file by relative path.
+
+    :param files: Tuples of the relative path, full path and
+        ``os.stat_result`` of each file, such as from ``walk_files``
+    :param dict manifest: The manifest returned by a previous call (optional)
+    :param bool verify: Ignore the manifest and read every file
+    :param int max_workers: The number of threads reading files
+
+    :returns: The new manifest
+    :rtype: dict
+    """
+    if verify or not manifest or manifest.get('hash') != HASH_PREFIX:
+        manifest = {'created': 0, 'files': dict()}
+
+    previous_files = manifest['files']
+    racy_after = manifest['created'] - RACY_MTIME_WINDOW_NS
+
+    new_manifest = {
+        'hash': HASH_PREFIX,
+        'created': int(time.time() * 10 ** 9),
+        'files': dict()
+    }
+    to_hash = dict()
+
+    for rel_path, file_path, file_stat in files:
+        file_info = [
+            file_stat.st_size,
+            file_stat.st_mtime_ns,
+            file_stat.st_ino,
+            bool(file_stat.st_mode & 0o111)
+        ]
+
+        previous = previous_files.get(rel_path)
+        if previous and list(previous[:3]) == file_info[:3] and \
+                file_stat.st_mtime_ns < racy_after:
+            file_info.append(previous[4])
+        else:
+            to_hash[rel_path] = file_path
+
+        new_manifest['files'][rel_path] = file_info
+
+    if to_hash:
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+            digests = pool.map(digest_file, to_hash.values())
+            for rel_path, digest in zip(to_hash, digests):
+                new_manifest['files'][rel_path].append(digest)
+
+    return new_manifest
+
+
+def hash_tree(path, manifest=None, verify=False, max_workers=None):
+    """Hash a directory. Files are walked in sorted order and only files
+    whose size, modification time or inode changed since ``manifest`` was
+    recorded are read (see ``hash_files``).
+
+    :param str path: The path to the directory
+    :param dict manifest: The manifest returned by a previous call (optional)
+    :param bool verify: Ignore the manifest and read every file
+    :param int max_workers: The number of threads reading files
+
+    :returns: The root hash and the new manifest
+    :rtype: tuple
+    """
+    new_manifest = hash_files(
+        walk_files(path), manifest, verify, max_workers)
+
+    root = merkle_root(
+        {k: (v[3], v[4]) for k, v in new_manifest['files'].items()})
+
+    return root, new_manifest
@@ -3,63 +3,92 @@ import shutil
 import subprocess
 
 from possum.exc import PipenvPathNotFound
+from possum.trace import tracer
 
 
 class PipenvWrapper:
-    def __init__(self):
+    def __init__(self, project_dir=None, find_links=None):
         self.pipenv_path = shutil.which('pipenv')
 
         if not self.pipenv_path:
             raise PipenvPathNotFound
 
+        # All commands run against this directory instead of relying on the
+        # process-wide working directory so multiple wrappers can be used at
+        # the same time.
+        self.project_dir = project_dir or os.getcwd()
+
         # Force pipenv to ignore any currently active pipenv environment
-        os.environ['PIPENV_IGNORE_VIRTUALENVS'] = '1'
+        self.env = dict(os.environ, PIPENV_IGNORE_VIRTUALENVS='1')
+
+        # Install offline from a wheelhouse; pipenv passes these on to pip
+        if find_links:
+            self.env.update(PIP_NO_INDEX='1', PIP_FIND_LINKS=find_links)
+
+        self._venv_path = None
 
     @property
     def venv_path(self):
-        return self.get_virtual_environment_path()
+        if not self._venv_path:
+            self._venv_path = self.get_virtual_environment_path()
+        return self._venv_path
 
     def create_virtual_environment(self):
-        p = subprocess.Popen(
-            [self.pipenv_path, '--three'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        p.communicate()
+        with tracer.span('pipenv create venv', category='pipenv'):
+            p = subprocess.Popen(
+                [self.pipenv_path, '--three'],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=self.project_dir,
+                env=self.env
+            )
+            p.communicate()
 
     def get_virtual_environment_path(self):
-        p = subprocess.Popen(
-            [self.pipenv_path, '--venv'],
-            stdout=subprocess.PIPE
-        )
-        result = p.communicate()
-        return result[0].decode('ascii').strip('\n')
+        with tracer.span('pipenv venv path', category='pipenv'):
+            p = subprocess.Popen(
+                [self.pipenv_path, '--venv'],
+                stdout=subprocess.PIPE,
+                cwd=self.project_dir,
+                env=self.env
+            )
+            result = p.communicate()
+            return result[0].decode('ascii').strip('\n')
 
     def get_site_packages(self):
         return subprocess.check_output(
             [
-                'pipenv', 'run', 'python', '-c',
+                self.pipenv_path, 'run', 'python', '-c',
                 'from distutils.sysconfig import get_python_lib; '
                 'print(get_python_lib())'
             ],
-            universal_newlines=True
+            universal_newlines=True,
+            cwd=self.project_dir,
+            env=self.env
         ).strip()
 
     def install_packages(self):
-        p = subprocess.Popen(
-            [self.pipenv_path, 'install'],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        p.communicate()
+        with tracer.span('pipenv install', category='pipenv'):
+            p = subprocess.Popen(
+                [self.pipenv_path, 'install'],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                cwd=self.project_dir,
+                env=self.env
+            )
+            p.communicate()
 
     def remove_virtualenv(self):
-        p = subprocess.Popen(
-            [self.pipenv_path, '--rm'],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL
-        )
-        p.communicate()
+        self._venv_path = None
+        with tracer.span('pipenv remove venv', category='pipenv'):
+            p = subprocess.Popen(
+                [self.pipenv_path, '--rm'],
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                cwd=self.project_dir,
+                env=self.env
+            )
+            p.communicate()
 
     def check_package_title(self, package):
         try:
@@ -69,7 +98,8 @@ class PipenvWrapper:
             return subprocess.check_output(
                 f'{self.pipenv_path} run python -c "import '
                 f'{package}; print({package}.__title__)"',
-                shell=True, universal_newlines=True
+                shell=True, universal_newlines=True,
+                cwd=self.project_dir, env=self.env
             ).strip()
         except subprocess.CalledProcessError:
             return package
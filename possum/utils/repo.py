@@ -1,11 +1,16 @@
 import hashlib
 import os
 import sys
-
-from ruamel.yaml import YAML
+import time
 
 from possum.config import logger
 from possum.utils.general import hash_directory
+from possum.utils.git_ import GitRepository, hash_git_tree
+from possum.utils.hashing import HASH_PREFIX, hash_tree
+from possum.utils.state import StateStore
+
+# The number of package size records kept for each function
+SIZE_HISTORY_LENGTH = 20
 
 
 def _possum_name():
@@ -14,7 +19,7 @@ def _possum_name():
            f'{hashlib.sha1(cwd.encode()).hexdigest()[-8:]}'
 
 
-def get_possum_path(user_dir):
+def get_possum_dir(user_dir):
     possum_dir = os.path.join(user_dir, '.possum')
     if not os.path.exists(possum_dir):
         logger.info('Creating Possum directory...')
@@ -24,40 +29,154 @@ def get_possum_path(user_dir):
                      "allow Possum to recreate the directory")
         sys.exit(1)
 
-    return os.path.join(possum_dir, _possum_name())
+    return possum_dir
+
+
+def get_possum_path(user_dir):
+    return os.path.join(get_possum_dir(user_dir), _possum_name())
 
 
 class PossumFile(object):
+    """The state Possum keeps between runs for the project in the current
+    directory: source hashes and file manifests, S3 URIs and package sizes
+    for each function.
+
+    :param str user_dir: The user's home directory
+    """
     def __init__(self, user_dir):
-        self.path = get_possum_path(user_dir)
-        try:
-            with open(self.path, 'r') as f_obj:
-                data = YAML().load(f_obj)
-        except FileNotFoundError:
-            data = {
-                'lastRun': dict(),
-                's3Uris': dict()
-            }
-
-        self._data = data
+        legacy_path = get_possum_path(user_dir)
+        self.path = f'{legacy_path}.json'
+        self._store = StateStore(self.path, legacy_path)
+
+        # New source hashes are only recorded with the function's new S3 URI
+        self._pending_hashes = dict()
+
+        self._repositories = list()
+
+    def _find_repository(self, source_dir):
+        source_dir = os.path.join(os.path.realpath(source_dir), '')
+        for repository in self._repositories:
+            if source_dir.startswith(os.path.join(repository.root, '')):
+                return repository
+
+        repository = GitRepository.find(source_dir)
+        if repository:
+            self._repositories.append(repository)
+        else:
+            logger.info(f"'{source_dir}' is not in a git repository; "
+                        "hashing its contents instead")
+
+        return repository
 
     def save(self):
-        with open(self.path, 'w') as f_obj:
-            YAML().dump(self._data, f_obj)
+        self._store.save()
+
+    def check_hash(self, func_name, source_dir, verify=False, use_git=False):
+        """Check whether a function's source directory changed since the last
+        run. Only files whose size, modification time or inode changed are
+        read unless ``verify`` is set. With ``use_git``, tracked files that
+        are unchanged in git are identified by their object IDs instead and
+        are never read.
 
-    def check_hash(self, func_name, source_dir):
-        last_hash = self._data['lastRun'].get(func_name)
-        source_hash = hash_directory(source_dir)
+        A changed hash is not recorded until ``set_s3_uri`` is called for
+        the function, so a run that fails before the function's new artifact
+        is stored never marks it as up to date.
+
+        :param str func_name: The logical ID of the function
+        :param str source_dir: The function's source directory
+        :param bool verify: Read every file instead of trusting the manifest
+        :param bool use_git: Use git to find unchanged files, falling back to
+            hashing contents outside a git repository
+
+        :rtype: bool
+        """
+        last_hash = self._store.get('lastRun', func_name)
+        previous_manifest = self._store.get('manifests', func_name)
+
+        repository = self._find_repository(source_dir) if use_git else None
+        if repository:
+            source_hash, manifest = hash_git_tree(
+                repository, source_dir, previous_manifest, verify)
+        else:
+            source_hash, manifest = hash_tree(
+                source_dir, previous_manifest, verify)
+
+        self._store.set('manifests', func_name, manifest)
+
+        # SHA1 hashes recorded by earlier versions are upgraded if they still
+        # match
+        if last_hash and not last_hash.startswith(HASH_PREFIX) and \
+                last_hash == hash_directory(source_dir):
+            last_hash = source_hash
 
         if last_hash == source_hash:
+            self._store.set('lastRun', func_name, source_hash)
             return True
-        else:
-            self._data['lastRun'][func_name] = source_hash
-            return False
+
+        self._pending_hashes[func_name] = source_hash
+        return False
 
     def get_last_s3_uri(self, func_name):
-        s3_uri = self._data['s3Uris'].get(func_name)
+        s3_uri = self._store.get('s3Uris', func_name)
         return s3_uri
 
     def set_s3_uri(self, func_name, s3_uri):
-        self._data['s3Uris'][func_name] = s3_uri
+        self._store.set('s3Uris', func_name, s3_uri)
+        if func_name in self._pending_hashes:
+            self._store.set(
+                'lastRun', func_name, self._pending_hashes.pop(func_name))
+
+    def get_size_history(self, func_name):
+        """Return the package sizes recorded for a function, oldest first.
+
+        :param str func_name: The logical ID of the function
+
+        :rtype: list
+        """
+        return [dict(i) for i in self._store.get('sizes', func_name, list())]
+
+    def add_size_record(self, func_name, report):
+        """Record the size of a function's newly built package.
+
+        :param str func_name: The logical ID of the function
+        :param dict report: A report from ``analyze_artifact``
+        """
+        history = self.get_size_history(func_name)
+        history.append({
+            'timestamp': int(time.time()),
+            'artifact': report['artifact'],
+            'files': report['files'],
+            'compressedBytes': report['compressed_bytes'],
+            'uncompressedBytes': report['uncompressed_bytes']
+        })
+        self._store.set('sizes', func_name, history[-SIZE_HISTORY_LENGTH:])
+
+    def get_layer(self, layer_key):
+        """Return the record of the last shared dependency layer built for a
+        dependency set.
+
+        :param str layer_key: The key from ``get_layer_key``
+
+        :returns: The layer's S3 URI and uncompressed size, or ``None``
+        :rtype: dict
+        """
+        return self._store.get('layers', layer_key)
+
+    def set_layer(self, layer_key, s3_uri, uncompressed_bytes):
+        self._store.set('layers', layer_key, {
+            's3Uri': s3_uri,
+            'uncompressedBytes': uncompressed_bytes
+        })
+
+    def get_function_layer(self, func_name):
+        """Return the key of the shared dependency layer the function's last
+        artifact was built for, or ``None`` if it bundled its dependencies.
+
+        :param str func_name: The logical ID of the function
+
+        :rtype: str
+        """
+        return self._store.get('functionLayers', func_name)
+
+    def set_function_layer(self, func_name, layer_key):
+        self._store.set('functionLayers', func_name, layer_key)
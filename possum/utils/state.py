@@ -0,0 +1,145 @@
+import contextlib
+import json
+import os
+import tempfile
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+from ruamel.yaml import YAML
+
+from possum.config import logger
+from possum.exc import StateFileError
+
+STATE_VERSION = 1
+
+
+class StateStore:
+    """Possum's state for a project, stored as a compact JSON file of
+    sections (such as ``s3Uris`` or ``manifests``) that map keys to values.
+
+    Values are read from a snapshot taken when the store is opened. Changes
+    are kept in memory until ``save()`` locks the file, merges them into its
+    latest contents and atomically replaces it. Concurrent runs against the
+    same project therefore only overwrite the values they changed, and a
+    crash can never leave a partially written file.
+
+    :param str path: The path of the JSON file
+    :param str legacy_path: A YAML state file from an earlier version of
+        Possum to migrate if the JSON file does not exist yet
+    """
+    def __init__(self, path, legacy_path=None):
+        self.path = path
+        self.lock_path = f'{path}.lock'
+        self._changes = dict()
+
+        if legacy_path and not os.path.exists(path) and \
+                os.path.isfile(legacy_path):
+            self._migrate(legacy_path)
+
+        with self._lock(exclusive=False):
+            self._data = self._read()
+
+    @contextlib.contextmanager
+    def _lock(self, exclusive=True):
+        if fcntl is None:
+            yield
+            return
+
+        with open(self.lock_path, 'a') as lock_file:
+            fcntl.flock(
+                lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f_obj:
+                data = json.load(f_obj)
+        except FileNotFoundError:
+            return {'version': STATE_VERSION}
+        except ValueError as error:
+            raise StateFileError(f"'{self.path}' could not be read: {error}")
+
+        if not isinstance(data, dict) or \
+                data.get('version', 0) > STATE_VERSION:
+            raise StateFileError(
+                f"'{self.path}' was written by a newer version of Possum")
+
+        return data
+
+    def _write(self, data):
+        fd, temp_path = tempfile.mkstemp(
+            prefix=f'.{os.path.basename(self.path)}.',
+            dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'w') as f_obj:
+                json.dump(data, f_obj, separators=(',', ':'))
+                f_obj.flush()
+                os.fsync(f_obj.fileno())
+
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _migrate(self, legacy_path):
+        with self._lock():
+            if os.path.exists(self.path):
+                return
+
+            logger.info('Migrating the Possum file to the new state format...')
+            try:
+                with open(legacy_path, 'r') as f_obj:
+                    data = YAML().load(f_obj) or dict()
+
+                # Converts the YAML loader's types into plain dicts and lists
+                data = json.loads(json.dumps(data))
+            except Exception as error:
+                raise StateFileError(
+                    f"'{legacy_path}' could not be migrated: "
+                    f"{type(error).__name__}")
+
+            data['version'] = STATE_VERSION
+            self._write(data)
+
+    def get(self, section, key, default=None):
+        """Return a value, including changes that have not been saved.
+
+        :param str section: The section of the state
+        :param str key: The key within the section
+        :param default: The value to return if the key is not set
+        """
+        if key in self._changes.get(section, dict()):
+            return self._changes[section][key]
+
+        return self._data.get(section, dict()).get(key, default)
+
+    def set(self, section, key, value):
+        """Change a value. The change is written by the next ``save()``.
+
+        :param str section: The section of the state
+        :param str key: The key within the section
+        :param value: A value that can be serialized as JSON
+        """
+        self._changes.setdefault(section, dict())[key] = value
+
+    def save(self):
+        """Merge the unsaved changes into the state file."""
+        if not self._changes:
+            return
+
+        with self._lock():
+            data = self._read()
+            for section, values in self._changes.items():
+                data.setdefault(section, dict()).update(values)
+
+            data['version'] = STATE_VERSION
+            self._write(data)
+
+        self._data = data
+        self._changes = dict()
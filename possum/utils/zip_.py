@@ -0,0 +1,285 @@
+import collections
+import concurrent.futures
+import os
+import struct
+import zlib
+
+from possum.exc import PossumException
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Content that is already compressed and gains nothing from being deflated
+INCOMPRESSIBLE_EXTENSIONS = frozenset([
+    '.7z', '.br', '.bz2', '.egg', '.gif', '.gz', '.jar', '.jpeg', '.jpg',
+    '.lz4', '.mp3', '.mp4', '.npz', '.png', '.tgz', '.webp', '.whl', '.xz',
+    '.zip', '.zst'
+])
+
+# Files without a known extension are stored when deflating a sample of
+# their first bytes does not shrink it below this ratio
+SAMPLE_SIZE = 64 * 1024
+STORE_RATIO = 0.95
+
+# Files larger than this are compressed as they are written instead of in a
+# worker thread, so they are never held in memory in full
+STREAM_THRESHOLD = 16 * 1024 * 1024
+
+CHUNK_SIZE = 1024 * 1024
+ZIP32_LIMIT = 0xFFFFFFFF
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+UNIX_SYSTEM = 3
+
+LOCAL_HEADER = struct.Struct('<4s5H3L2H')
+CENTRAL_HEADER = struct.Struct('<4s6H3L5H2L')
+DATA_DESCRIPTOR = struct.Struct('<4s3L')
+END_RECORD = struct.Struct('<4s4H2LH')
+ZIP64_END_RECORD = struct.Struct('<4sQ2H2L4Q')
+ZIP64_END_LOCATOR = struct.Struct('<4sLQL')
+
+
+class ArchiveEntry:
+    """A file to add to an archive.
+
+    :param str arcname: The path of the file within the archive
+    :param str path: The path of the file to read
+    :param int size: The size of the file
+    :param tuple date_time: The timestamp to record for the file
+    :param int mode: The permission bits to record for the file
+    """
+    def __init__(self, arcname, path, size, date_time, mode):
+        self.arcname = arcname
+        self.path = path
+        self.size = size
+        self.date_time = date_time
+        self.mode = mode
+
+
+def _dos_date_time(date_time):
+    year, month, day, hour, minute, second = date_time
+    return (
+        (year - 1980) << 9 | month << 5 | day,
+        hour << 11 | minute << 5 | second // 2
+    )
+
+
+def _new_compressor(level):
+    return zlib.compressobj(level, zlib.DEFLATED, -15)
+
+
+def should_store(path, sample, level):
+    """Decide whether a file should be stored without compression, based on
+    its extension or on how well a sample of its contents compresses.
+
+    :param str path: The path of the file
+    :param bytes sample: The first bytes of the file
+    :param int level: The compression level in use
+
+    :rtype: bool
+    """
+    if level == 0 or not sample:
+        return True
+
+    if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+        return True
+
+    sample = sample[:SAMPLE_SIZE]
+    compressor = _new_compressor(1)
+    compressed = compressor.compress(sample) + compressor.flush()
+    return len(compressed) >= len(sample) * STORE_RATIO
+
+
+def compress_entry(entry, level):
+    """Read and compress a file in full. This runs in worker threads; zlib
+    releases the GIL while it works.
+
+    :param ArchiveEntry entry: The file to compress
+    :param int level: The deflate compression level (0-9)
+
+    :returns: The entry, compression method, CRC32, uncompressed size and
+        compressed data
+    :rtype: tuple
+    """
+    with open(entry.path, 'rb') as f_obj:
+        data = f_obj.read()
+
+    crc = zlib.crc32(data)
+
+    if should_store(entry.path, data, level):
+        return entry, ZIP_STORED, crc, len(data), data
+
+    compressor = _new_compressor(level)
+    compressed = compressor.compress(data) + compressor.flush()
+    return entry, ZIP_DEFLATED, crc, len(data), compressed
+
+
+class ZipWriter:
+    """A minimal zip archive writer for unseekable streams that accepts data
+    which has already been compressed.
+
+    :param fileobj: The writable stream to write the archive to
+    """
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self._central_directory = list()
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def _write_local_header(self, entry, flags, method, crc, compressed_size,
+                            file_size):
+        name = entry.arcname.encode('utf-8')
+        dos_date, dos_time = _dos_date_time(entry.date_time)
+
+        if len(name) != len(entry.arcname):
+            flags |= 0x800  # The name is UTF-8 encoded
+
+        if self.offset > ZIP32_LIMIT:
+            raise PossumException('Lambda packages larger than 4 GB are not '
+                                  'supported')
+
+        self._central_directory.append((
+            name, flags, method, dos_time, dos_date, entry.mode, self.offset))
+
+        self._write(LOCAL_HEADER.pack(
+            b'PK\x03\x04', ZIP_VERSION, flags, method, dos_time, dos_date,
+            crc, compressed_size, file_size, len(name), 0))
+        self._write(name)
+
+    def _finish_central_entry(self, crc, compressed_size, file_size):
+        if compressed_size > ZIP32_LIMIT or file_size > ZIP32_LIMIT:
+            raise PossumException('Files larger than 4 GB are not supported')
+
+        self._central_directory[-1] += (crc, compressed_size, file_size)
+
+    def write_compressed(self, entry, method, crc, file_size, data):
+        """Write an entry whose data has already been compressed.
+
+        :param ArchiveEntry entry: The file being written
+        :param int method: ``ZIP_STORED`` or ``ZIP_DEFLATED``
+        :param int crc: The CRC32 of the uncompressed data
+        :param int file_size: The size of the uncompressed data
+        :param bytes data: The (compressed) data
+        """
+        self._write_local_header(
+            entry, 0, method, crc, len(data), file_size)
+        self._write(data)
+        self._finish_central_entry(crc, len(data), file_size)
+
+    def write_stream(self, entry, level):
+        """Compress and write a file in chunks. The sizes and CRC32 follow
+        the data in a data descriptor.
+
+        :param ArchiveEntry entry: The file being written
+        :param int level: The deflate compression level (0-9)
+        """
+        with open(entry.path, 'rb') as f_obj:
+            chunk = f_obj.read(CHUNK_SIZE)
+            method = ZIP_STORED if should_store(
+                entry.path, chunk, level) else ZIP_DEFLATED
+            compressor = None
+            if method == ZIP_DEFLATED:
+                compressor = _new_compressor(level)
+
+            self._write_local_header(entry, 0x08, method, 0, 0, 0)
+
+            crc = 0
+            file_size = 0
+            compressed_size = 0
+
+            while chunk:
+                crc = zlib.crc32(chunk, crc)
+                file_size += len(chunk)
+                data = compressor.compress(chunk) if compressor else chunk
+                compressed_size += len(data)
+                self._write(data)
+                chunk = f_obj.read(CHUNK_SIZE)
+
+            if compressor:
+                data = compressor.flush()
+                compressed_size += len(data)
+                self._write(data)
+
+        self._write(DATA_DESCRIPTOR.pack(
+            b'PK\x07\x08', crc, compressed_size, file_size))
+        self._finish_central_entry(crc, compressed_size, file_size)
+
+    def file_sizes(self):
+        """Return the sizes of the files written so far.
+
+        :returns: Tuples of the archive name, uncompressed size and
+            compressed size of each file
+        :rtype: list
+        """
+        return [
+            (i[0].decode('utf-8'), i[9], i[8])
+            for i in self._central_directory
+        ]
+
+    def close(self):
+        """Write the central directory and end records."""
+        start = self.offset
+
+        for name, flags, method, dos_time, dos_date, mode, offset, crc, \
+                compressed_size, file_size in self._central_directory:
+            self._write(CENTRAL_HEADER.pack(
+                b'PK\x01\x02', UNIX_SYSTEM << 8 | ZIP_VERSION, ZIP_VERSION,
+                flags, method, dos_time, dos_date, crc, compressed_size,
+                file_size, len(name), 0, 0, 0, 0, (0o100000 | mode) << 16,
+                offset))
+            self._write(name)
+
+        count = len(self._central_directory)
+        size = self.offset - start
+
+        if count >= 0xFFFF or start > ZIP32_LIMIT:
+            end_offset = self.offset
+            self._write(ZIP64_END_RECORD.pack(
+                b'PK\x06\x06', ZIP64_END_RECORD.size - 12, ZIP64_VERSION,
+                ZIP64_VERSION, 0, 0, count, count, size, start))
+            self._write(ZIP64_END_LOCATOR.pack(
+                b'PK\x06\x07', 0, end_offset, 1))
+            count = min(count, 0xFFFF)
+            start = min(start, ZIP32_LIMIT)
+
+        self._write(END_RECORD.pack(
+            b'PK\x05\x06', 0, 0, count, count, size, start, 0))
+
+
+def write_archive(entries, fileobj, level=6, max_workers=None):
+    """Write a zip archive. Files are compressed in parallel worker threads
+    and written to the archive in the order given, so the output does not
+    depend on which thread finishes first.
+
+    :param entries: ``ArchiveEntry`` objects to write
+    :param fileobj: The writable stream to write the archive to
+    :param int level: The deflate compression level (0-9)
+    :param int max_workers: The number of compression threads
+
+    :returns: The sizes of the files written (see ``ZipWriter.file_sizes``)
+    :rtype: list
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    writer = ZipWriter(fileobj)
+    pending = collections.deque()
+
+    def drain(limit):
+        while len(pending) > limit:
+            writer.write_compressed(*pending.popleft().result())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        for entry in entries:
+            if entry.size > STREAM_THRESHOLD:
+                drain(0)
+                writer.write_stream(entry, level)
+            else:
+                pending.append(pool.submit(compress_entry, entry, level))
+                drain(max_workers * 2)
+
+        drain(0)
+
+    writer.close()
+    return writer.file_sizes()
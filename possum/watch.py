@@ -0,0 +1,308 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from possum.config import logger
+
+__all__ = [
+    'InotifyWatcher',
+    'PollingWatcher',
+    'get_watcher',
+    'match_functions',
+    'wait_for_changes'
+]
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+    IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | \
+    IN_ONLYDIR
+
+# struct inotify_event: wd, mask, cookie and the length of the name after it
+EVENT_HEADER = struct.Struct('iIII')
+READ_SIZE = 64 * 1024
+
+
+def _load_libc():
+    if not sys.platform.startswith('linux'):
+        return None
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+
+    return libc
+
+
+def _unique_roots(paths):
+    return sorted(set(os.path.normpath(i) for i in paths))
+
+
+class InotifyWatcher:
+    """Watches directory trees for changes with Linux inotify (through
+    ``ctypes``, so nothing has to be installed). Directories created or moved
+    into a tree are watched as they appear.
+
+    :param list paths: The directories to watch
+
+    :raises OSError: If inotify is not available or the watch limit was
+        reached
+    """
+    def __init__(self, paths):
+        self._libc = _load_libc()
+        if not self._libc:
+            raise OSError(errno.ENOSYS, 'inotify is not supported')
+
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        self.paths = _unique_roots(paths)
+        self._watches = dict()
+
+        try:
+            for path in self.paths:
+                self._add_tree(path)
+        except OSError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            # The directory was removed before it could be watched
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return
+            raise OSError(error, os.strerror(error), path)
+
+        self._watches[wd] = path
+
+    def _add_tree(self, path):
+        self._add_watch(path)
+        for root, dirs, _ in os.walk(path):
+            for name in dirs:
+                self._add_watch(os.path.join(root, name))
+
+    def read(self, timeout=None):
+        """Wait for changes.
+
+        :param float timeout: The number of seconds to wait (waits
+            indefinitely if ``None``)
+
+        :returns: The changed paths, which is empty if nothing changed before
+            the timeout
+        :rtype: set
+        """
+        changed = set()
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return changed
+
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+
+            # Events were dropped: anything may have changed
+            if mask & IN_Q_OVERFLOW:
+                changed.update(self.paths)
+                continue
+
+            directory = self._watches.get(wd)
+            if directory is None:
+                continue
+
+            if mask & IN_IGNORED:
+                del self._watches[wd]
+                continue
+
+            path = os.path.join(directory, os.fsdecode(name)) \
+                if name else directory
+            changed.add(path)
+
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._add_tree(path)
+
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """Watches directory trees for changes by comparing the size,
+    modification time, inode and mode of every file at an interval. Used
+    where inotify is not available.
+
+    :param list paths: The directories to watch
+    :param float interval: The number of seconds between scans
+    """
+    def __init__(self, paths, interval=1.0):
+        self.paths = _unique_roots(paths)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _scan(self):
+        snapshot = dict()
+        for path in self.paths:
+            for root, _, files in os.walk(path):
+                for name in files:
+                    file_path = os.path.join(root, name)
+                    try:
+                        file_stat = os.stat(file_path)
+                    except OSError:
+                        continue
+
+                    snapshot[file_path] = (
+                        file_stat.st_size,
+                        file_stat.st_mtime_ns,
+                        file_stat.st_ino,
+                        file_stat.st_mode
+                    )
+
+        return snapshot
+
+    def read(self, timeout=None):
+        """Wait for changes.
+
+        :param float timeout: The number of seconds to wait (waits
+            indefinitely if ``None``)
+
+        :returns: The changed paths, which is empty if nothing changed before
+            the timeout
+        :rtype: set
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        while True:
+            snapshot = self._scan()
+            changed = {
+                i for i in set(snapshot) | set(self._snapshot)
+                if snapshot.get(i) != self._snapshot.get(i)
+            }
+            self._snapshot = snapshot
+
+            if changed:
+                return changed
+
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+def get_watcher(paths, poll=False, interval=1.0):
+    """Return an inotify watcher for a list of directories, or a polling
+    watcher if inotify can't be used.
+
+    :param list paths: The directories to watch
+    :param bool poll: Always use a polling watcher
+    :param float interval: The number of seconds between scans when polling
+
+    :rtype: InotifyWatcher or PollingWatcher
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(paths)
+        except OSError as error:
+            logger.warning(f'inotify cannot be used ({error}); polling for '
+                           'changes instead')
+
+    return PollingWatcher(paths, interval)
+
+
+def wait_for_changes(watcher, debounce=0.5):
+    """Block until something changes, then keep collecting changes until
+    none were seen for ``debounce`` seconds, so a burst of saves results in
+    a single rebuild.
+
+    :param watcher: An ``InotifyWatcher`` or ``PollingWatcher``
+    :param float debounce: The quiet period in seconds
+
+    :returns: The changed paths
+    :rtype: set
+    """
+    changed = set()
+    while not changed:
+        changed = watcher.read()
+
+    while True:
+        more = watcher.read(debounce)
+        if not more:
+            return changed
+        changed.update(more)
+
+
+def match_functions(paths, source_dirs):
+    """Return the functions whose source directory contains any of a set of
+    changed paths.
+
+    :param set paths: The changed paths
+    :param dict source_dirs: Each function's source directory by logical ID
+
+    :rtype: set
+    """
+    paths = [os.path.normpath(i) for i in paths]
+    functions = set()
+
+    for func, source_dir in source_dirs.items():
+        source_dir = os.path.normpath(source_dir)
+        prefix = os.path.join(source_dir, '')
+        if any(i == source_dir or i.startswith(prefix) for i in paths):
+            functions.add(func)
+
+    return functions
@@ -0,0 +1,130 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from possum.exc import WheelhouseError
+from possum.trace import tracer
+from possum.utils import run_container
+
+__all__ = [
+    'WHEEL_COMMAND',
+    'build_wheelhouse',
+    'list_wheels'
+]
+
+# Every distribution in a lock file is pinned, so dependencies are not
+# resolved again. Wheels already in the wheelhouse are used instead of being
+# downloaded or built again.
+WHEEL_COMMAND = [
+    '-m', 'pip', 'wheel',
+    '--no-deps',
+    '--disable-pip-version-check',
+    '--no-input',
+    '--quiet'
+]
+
+
+def list_wheels(wheel_dir):
+    """Return the names of the wheels in a directory.
+
+    :param str wheel_dir: The wheelhouse directory
+
+    :rtype: list
+    """
+    return sorted(i for i in os.listdir(wheel_dir) if i.endswith('.whl'))
+
+
+def _wheel_command(python_path, wheel_dir, requirements_file):
+    return [python_path] + WHEEL_COMMAND + [
+        '--wheel-dir', wheel_dir,
+        '--find-links', wheel_dir,
+        '-r', requirements_file
+    ]
+
+
+def _build_wheels(requirements_file, wheel_dir, python_path, docker_image):
+    with tracer.span('build wheels', requirements=requirements_file):
+        if docker_image:
+            # Both directories are mounted at the same paths so the command
+            # is unchanged, and files are written as the user running Possum.
+            scratch_dir = os.path.dirname(requirements_file)
+            returncode, stdout, stderr = run_container(
+                docker_image,
+                _wheel_command('python', wheel_dir, requirements_file),
+                volumes={
+                    i: {'bind': i, 'mode': 'rw'}
+                    for i in (wheel_dir, scratch_dir)
+                },
+                environment={'HOME': '/tmp'},
+                user=f'{os.getuid()}:{os.getgid()}'
+                if hasattr(os, 'getuid') else ''
+            )
+        else:
+            p = subprocess.run(
+                _wheel_command(python_path, wheel_dir, requirements_file),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True
+            )
+            returncode, stdout, stderr = p.returncode, p.stdout, p.stderr
+
+    if returncode != 0:
+        raise WheelhouseError(stderr.strip() or stdout.strip())
+
+
+def build_wheelhouse(requirements, wheel_dir, python_path=None,
+                     max_workers=1, docker_image=None):
+    """Download or build a wheel for every requirement into a directory that
+    functions can later be installed from without an index (see the
+    ``find_links`` option of the installers).
+
+    The requirements are split between ``max_workers`` pip processes that
+    run in parallel.
+
+    :param list requirements: Pinned pip requirement lines and options, such
+        as those from ``get_lockfile_requirements``
+    :param str wheel_dir: The wheelhouse directory
+    :param str python_path: The interpreter to run pip with (defaults to the
+        interpreter running Possum)
+    :param int max_workers: The number of pip processes to run at once
+    :param str docker_image: Run pip in containers from this image instead
+
+    :returns: The names of the wheels in the wheelhouse
+    :rtype: list
+    """
+    os.makedirs(wheel_dir, exist_ok=True)
+    wheel_dir = os.path.abspath(wheel_dir)
+    python_path = python_path or sys.executable
+
+    # Options such as the index URLs apply to every batch
+    options = [i for i in requirements if i.startswith('-')]
+    requirements = [i for i in requirements if not i.startswith('-')]
+    batches = [
+        options + requirements[i::max_workers]
+        for i in range(min(max_workers, len(requirements)))
+    ]
+
+    scratch_dir = tempfile.mkdtemp(prefix='possum-wheelhouse-')
+    try:
+        requirements_files = list()
+        for index, batch in enumerate(batches):
+            path = os.path.join(scratch_dir, f'requirements-{index}.txt')
+            with open(path, 'w') as f_obj:
+                f_obj.write('\n'.join(batch) + '\n')
+            requirements_files.append(path)
+
+        with ThreadPoolExecutor(max(len(batches), 1)) as executor:
+            futures = [
+                executor.submit(
+                    _build_wheels, i, wheel_dir, python_path, docker_image)
+                for i in requirements_files
+            ]
+            for future in futures:
+                future.result()
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    return list_wheels(wheel_dir)
@@ -25,7 +25,7 @@ about = about_module()
 
 requirements = [
     "boto3>=1.9.36",
-    "docker>=3.5.1",
+    "docker>=6.0.0",
     "ruamel.yaml>=0.15.76",
     "toml>=0.10.0"
 ]
@@ -43,14 +43,14 @@ setup(
         'bin/possum'
     ],
     packages=find_packages(),
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     install_requires=requirements,
     extras_require={},
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'License :: OSI Approved :: MIT License',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Build Tools'
     ],
     zip_safe=False
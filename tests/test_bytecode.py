@@ -0,0 +1,34 @@
+import marshal
+import sys
+
+import pytest
+
+from possum.bytecode import compile_package_entries, LAYER_MOUNT_DIR
+from possum.packages import collect_package_entries
+
+
+def read_source_path(pyc_path):
+    with open(pyc_path, 'rb') as f:
+        return marshal.loads(f.read()[16:]).co_filename
+
+
+@pytest.mark.parametrize('mount_dir, expected', [
+    (None, '/var/task/mylib/__init__.py'),
+    (LAYER_MOUNT_DIR + 'python/', '/opt/python/mylib/__init__.py'),
+])
+def test_source_path(tmp_path, mount_dir, expected):
+    package_dir = tmp_path / 'package'
+    (package_dir / 'mylib').mkdir(parents=True)
+    (package_dir / 'mylib' / '__init__.py').write_text('x = 1\n')
+
+    options = {'mount_dir': mount_dir} if mount_dir else {}
+    entries, compiled = compile_package_entries(
+        collect_package_entries(str(package_dir)),
+        str(tmp_path / 'bytecode'),
+        sys.executable,
+        **options
+    )
+
+    assert compiled == 1
+    pyc_path = next(i[1] for i in entries if i[0].endswith('.pyc'))
+    assert read_source_path(pyc_path) == expected
@@ -0,0 +1,74 @@
+import pytest
+
+from possum.utils.cache import DependencyCache, get_unpinned_reason
+
+
+def write_files(project_dir, **files):
+    for name, content in files.items():
+        (project_dir / name.replace('_', '.')).write_text(content)
+
+
+@pytest.mark.parametrize('requirements', [
+    'requests==2.31.0\n',
+    'requests[socks]==2.31.0 ; python_version >= "3.8"\n',
+    '# Comment\n-i https://pypi.org/simple\nboto3===1.34.0  # pinned\n',
+    'attrs==23.1.0 \\\n    --hash=sha256:1f28b4522cdc2fb4256ac1a020c78acf\n',
+    'https://example.com/mylib-1.0.tar.gz#sha256=0123abcd\n',
+])
+def test_pinned_requirements(tmp_path, requirements):
+    write_files(tmp_path, requirements_txt=requirements)
+    assert get_unpinned_reason(str(tmp_path)) is None
+
+
+@pytest.mark.parametrize('requirements', [
+    'requests\n',
+    'boto3>=1.20\n',
+    'requests==2.*\n',
+    'requests>=2,==2.31.0\n',
+    'https://example.com/mylib-1.0.tar.gz\n',
+    '-e ../shared\n',
+    '-r base.txt\n',
+])
+def test_unpinned_requirements(tmp_path, requirements):
+    write_files(tmp_path, requirements_txt='six==1.16.0\n' + requirements)
+    assert get_unpinned_reason(str(tmp_path))
+
+
+def test_pipfile_without_lock(tmp_path):
+    write_files(tmp_path, Pipfile='[packages]\nrequests = "*"\n')
+    assert get_unpinned_reason(str(tmp_path)) == \
+        'the Pipfile has no Pipfile.lock'
+
+
+def test_lockfile_is_pinned(tmp_path):
+    write_files(
+        tmp_path,
+        Pipfile='[packages]\nrequests = "*"\n',
+        Pipfile_lock='{"default": {}}',
+        requirements_txt='requests\n'
+    )
+    assert get_unpinned_reason(str(tmp_path)) is None
+
+
+def test_no_requirements(tmp_path):
+    assert get_unpinned_reason(str(tmp_path)) is None
+
+
+def test_local_package_changes_key(tmp_path):
+    project_dir = tmp_path / 'function'
+    shared_dir = tmp_path / 'shared'
+    project_dir.mkdir()
+    shared_dir.mkdir()
+    (shared_dir / 'setup.py').write_text('')
+    write_files(
+        project_dir,
+        Pipfile_lock='{"default": {"shared": {"path": "../shared"}}}'
+    )
+
+    cache = DependencyCache(str(tmp_path / 'cache'), 'python3.11', 'pip')
+    key = cache.get_key(str(project_dir))
+    cache.commit(key, cache.staging_dir())
+    assert cache.contains(cache.get_key(str(project_dir)))
+
+    (shared_dir / 'shared.py').write_text('VALUE = 2\n')
+    assert not cache.contains(cache.get_key(str(project_dir)))
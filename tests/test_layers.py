@@ -0,0 +1,19 @@
+from possum.layers import get_layer_key
+
+
+def test_local_package_changes_key(tmp_path):
+    source_dir = tmp_path / 'function'
+    shared_dir = tmp_path / 'shared'
+    source_dir.mkdir()
+    shared_dir.mkdir()
+    (shared_dir / 'setup.py').write_text('')
+    (source_dir / 'Pipfile.lock').write_text(
+        '{"default": {"shared": {"path": "../shared"}}}')
+
+    key = get_layer_key(str(source_dir), 'python3.11', 'x86_64', 'pip')
+    assert get_layer_key(
+        str(source_dir), 'python3.11', 'x86_64', 'pip') == key
+
+    (shared_dir / 'shared.py').write_text('VALUE = 2\n')
+    assert get_layer_key(
+        str(source_dir), 'python3.11', 'x86_64', 'pip') != key
@@ -0,0 +1,27 @@
+import os
+
+from possum.packages import collect_package_entries
+
+
+def test_symlinked_directory(tmp_path):
+    source_dir = tmp_path / 'src'
+    shared_dir = tmp_path / 'shared'
+    source_dir.mkdir()
+    shared_dir.mkdir()
+    (source_dir / 'app.py').write_text('')
+    (shared_dir / 'util.py').write_text('')
+    os.symlink('../shared', str(source_dir / 'shared'))
+
+    entries = collect_package_entries(str(source_dir))
+
+    assert [i[0] for i in entries] == ['app.py', 'shared/util.py']
+
+
+def test_symlink_loop(tmp_path):
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'mod.py').write_text('')
+    os.symlink('..', str(tmp_path / 'pkg' / 'parent'))
+
+    entries = collect_package_entries(str(tmp_path))
+
+    assert [i[0] for i in entries] == ['pkg/mod.py']
@@ -0,0 +1,155 @@
+import json
+import os
+
+import pytest
+
+from possum.exc import PossumException
+from possum.reqs import get_lockfile_requirements, get_pipfile_requirements
+
+
+PYPI = {'name': 'pypi', 'url': 'https://pypi.org/simple', 'verify_ssl': True}
+PRIVATE = {
+    'name': 'private',
+    'url': 'https://pypi.example.com/simple',
+    'verify_ssl': False
+}
+
+
+def write_lockfile(project_dir, packages, sources=None):
+    lockfile = project_dir / 'Pipfile.lock'
+    lockfile.write_text(json.dumps({
+        '_meta': {'sources': sources or [PYPI]},
+        'default': packages
+    }))
+    return str(lockfile)
+
+
+def test_version(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'requests': {'version': '==2.31.0', 'extras': ['socks']}
+    })
+    assert get_lockfile_requirements(lockfile) == ['requests[socks]==2.31.0']
+
+
+def test_path(tmp_path):
+    lockfile = write_lockfile(tmp_path, {'shared': {'path': '../shared'}})
+    assert get_lockfile_requirements(lockfile) == [
+        os.path.join(str(tmp_path.parent), 'shared')
+    ]
+
+
+def test_editable_path(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'shared': {'path': '../shared', 'editable': True}
+    })
+    assert get_lockfile_requirements(lockfile) == [
+        os.path.join(str(tmp_path.parent), 'shared')
+    ]
+
+
+def test_file_url(tmp_path):
+    url = 'https://example.com/mylib-1.0.tar.gz'
+    lockfile = write_lockfile(tmp_path, {'mylib': {'file': url}})
+    assert get_lockfile_requirements(lockfile) == [url]
+
+
+def test_relative_file(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'mylib': {
+            'file': 'vendor/mylib-1.0.tar.gz',
+            'markers': "os_name == 'posix'"
+        }
+    })
+    assert get_lockfile_requirements(lockfile) == [
+        f"{os.path.join(str(tmp_path), 'vendor', 'mylib-1.0.tar.gz')}; "
+        "os_name == 'posix'"
+    ]
+
+
+def test_pipfile_path(tmp_path):
+    pipfile = tmp_path / 'Pipfile'
+    pipfile.write_text(
+        '[packages]\nshared = {path = "./shared", editable = true}\n')
+    assert get_pipfile_requirements(str(pipfile)) == [
+        os.path.join(str(tmp_path), 'shared')
+    ]
+
+
+def test_unsupported_vcs(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'mylib': {'hg': 'https://example.com/mylib'}
+    })
+    with pytest.raises(PossumException, match='--installer pipenv'):
+        get_lockfile_requirements(lockfile)
+
+
+def test_hashes(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'six': {
+            'version': '==1.16.0',
+            'hashes': ['sha256:aaaa', 'sha256:bbbb'],
+            'markers': "python_version >= '3.8'"
+        }
+    })
+    assert get_lockfile_requirements(lockfile) == [
+        "six==1.16.0; python_version >= '3.8' "
+        "--hash=sha256:aaaa --hash=sha256:bbbb"
+    ]
+    assert get_lockfile_requirements(lockfile, hashes=False) == [
+        "six==1.16.0; python_version >= '3.8'"
+    ]
+
+
+def test_unhashed_package_disables_hashes(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'six': {'version': '==1.16.0', 'hashes': ['sha256:aaaa']},
+        'shared': {'path': './shared'}
+    })
+    assert get_lockfile_requirements(lockfile) == [
+        os.path.join(str(tmp_path), 'shared'), 'six==1.16.0'
+    ]
+
+
+def test_sources(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'mylib': {
+            'version': '==1.0',
+            'hashes': ['sha256:aaaa'],
+            'index': 'private'
+        }
+    }, sources=[PYPI, PRIVATE])
+    assert get_lockfile_requirements(lockfile) == [
+        '--index-url https://pypi.org/simple',
+        '--extra-index-url https://pypi.example.com/simple',
+        '--trusted-host pypi.example.com',
+        'mylib==1.0 --hash=sha256:aaaa'
+    ]
+    assert get_lockfile_requirements(lockfile, hashes=False, index=False) \
+        == ['mylib==1.0']
+
+
+def test_unchecked_private_index(tmp_path):
+    lockfile = write_lockfile(tmp_path, {
+        'mylib': {'version': '==1.0', 'index': 'private'}
+    }, sources=[PYPI, PRIVATE])
+    with pytest.raises(PossumException, match='--installer pipenv'):
+        get_lockfile_requirements(lockfile)
+
+
+def test_pipfile_private_index(tmp_path):
+    pipfile = tmp_path / 'Pipfile'
+    pipfile.write_text(
+        '[[source]]\nname = "private"\n'
+        'url = "https://pypi.example.com/simple"\nverify_ssl = true\n\n'
+        '[packages]\nmylib = "==1.0"\n')
+    assert get_pipfile_requirements(str(pipfile)) == [
+        '--index-url https://pypi.example.com/simple', 'mylib==1.0'
+    ]
+
+    pipfile.write_text(
+        '[[source]]\nname = "pypi"\nurl = "https://pypi.org/simple"\n\n'
+        '[[source]]\nname = "private"\n'
+        'url = "https://pypi.example.com/simple"\n\n'
+        '[packages]\nmylib = {version = "==1.0", index = "private"}\n')
+    with pytest.raises(PossumException, match='--installer pipenv'):
+        get_pipfile_requirements(str(pipfile))
@@ -0,0 +1,53 @@
+import sys
+
+from possum import cli
+from possum.packages import collect_package_entries
+from possum.slim import slim_package_entries
+
+
+def write_package(root, *files):
+    for name in files:
+        path = root.joinpath(*name.split('/'))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+
+
+def parse_package_args(monkeypatch, *options):
+    monkeypatch.setattr(sys, 'argv', ['possum', 'package', 'bucket', *options])
+    return cli.arguments()
+
+
+def test_default_run_does_not_slim(monkeypatch):
+    args = parse_package_args(monkeypatch)
+    assert cli.get_slim_options({}, None, args) is None
+
+
+def test_strip_only(monkeypatch):
+    args = parse_package_args(monkeypatch, '--strip')
+    assert cli.get_slim_options({}, None, args) == dict(
+        default_rules=False, strip_binaries=True)
+
+
+def test_test_package_survives(tmp_path):
+    source_dir = tmp_path / 'src'
+    deps_dir = tmp_path / 'deps'
+    write_package(source_dir, 'app.py', 'test/__init__.py')
+    write_package(
+        deps_dir,
+        'test/__init__.py',
+        'django/test/__init__.py',
+        'mylib/tests/test_mylib.py',
+        'mylib/__init__.pyi'
+    )
+
+    entries, report = slim_package_entries(
+        collect_package_entries([str(source_dir), str(deps_dir)]),
+        str(source_dir),
+        str(tmp_path / 'work'),
+        strip_binaries=False
+    )
+
+    assert [i[0] for i in entries] == [
+        'app.py', 'django/test/__init__.py', 'test/__init__.py'
+    ]
+    assert report.removed_files == 2